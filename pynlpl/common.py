@@ -21,6 +21,8 @@ from __future__ import division
 from __future__ import absolute_import
 
 import datetime
+import multiprocessing
+from collections import deque
 from sys import stderr, version
 
 ## From http://code.activestate.com/recipes/413486/ (r7)
@@ -134,3 +136,86 @@ def log(msg, **kwargs):
     for stream in streams:
         stream.write(s)
     return s
+
+
+def parallelmap(function, items, workers=None, initializer=None, initargs=(), ordered=True, chunksize=1, maxtasksperchild=None, maxpending=None, errormessage=None, ignoreerrors=False):
+    """Calls a function on each of the items in a pool of worker processes and yields the results. This is the processing loop shared by all parallel processing in PyNLPl.
+
+    Arguments:
+        function (function): The function to call on each item, it must be defined at module level (so it can be pickled)
+        items: An iterable of (picklable) items
+        workers (int): The number of worker processes. If ``None`` or ``0``, the items are processed sequentially in the current process
+        initializer (function): A function to call (with ``initargs``) in each worker process when it starts, to set up the state of the workers (in a module-level dictionary)
+        initargs (tuple): The arguments for the initializer
+        ordered (bool): Yield the results in the order of the items (default). If set to ``False``, yield in order of completion instead.
+        chunksize (int): The number of items to send to a worker at once
+        maxtasksperchild (int): The number of tasks after which a worker is replaced by a fresh one (default: ``None``, never)
+        maxpending (int): Send at most this many items ahead of the results consumed, rather than all items at once, so a long (streamed) input is not read into memory at once. Results are then always yielded in order.
+        errormessage (str): If set, an error on an item is reported on stderr with this message followed by the item, after which it is raised, or ignored if ``ignoreerrors`` is set. If not set, errors are just raised.
+        ignoreerrors (bool): Continue with the next item after reporting an error (requires ``errormessage``)
+    """
+    if not workers:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            result, error, _ = parallelworkercall(function, item)
+            if error is None:
+                yield result
+            elif handleparallelerror(error, item, errormessage, ignoreerrors):
+                raise error
+        return
+
+    pool = multiprocessing.Pool(workers, initparallelworker, (function, initializer, initargs), maxtasksperchild)
+    try:
+        if maxpending:
+            results = parallelpending(pool, items, maxpending)
+        elif ordered:
+            results = pool.imap(parallelworker, items, chunksize)
+        else:
+            results = pool.imap_unordered(parallelworker, items, chunksize)
+        for result, error, item in results:
+            if error is None:
+                yield result
+            elif handleparallelerror(error, item, errormessage, ignoreerrors):
+                raise error
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def parallelpending(pool, items, maxpending):
+    """Internal function, submits items to the pool with at most ``maxpending`` outstanding, for :func:`parallelmap`"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(parallelworker, (item,)))
+        if len(pending) >= maxpending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def handleparallelerror(error, item, errormessage, ignoreerrors):
+    """Internal function, reports an error on an item for :func:`parallelmap`, returns whether it has to be raised"""
+    if errormessage is None:
+        return True
+    print(errormessage + " " + (item if isstring(item) else str(item)) + ": " + error.__class__.__name__  + " - " + str(error),file=stderr)
+    return not ignoreerrors
+
+
+PARALLELWORKER = {} #state of a worker process of parallelmap(), set up by initparallelworker()
+
+def initparallelworker(function, initializer, initargs):
+    """Internal function, initialises a worker process for :func:`parallelmap`"""
+    PARALLELWORKER['function'] = function
+    if initializer is not None:
+        initializer(*initargs)
+
+def parallelworker(item):
+    """Internal function, processes a single item in a worker process for :func:`parallelmap`"""
+    return parallelworkercall(PARALLELWORKER['function'], item)
+
+def parallelworkercall(function, item):
+    """Internal function, calls the function on an item. Returns a ``(result, error, item)`` tuple, the item is only sent back on error."""
+    try:
+        return function(item), None, None
+    except Exception as e: #pylint: disable=broad-except
+        return None, e, item
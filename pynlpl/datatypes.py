@@ -24,15 +24,21 @@ from pynlpl.common import u
 
 import random
 import bisect
+import heapq
 import array
+import math
+from collections import OrderedDict
 from sys import version as PYTHONVERSION
 
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
 
 class Queue(object): #from AI: A Modern Appproach : http://aima.cs.berkeley.edu/python/utils.html
     """Queue is an abstract class/interface. There are three types:
         Python List: A Last In First Out Queue (no Queue object necessary).
         FIFOQueue(): A First In First Out Queue.
         PriorityQueue(lt): Queue where items are sorted by lt, (default <).
+        HeapPriorityQueue(lt): The same, implemented on heaps.
     Each type supports the following methods and functions:
         q.append(item)  -- add an item to the queue
         q.extend(items) -- equivalent to: for item in items: q.append(item)
@@ -228,6 +234,397 @@ class PriorityQueue(Queue): #Heavily adapted/extended, originally from AI: A Mod
         assert (isinstance(other, PriorityQueue) and self.minimize == other.minimize)
         return PriorityQueue(self.data + other.data, self.f, self.minimize, self.length, self.blockworse, self.blockequal)
 
+class ReversedOrder(object):
+    """Wraps a value so that it sorts in reverse order, for scores that can not be negated"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class HeapPriorityQueue(Queue):
+    """A priority queue with the same interface and behaviour as :class:`PriorityQueue`, implemented on heaps rather than on a sorted list, so that appending an item, popping the best one and evicting the worst one (when the queue has a fixed length) take O(log n) time rather than O(n). Duplicates are detected by hashing (items that can not be hashed are compared one by one, as in PriorityQueue).
+
+    Items with equal scores are ordered as in PriorityQueue for items that can not be ordered otherwise (such as search states): in a maximizing queue the last one added comes first, in a minimizing queue the first one added. (PriorityQueue orders items with equal scores that can be compared, such as numbers, by the items themselves.)
+
+    Iterating, indexing and the pruning methods sort the queue (O(n log n)), the sorted queue is kept until the next change."""
+
+    def __init__(self, data =[], f = lambda x: x.score, minimize=False, length=0, blockworse=False, blockequal=False,duplicates=True):
+        self.f = f
+        self.minimize=minimize
+        self.length = length
+        self.blockworse=blockworse
+        self.blockequal=blockequal
+        self.duplicates= duplicates
+        self.bestscore = None
+        self.clear()
+        for item in data:
+            self.append(item)
+
+    def clear(self):
+        """Removes all items"""
+        self.entries = {} #sequence number => (score, item), of the items in the queue
+        self.keys = {} #(score, item) => sequence number, to detect duplicates
+        #heaps of (key, sequence key, sequence number, score, item), with the best and the worst item on top; the keys are the score and sequence number, or their negations, in the order of the sorted list of PriorityQueue, so items are never compared
+        #each heap is only built once it is needed (the best one for pop(), the worst one for fixed-length queues), removed entries are left in them and skipped when they come on top
+        self.best = None
+        self.worst = None
+        self.seq = 0
+        self._sorted = None
+
+    def append(self, item):
+        """Adds an item to the priority queue (in the right place), returns True if successfull, False if the item was blocked (because of a bad score)"""
+        f = self.f(item)
+        if callable(f):
+            score = f()
+        else:
+            score = f
+
+        if not self.duplicates:
+            try:
+                if (score, item) in self.keys:
+                    return False
+            except Exception: #unhashable
+                for s, i in self.entries.values():
+                    if s == score and item == i:
+                        return False
+
+        if self.length and len(self.entries) >= self.length:
+            #Fixed-length priority queue, abort when queue is full and new item scores worst than worst scoring item.
+            worst = self.worst
+            worstscore = worst[0][3] if worst and worst[0][2] in self.entries else self.top(False)[3]
+            if self.minimize:
+                if score >= worstscore:
+                    return False
+            else:
+                if score <= worstscore:
+                    return False
+
+        if self.blockworse and self.bestscore != None:
+            if self.minimize:
+                if score > self.bestscore:
+                    return False
+            else:
+                if score < self.bestscore:
+                    return False
+        if self.blockequal and self.bestscore != None:
+            if self.bestscore == score:
+                return False
+        if (self.bestscore == None) or (self.minimize and score < self.bestscore) or (not self.minimize and score > self.bestscore):
+            self.bestscore = score
+        self.insert(score, item)
+
+        if self.length:
+            #fixed length queue: queue is now too long, delete worst items
+            while len(self.entries) > self.length:
+                self.top(False)
+                self.remove(heapq.heappop(self.worst)[2])
+        return True
+
+    def insert(self, score, item):
+        self.seq += 1
+        seq = self.seq
+        self.entries[seq] = (score, item)
+        if not self.duplicates:
+            try:
+                self.keys[(score, item)] = seq
+            except Exception:
+                pass
+        if self.best is not None:
+            heapq.heappush(self.best, self.heapentry(seq, score, item, True))
+        if self.worst is not None:
+            heapq.heappush(self.worst, self.heapentry(seq, score, item, False))
+        self._sorted = None
+
+    def heapentry(self, seq, score, item, best):
+        if best == self.minimize:
+            return (score, seq, seq, score, item)
+        else:
+            try:
+                return (-score, -seq, seq, score, item)
+            except TypeError:
+                return (ReversedOrder(score), -seq, seq, score, item)
+
+    def top(self, best):
+        """Returns the top entry of the best or the worst heap (building it if needed), after discarding entries that have been removed"""
+        heap = self.best if best else self.worst
+        if heap is None:
+            heap = [ self.heapentry(seq, score, item, best) for seq, (score, item) in self.entries.items() ]
+            heapq.heapify(heap)
+            if best:
+                self.best = heap
+            else:
+                self.worst = heap
+        entries = self.entries
+        while heap[0][2] not in entries:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def remove(self, seq):
+        """Removes the entry with the sequence number from the queue, it is left in the heaps (unless there are too many such entries)"""
+        score, item = self.entries.pop(seq)
+        if not self.duplicates:
+            try:
+                self.keys.pop((score, item), None)
+            except Exception:
+                pass
+        self._sorted = None
+        if len(self.best or ()) + len(self.worst or ()) > 4 * len(self.entries) + 64:
+            self.best = self.worst = None #rebuilt when needed
+        return item
+
+    def sorted(self):
+        """Returns a list of all (score, item) tuples, from best to worst"""
+        if self._sorted is None:
+            self._sorted = [ (entry[0], entry[1]) for seq, entry in sorted(self.entries.items(), key=lambda x: (x[1][0], x[0]), reverse=not self.minimize) ]
+        return self._sorted
+
+    def reset(self, data):
+        """Replaces the contents of the queue with the (score, item) tuples, from best to worst"""
+        self.clear()
+        for score, item in (data if self.minimize else reversed(data)): #so that items with equal scores keep their order
+            self.insert(score, item)
+
+    @property
+    def data(self):
+        """All (score, item) tuples, sorted as in PriorityQueue: from worst to best in a maximizing queue, from best to worst in a minimizing one"""
+        if self.minimize:
+            return list(self.sorted())
+        else:
+            return list(reversed(self.sorted()))
+
+    def __exists__(self, item):
+        return any( item == i for s, i in self.entries.values() )
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        """Iterate over all items, in order from best to worst!"""
+        for score, item in self.sorted():
+            yield item
+
+    def __getitem__(self, i):
+        """Item 0 is always the best item!"""
+        if isinstance(i, slice):
+            return HeapPriorityQueue([ item for score, item in self.sorted()[i] ], self.f, self.minimize, self.length, self.blockworse, self.blockequal, self.duplicates)
+        else:
+            return self.sorted()[i][1]
+
+    def pop(self):
+        """Retrieve the next element in line, this will remove it from the queue"""
+        if not self.entries:
+            raise IndexError("pop from empty queue")
+        self.top(True)
+        return self.remove(heapq.heappop(self.best)[2])
+
+    def score(self, i):
+        """Return the score for item x (cheap lookup), Item 0 is always the best item"""
+        return self.sorted()[i][0]
+
+    def prune(self, n):
+        """prune all but the first (=best) n items"""
+        if n < len(self.entries):
+            self.reset(self.sorted()[:n])
+
+    def randomprune(self,n):
+        """prune down to n items at random, disregarding their score"""
+        keep = set(random.sample(range(0, len(self.entries)), n))
+        self.reset([ x for i, x in enumerate(self.sorted()) if i in keep ])
+
+    def stochasticprune(self,n):
+        """prune down to n items at random, the chance of an item being kept is proportional to its score (or, if minimize is True, to the reciprocal of its score). Scores may not be negative: items scoring zero are kept first when minimizing and last when maximizing."""
+        if n >= len(self.entries):
+            return
+        entries = self.sorted()
+        keys = []
+        for score, _ in entries:
+            if score < 0:
+                raise ValueError("Stochastic pruning requires scores that are not negative, got " + str(score))
+            #weighted sampling without replacement (Efraimidis & Spirakis): keep the n items with the largest random**(1/weight), compared as logarithms
+            r = math.log(1.0 - random.random())
+            if self.minimize:
+                keys.append(r * score)
+            else:
+                keys.append(r / score if score > 0 else -float('inf'))
+        keep = set(heapq.nlargest(n, range(0, len(entries)), keys.__getitem__))
+        self.reset([ x for i, x in enumerate(entries) if i in keep ])
+
+    def prunebyscore(self, score, retainequalscore=False):
+        """Deletes all items below/above a certain score from the queue, depending on whether minimize is True or False. Note: It is recommended (more efficient) to use blockworse=True / blockequal=True instead! Preventing the addition of 'worse' items."""
+        if retainequalscore:
+            if self.minimize:
+                f = lambda x: x[0] <= score
+            else:
+                f = lambda x: x[0] >= score
+        else:
+            if self.minimize:
+                f = lambda x: x[0] < score
+            else:
+                f = lambda x: x[0] > score
+        self.reset([ x for x in self.sorted() if f(x) ])
+
+    def __eq__(self, other):
+        return (self.data == other.data) and (self.minimize == other.minimize)
+
+    def __repr__(self):
+        return repr(self.data)
+
+    def __add__(self, other):
+        """Priority queues can be added up, as long as they all have minimize or maximize (rather than mixed). In case of fixed-length queues, the FIRST queue in the operation will be authorative for the fixed lengthness of the result!"""
+        assert (isinstance(other, (PriorityQueue, HeapPriorityQueue)) and self.minimize == other.minimize)
+        return HeapPriorityQueue([ item for score, item in self.data + other.data ], self.f, self.minimize, self.length, self.blockworse, self.blockequal, self.duplicates)
+
+def mixhash(key):
+    """Scrambles a hash value (an integer) into an unsigned 64-bit integer, so that hash values that differ little (those of small integers, for instance) end up far apart"""
+    x = (key * 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+class HashSet(object):
+    """A compact set of hash values (integers as returned by hash(), i.e. 64-bit), in an open addressing hash table in a single array of 64-bit integers. It takes 12 to 24 bytes per value, rather than the hundred or so of a Python set or dict of such integers. Only the hash values are stored, so objects with the same hash are considered equal."""
+
+    def __init__(self, capacity=1024):
+        self.bits = max(3, int(math.ceil(math.log(capacity * 1.5, 2))))
+        self.table = array.array('q', [0]) * (1 << self.bits)
+        self.count = 0
+        self.zero = False #0 marks empty slots, so is kept apart
+
+    def slot(self, key):
+        """Returns the index of the slot that holds key, or of the empty slot where it would go"""
+        table = self.table
+        mask = (1 << self.bits) - 1
+        i = ((key * 0x9E3779B97F4A7C15) & MASK64) >> (64 - self.bits) #Fibonacci hashing
+        while table[i] != 0 and table[i] != key:
+            i = (i + 1) & mask
+        return i
+
+    def __contains__(self, key):
+        if key == 0:
+            return self.zero
+        return self.table[self.slot(key)] == key
+
+    def add(self, key):
+        if key == 0:
+            if not self.zero:
+                self.zero = True
+                self.count += 1
+            return
+        i = self.slot(key)
+        if self.table[i] == 0:
+            self.table[i] = key
+            self.count += 1
+            if self.count * 3 >= 2 << self.bits: #load factor of 2/3, grow
+                self.grow()
+
+    def grow(self):
+        table = self.table
+        self.bits += 1
+        self.table = array.array('q', [0]) * (1 << self.bits)
+        for key in table:
+            if key != 0:
+                self.table[self.slot(key)] = key
+
+    def clear(self):
+        self.__init__()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        if self.zero:
+            yield 0
+        for key in self.table:
+            if key != 0:
+                yield key
+
+
+class BloomFilter(object):
+    """A Bloom filter: a probabilistic set of hash values (integers as returned by hash()), in a bit array of a size that is fixed in advance. Testing whether a value is in the set may give a false positive, with a probability of about ``errorrate`` as long as no more than ``capacity`` values are added (and growing quickly beyond), but never a false negative."""
+
+    def __init__(self, capacity=1000000, errorrate=0.001):
+        self.capacity = capacity
+        self.errorrate = errorrate
+        self.size = max(64, int(math.ceil(-capacity * math.log(errorrate) / (math.log(2) ** 2)))) #number of bits
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        """Returns the positions of the bits of key, derived from two hash values (Kirsch and Mitzenmacher): the lower and upper half of the scrambled key"""
+        h = mixhash(key)
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        size = self.size
+        return [ (h1 + i * h2) % size for i in range(0, self.hashes) ]
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self.positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        """Adds the key, returns False if it was (probably) in the set already"""
+        bits = self.bits
+        new = False
+        for position in self.positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                bits[position >> 3] |= 1 << (position & 7)
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
+
+    def __len__(self):
+        """Returns the number of values added (values that were already in the set, or were false positives, are not counted)"""
+        return self.count
+
+
+class LRUSet(object):
+    """A set of bounded size: when it is full, adding a value evicts the least recently used one (added or found)"""
+
+    def __init__(self, size=1000000):
+        self.size = size
+        self.data = OrderedDict()
+
+    def __contains__(self, key):
+        if key in self.data:
+            del self.data[key]
+            self.data[key] = True #most recently used
+            return True
+        return False
+
+    def add(self, key):
+        if key in self.data:
+            del self.data[key]
+        elif len(self.data) >= self.size:
+            self.data.popitem(last=False)
+        self.data[key] = True
+
+    def clear(self):
+        self.data = OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+
 class Tree(object):
     """Simple tree structure. Nodes are themselves trees."""
 
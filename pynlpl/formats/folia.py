@@ -41,6 +41,13 @@ import multiprocessing
 import bz2
 import gzip
 import random
+import hashlib
+import pickle
+import gc
+try:
+    import copyreg
+except ImportError:
+    import copy_reg as copyreg #pylint: disable=import-error
 
 
 
@@ -62,7 +69,7 @@ else:
     stderr = sys.stderr
     stdout = sys.stdout
 
-from pynlpl.common import u, isstring
+from pynlpl.common import u, isstring, parallelmap
 from pynlpl.formats.foliaset import SetDefinition, DeepValidationError
 import pynlpl.algorithms
 
@@ -113,6 +120,7 @@ for ordinal in range(0x20):
 class Mode:
     MEMORY = 0 #The entire FoLiA structure will be loaded into memory. This is the default and is required for any kind of document manipulation.
     XPATH = 1 #The full XML structure will be loaded into memory, but conversion to FoLiA objects occurs only upon querying. The full power of XPath is available.
+    LAZY = 2 #The full XML structure will be loaded into memory, but the contents of texts, divisions and paragraphs are only converted to FoLiA objects when first accessed.
 
 class AnnotatorType:
     UNSET = None
@@ -620,6 +628,46 @@ def commonancestors(Class, *args):
         for commonancestor in commonancestors:
             yield commonancestor
 
+def isignored(element, ignore):
+    """Internal function. Tests whether :meth:`AbstractElement.select` would skip the element (and everything below it) given the specified ignore list (or ``True``)"""
+    if ignore is True:
+        ignore = (True,)
+    elif not ignore:
+        return False
+    for c in ignore:
+        if c is True:
+            try:
+                if not element.auth:
+                    return True
+            except AttributeError:
+                #not all elements have auth attribute..
+                pass
+        elif isinstance(element, c):
+            return True
+    return False
+
+def subtreeclasses(element):
+    """Internal function. Returns the set of classes of the element and all elements below it, for :meth:`Document.updateselectindex`"""
+    classes = set()
+    stack = [element]
+    while stack:
+        e = stack.pop()
+        classes.add(e.__class__)
+        stack.extend( c for c in e.data if isinstance(c, AbstractElement) )
+    return classes
+
+def selectindexkey(Class, set, ignore):
+    """Internal function. Returns the key for :attr:`Document.selectindex`"""
+    if isinstance(ignore, list):
+        ignore = tuple(ignore)
+    return (Class, set, ignore)
+
+#Attributes that default to None when not set on an element (see AbstractElement.__getattr__)
+DEFAULTNONEATTRIBS = frozenset(('set','cls','confidence','annotator','annotatortype','datetime','n','href','src','speaker','begintime','endtime','xlinktype','xlinktitle','xlinklabel','xlinkrole','xlinkshow','label', 'textclass', 'metadata', '_lazynode', '_textcache'))
+
+#Interned keys for the text cache of elements (see AbstractElement.text())
+TEXTCACHEKEYS = {}
+
 class AbstractElement(object):
     """Abstract base class from which all FoLiA elements are derived.
 
@@ -658,6 +706,11 @@ class AbstractElement(object):
         :meth:`AbstractElement.__init__`
     """
 
+    #Instances hold their generic attributes in slots rather than in a per-instance dictionary, this saves a considerable amount of memory
+    #for documents with many (token-level) elements. Subclasses that do not declare __slots__ themselves simply get a dictionary again.
+    #Unset slots fall back to the defaults in __getattr__(). (changedbyquery is bookkeeping for FQL)
+    __slots__ = ('doc','parent','data','id','set','cls','annotator','annotatortype','confidence','n','datetime','auth','src','speaker','begintime','endtime','textclass','metadata', '_lazynode', '_textcache', 'changedbyquery')
+
     def __init__(self, doc, *args, **kwargs):
         """Constructor for most FoLiA elements.
 
@@ -680,6 +733,7 @@ class AbstractElement(object):
         self.doc = doc
         self.parent = None
         self.data = []
+        self._lazynode = None #XML node of which the children are yet to be parsed (only used in Mode.LAZY)
 
 
         kwargs = parsecommonarguments(self, doc, self.ANNOTATIONTYPE, self.REQUIRED_ATTRIBS, self.OPTIONAL_ATTRIBS,**kwargs)
@@ -703,11 +757,64 @@ class AbstractElement(object):
     def __getattr__(self, attr):
         """Internal method"""
         #overriding getattr so we can get defaults here rather than needing a copy on each element, saves memory
-        if attr in ('set','cls','confidence','annotator','annotatortype','datetime','n','href','src','speaker','begintime','endtime','xlinktype','xlinktitle','xlinklabel','xlinkrole','xlinkshow','label', 'textclass', 'metadata'):
+        if attr in DEFAULTNONEATTRIBS:
             return None
+        elif attr == 'data' and self._lazynode is not None:
+            #element was loaded in Mode.LAZY and its children have not been parsed yet, do so now
+            return self.materialise()
         else:
             return super(AbstractElement, self).__getattribute__(attr)
 
+    def __setstate__(self, state):
+        """Internal method, restores the state of an element when unpickling or copying (see :meth:`Document.savebinary`). Behaves like Python's default, but defining it prevents an expensive fallback to ``__getattr__`` for every element."""
+        if isinstance(state, tuple):
+            state, slotstate = state
+        else:
+            slotstate = None
+        if state:
+            self.__dict__.update(state)
+        if slotstate:
+            for key, value in slotstate.items():
+                setattr(self, key, value)
+
+    def materialise(self):
+        """Parse the children of an element that was loaded in :class:`Mode.LAZY` but not accessed yet.
+
+        There is usually no need to call this directly, it is invoked implicitly as soon as the children of the element are needed.
+
+        Returns:
+            list: the children of the element
+        """
+        if not self.unmaterialised():
+            return self.data
+        if self.doc and self.doc.debug >= 1: print("[PyNLPl FoLiA DEBUG] Materialising " + repr(self),file=stderr)
+        self.data = []
+        for child in self.__class__.parsexmlchildren(self._lazynode, self.doc):
+            self.append(child)
+        return self.data
+
+    def unmaterialised(self):
+        """Internal method. Returns True if this element was loaded in :class:`Mode.LAZY` and its children have not been parsed yet"""
+        if self._lazynode is None:
+            return False
+        try:
+            object.__getattribute__(self, 'data')
+            return False
+        except AttributeError:
+            return True
+
+    def lazycontains(self, Class):
+        """Internal method. Checks on the underlying XML tree whether an element that is not materialised yet (:class:`Mode.LAZY`) may hold an element of the specified class somewhere below it"""
+        try:
+            tags = LAZYTAGS[Class]
+        except KeyError:
+            tags = LAZYTAGS[Class] = tuple(set( '{' + NSFOLIA + '}' + xmltag for xmltag, C in XML2CLASS.items() if issubclass(C, Class) ))
+        if not tags:
+            return False
+        for _ in self._lazynode.iterdescendants(*tags):
+            return True
+        return False
+
 
     #def __del__(self):
     #    if self.doc and self.doc.debug:
@@ -895,6 +1002,8 @@ class AbstractElement(object):
 
             word.text()
 
+        The text of structure elements is cached (per class, tokenisation and correction handling), so repeated calls are cheap. The cache is invalidated automatically when the element or any of its descendants is modified through :meth:`append`, :meth:`insert`, :meth:`remove`, :meth:`replace` or :meth:`settext`. If you modify elements in any other way (such as manipulating ``data`` directly or changing the ``space`` attribute of words), call :meth:`cleartextcache` on the modified element.
+
         Returns:
             The text of the element (``unicode`` instance in Python 2, ``str`` in Python 3)
 
@@ -920,23 +1029,40 @@ class AbstractElement(object):
         elif not self.PRINTABLE: #only printable elements can hold text
             raise NoSuchText
         else:
-            #Get text from children first
-            delimiter = ""
-            s = ""
-            for e in self:
-                #was: e.PRINTABLE and not isinstance(e, TextContent) and not isinstance(e, String):
-                if isinstance(e, (AbstractStructureElement, Correction, AbstractSpanAnnotation)):   #AbstractSpanAnnotation is needed when requesting text() on nested span annotations
-                    try:
-                        s += e.text(cls,retaintokenisation, delimiter,False,correctionhandling)
+            key = (cls, retaintokenisation, correctionhandling)
+            key = TEXTCACHEKEYS.setdefault(key, key)
+            #the cache holds a single (key, text) tuple in the common case of a single key (saves memory), and a dictionary once more keys are used
+            cache = self._textcache
+            if cache is not None and cache.__class__ is tuple and cache[0] is key:
+                s = cache[1]
+            elif cache is not None and cache.__class__ is dict and key in cache:
+                s = cache[key]
+            else:
+                #Get text from children first
+                delimiter = ""
+                s = ""
+                for e in self:
+                    #was: e.PRINTABLE and not isinstance(e, TextContent) and not isinstance(e, String):
+                    if isinstance(e, (AbstractStructureElement, Correction, AbstractSpanAnnotation)):   #AbstractSpanAnnotation is needed when requesting text() on nested span annotations
+                        try:
+                            s += e.text(cls,retaintokenisation, delimiter,False,correctionhandling)
 
-                        #delimiter will be buffered and only printed upon next iteration, this prevents the delimiter being outputted at the end of a sequence and to be compounded with other delimiters
-                        delimiter = e.gettextdelimiter(retaintokenisation)
-                    except NoSuchText:
-                        #No text, that's okay, just continue
-                        continue
+                            #delimiter will be buffered and only printed upon next iteration, this prevents the delimiter being outputted at the end of a sequence and to be compounded with other delimiters
+                            delimiter = e.gettextdelimiter(retaintokenisation)
+                        except NoSuchText:
+                            #No text, that's okay, just continue
+                            continue
 
-            if not s and self.hastext(cls, correctionhandling):
-                s = self.textcontent(cls, correctionhandling).text()
+                if not s and self.hastext(cls, correctionhandling):
+                    s = self.textcontent(cls, correctionhandling).text()
+
+                if not isinstance(self, AbstractSpanAnnotation): #spans refer to words elsewhere in the document, changes to those can not be tracked
+                    if cache is None:
+                        self._textcache = (key, s)
+                    elif cache.__class__ is tuple:
+                        self._textcache = {cache[0]: cache[1], key: s}
+                    else:
+                        cache[key] = s
 
             if s and previousdelimiter:
                 s = previousdelimiter + s
@@ -949,6 +1075,15 @@ class AbstractElement(object):
                 #No text found at all :`(
                 raise NoSuchText
 
+    def cleartextcache(self):
+        """Clears the cached text (see :meth:`text`) of this element and all of its ancestors.
+
+        This is done automatically when elements are modified through :meth:`append`, :meth:`insert`, :meth:`remove`, :meth:`replace` or :meth:`settext`, you only need to call this after modifying elements in any other way."""
+        e = self
+        while e is not None:
+            e._textcache = None
+            e = e.parent
+
     def phoncontent(self, cls='current', correctionhandling=CorrectionHandling.CURRENT):
         """Get the phonetic content explicitly associated with this element (of the specified class).
 
@@ -1242,6 +1377,8 @@ class AbstractElement(object):
             a copy of the element
         """
         if idsuffix is True: idsuffix = ".copy." + "%08x" % random.getrandbits(32) #random 32-bit hash for each copy, same one will be reused for all children
+        if self.doc and self.doc.mode == Mode.LAZY:
+            self.items() #materialise everything first, unparsed XML nodes can not be copied
         c = deepcopy(self)
         if idsuffix:
             c.addidsuffix(idsuffix)
@@ -1547,6 +1684,8 @@ class AbstractElement(object):
         #obtain the set (if available, necessary for checking addability)
         if 'set' in kwargs:
             set = kwargs['set']
+        elif inspect.isclass(child):
+            set = None #(generic attributes on an element class are slot descriptors, not values)
         else:
             try:
                 set = child.set
@@ -1593,7 +1732,10 @@ class AbstractElement(object):
         else:
             raise ValueError("Unable to append object of type " + child.__class__.__name__ + " to " + self.__class__.__name__ + ". Type not allowed as child.")
 
-        if dopostappend: child.postappend()
+        if dopostappend:
+            child.postappend()
+            if self.doc: self.doc.updateselectindex(child, self)
+        self.cleartextcache()
         return child
 
     def insert(self, index, child, *args, **kwargs):
@@ -1638,6 +1780,8 @@ class AbstractElement(object):
         #obtain the set (if available, necessary for checking addability)
         if 'set' in kwargs:
             set = kwargs['set']
+        elif inspect.isclass(child):
+            set = None #(generic attributes on an element class are slot descriptors, not values)
         else:
             try:
                 set = child.set
@@ -1670,6 +1814,8 @@ class AbstractElement(object):
             raise ValueError("Unable to append object of type " + child.__class__.__name__ + " to " + self.__class__.__name__ + ". Type not allowed as child.")
 
         child.postappend()
+        if self.doc: self.doc.updateselectindex(child, self)
+        self.cleartextcache()
         return child
 
     def add(self, child, *args, **kwargs):
@@ -1780,6 +1926,7 @@ class AbstractElement(object):
                 elif isstring(child):
                     s += child
             self.data = [s]
+            self.cleartextcache()
 
     def replace(self, child, *args, **kwargs):
         """Appends a child element like ``append()``, but replaces any existing child element of the same type and set. If no such child element exists, this will act the same as append()
@@ -1794,6 +1941,8 @@ class AbstractElement(object):
         if 'set' in kwargs:
             set = kwargs['set']
             del kwargs['set']
+        elif inspect.isclass(child):
+            set = None #(generic attributes on an element class are slot descriptors, not values)
         else:
             try:
                 set = child.set
@@ -1805,6 +1954,9 @@ class AbstractElement(object):
             replace = Class.findreplaceables(self, set, **kwargs)
         elif (self.TEXTCONTAINER or self.PHONCONTAINER) and isstring(child):
             #replace will replace ALL text content, removing text markup along the way!
+            if self.doc:
+                for e in self.data:
+                    self.doc.updateselectindex(e, self, True)
             self.data = []
             return self.append(child, *args,**kwargs)
         else:
@@ -1826,6 +1978,7 @@ class AbstractElement(object):
             if 'alternative' in kwargs and kwargs['alternative']:
                 #old version becomes alternative
                 if replace[0] in self.data:
+                    if self.doc: self.doc.updateselectindex(replace[0], self, True)
                     self.data.remove(replace[0])
                 alt = self.append(Alternative)
                 alt.append(replace[0])
@@ -2191,6 +2344,9 @@ class AbstractElement(object):
                             continue
                     yield e
                 if recursive:
+                    if e._lazynode is not None and e.unmaterialised() and not e.lazycontains(Class):
+                        #not materialised yet (Mode.LAZY) and nothing to find there, don't bother parsing it
+                        continue
                     for e2 in e.select(Class, set, recursive, ignore, e):
                         if not set is None:
                             try:
@@ -2579,36 +2735,20 @@ class AbstractElement(object):
             return E.define( E.element(*(preamble + attribs), **{'name': cls.XMLTAG}), name=cls.XMLTAG, ns=NSFOLIA)
 
     @classmethod
-    def parsexml(Class, node, doc, **kwargs): #pylint: disable=bad-classmethod-argument
-        """Internal class method used for turning an XML element into an instance of the Class.
+    def parsexmlchildren(Class, node, doc): #pylint: disable=bad-classmethod-argument
+        """Internal class method used for turning the children of an XML element into FoLiA elements (or strings, for text containers).
 
         Args:
             * ``node`` - XML Element
             * ``doc`` - Document
 
         Returns:
-            An instance of the current Class.
+            A list of children, ready to be passed to the constructor of the Class.
         """
-
-        assert issubclass(Class, AbstractElement)
-
-        if doc.preparsexmlcallback:
-            result = doc.preparsexmlcallback(node)
-            if not result:
-                return None
-            if isinstance(result, AbstractElement):
-                return result
-
-
-
-        dcoi = node.tag.startswith('{' + NSDCOI + '}')
         args = []
-        if not kwargs: kwargs = {}
-        text = None #for dcoi support
         if (Class.TEXTCONTAINER or Class.PHONCONTAINER) and node.text:
             args.append(node.text)
 
-
         for subnode in node: #pylint: disable=too-many-nested-blocks
             #don't trip over comments
             if isinstance(subnode, ElementTree._Comment): #pylint: disable=protected-access
@@ -2643,6 +2783,41 @@ class AbstractElement(object):
                             args.append(e)
                 elif doc.debug >= 1:
                     print("[PyNLPl FoLiA DEBUG] Ignoring subnode outside of FoLiA namespace: " + subnode.tag,file=stderr)
+        return args
+
+    @classmethod
+    def parsexml(Class, node, doc, **kwargs): #pylint: disable=bad-classmethod-argument
+        """Internal class method used for turning an XML element into an instance of the Class.
+
+        Args:
+            * ``node`` - XML Element
+            * ``doc`` - Document
+
+        Returns:
+            An instance of the current Class.
+        """
+
+        assert issubclass(Class, AbstractElement)
+
+        if doc.preparsexmlcallback:
+            result = doc.preparsexmlcallback(node)
+            if not result:
+                return None
+            if isinstance(result, AbstractElement):
+                return result
+
+
+
+        dcoi = node.tag.startswith('{' + NSDCOI + '}')
+        if not kwargs: kwargs = {}
+        text = None #for dcoi support
+
+        #in lazy mode, the children of some elements are only parsed when they are first needed (see materialise())
+        lazy = doc.mode == Mode.LAZY and not dcoi and Class in LAZYELEMENTS
+        if lazy:
+            args = []
+        else:
+            args = Class.parsexmlchildren(node, doc)
 
 
 
@@ -2697,6 +2872,10 @@ class AbstractElement(object):
 
         if doc.debug >= 1: print("[PyNLPl FoLiA DEBUG] Found " + node.tag[nslen:],file=stderr)
         instance = Class(doc, *args, **kwargs)
+        if lazy:
+            #children will be parsed upon first access of instance.data
+            del instance.data
+            instance._lazynode = node #pylint: disable=protected-access
         #if id:
         #    if doc.debug >= 1: print >>stderr, "[PyNLPl FoLiA DEBUG] Adding to index: " + id
         #    doc.index[id] = instance
@@ -2730,9 +2909,11 @@ class AbstractElement(object):
         """Removes the child element"""
         if not isinstance(child, AbstractElement):
             raise ValueError("Expected AbstractElement, got " + str(type(child)))
+        if self.doc: self.doc.updateselectindex(child, self, True)
         if child.parent == self:
             child.parent = None
         self.data.remove(child)
+        self.cleartextcache()
         #delete from index
         if child.id and self.doc and child.id in self.doc.index:
             del self.doc.index[child.id]
@@ -2853,6 +3034,8 @@ class Comment(AbstractElement):
         return super(Comment,Class).parsexml(node, doc, **kwargs)
 
 class AllowCorrections(object):
+    __slots__ = ()
+
     def correct(self, **kwargs):
         """Apply a correction (TODO: documentation to be written still)"""
 
@@ -3011,6 +3194,8 @@ class AllowCorrections(object):
 class AllowTokenAnnotation(AllowCorrections):
     """Elements that allow token annotation (including extended annotation) must inherit from this class"""
 
+    __slots__ = ()
+
 
     def annotations(self,Class,set=None):
         """Obtain child elements (annotations) of the specified class.
@@ -3108,6 +3293,8 @@ class AllowTokenAnnotation(AllowCorrections):
 class AllowGenerateID(object):
     """Classes inherited from this class allow for automatic ID generation, using the convention of adding a period, the name of the element , another period, and a sequence number"""
 
+    __slots__ = () #the maxid slot is provided by the inheriting element classes
+
     def _getmaxid(self, xmltag):
         try:
             if xmltag in self.maxid:
@@ -3187,6 +3374,8 @@ class AllowGenerateID(object):
 class AbstractStructureElement(AbstractElement, AllowTokenAnnotation, AllowGenerateID):
     """Abstract element, all structure elements inherit from this class. Never instantiated directly."""
 
+    __slots__ = ('maxid',)
+
 
 
     def __init__(self, doc, *args, **kwargs):
@@ -3277,6 +3466,8 @@ class AbstractStructureElement(AbstractElement, AllowTokenAnnotation, AllowGener
 class AbstractTokenAnnotation(AbstractElement, AllowGenerateID):
     """Abstract element, all token annotation elements are derived from this class"""
 
+    __slots__ = ('maxid',)
+
 
     def append(self, child, *args, **kwargs):
         """See ``AbstractElement.append()``"""
@@ -3326,6 +3517,7 @@ class AbstractTextMarkup(AbstractElement):
         self.data = [text]
         if not self.data:
             raise ValueError("Empty text content elements are not allowed")
+        self.cleartextcache()
 
     def resolve(self):
         if self.idref:
@@ -3436,6 +3628,8 @@ class TextContent(AbstractElement):
         * ``offset=``: The offset where this text is found, offsets start at 0
     """
 
+    __slots__ = ('offset','ref','href','xlinktype','xlinkrole','xlinklabel','xlinkshow','xlinktitle')
+
 
     def __init__(self, doc, *args, **kwargs):
         """
@@ -3495,6 +3689,7 @@ class TextContent(AbstractElement):
         self.data = [text]
         if not self.data:
             raise ValueError("Empty text content elements are not allowed")
+        self.cleartextcache()
         #if isstring(self.data[0]) and (self.data[0] != self.data[0].translate(ILLEGAL_UNICODE_CONTROL_CHARACTERS)):
         #    raise ValueError("There are illegal unicode control characters present in TextContent: " + repr(self.data[0]))
 
@@ -4016,6 +4211,8 @@ class Whitespace(AbstractStructureElement):
 class Word(AbstractStructureElement, AllowCorrections):
     """Word (aka token) element. Holds a word/token and all its related token annotations."""
 
+    __slots__ = ('space',)
+
     #will actually be determined by gettextdelimiter()
 
     def __init__(self, doc, *args, **kwargs):
@@ -4222,6 +4419,8 @@ class Feature(AbstractElement):
     """Feature elements can be used to associate subsets and subclasses with almost any
     annotation element"""
 
+    __slots__ = ('subset',)
+
 
     def __init__(self,doc, *args, **kwargs): #pylint: disable=super-init-not-called
         """Constructor.
@@ -4302,7 +4501,8 @@ class Feature(AbstractElement):
 
 class ValueFeature(Feature):
     """Value feature, to be used within :class:`Metric`"""
-    pass
+
+    __slots__ = ()
 
 class Metric(AbstractElement):
     """Metric elements provide a key/value pair to allow the annotation of any kind of metric with any kind of annotation element.
@@ -4349,6 +4549,8 @@ class AbstractSpanAnnotation(AbstractElement, AllowGenerateID, AllowCorrections)
                         pass
 
             self.data.insert(insertionpoint, child)
+            if self.doc: self.doc.updateselectindex(child, self)
+            self.cleartextcache()
             return child
         elif isinstance(child, AbstractSpanAnnotation): #(covers span roles just as well)
             insertionpoint = len(self.data)
@@ -4481,10 +4683,9 @@ class AbstractSpanAnnotation(AbstractElement, AllowGenerateID, AllowCorrections)
             if directwrefs is None:
                 directwrefs = self.wrefs(recurse=False)
             for wref in directwrefs:
-                try:
+                if wref in e.data:
+                    if e.doc: e.doc.updateselectindex(wref, e, True)
                     e.data.remove(wref)
-                except ValueError:
-                    pass
             e = e.parent
 
 
@@ -5475,12 +5676,18 @@ class Dependency(AbstractSpanAnnotation):
 class ModalityFeature(Feature):
     """Modality feature, to be used with coreferences"""
 
+    __slots__ = ()
+
 class TimeFeature(Feature):
     """Time feature, to be used with coreferences"""
 
+    __slots__ = ()
+
 class LevelFeature(Feature):
     """Level feature, to be used with coreferences"""
 
+    __slots__ = ()
+
 class CoreferenceLink(AbstractSpanRole):
     """Coreference link. Used in :class:`CoreferenceChain`"""
 
@@ -5522,6 +5729,8 @@ class ComplexAlignment(AbstractElement):
 class FunctionFeature(Feature):
     """Function feature, to be used with :class:`Morpheme`"""
 
+    __slots__ = ()
+
 class Morpheme(AbstractStructureElement):
     """Morpheme element, represents one morpheme in morphological analysis, subtoken annotation element to be used in :class:`MorphologyLayer`"""
 
@@ -5618,12 +5827,18 @@ class ComplexAlignmentLayer(AbstractAnnotationLayer):
 class HeadFeature(Feature):
     """Head feature, to be used within :class:`PosAnnotation`"""
 
+    __slots__ = ()
+
 class PosAnnotation(AbstractTokenAnnotation):
     """Part-of-Speech annotation:  a token annotation element"""
 
+    __slots__ = ()
+
 class LemmaAnnotation(AbstractTokenAnnotation):
     """Lemma annotation:  a token annotation element"""
 
+    __slots__ = ()
+
 class LangAnnotation(AbstractExtendedTokenAnnotation):
     """Language annotation:  an extended token annotation element"""
 
@@ -5640,23 +5855,35 @@ class DomainAnnotation(AbstractExtendedTokenAnnotation):
 class SynsetFeature(Feature):
     """Synset feature, to be used within :class:`Sense`"""
 
+    __slots__ = ()
+
 class ActorFeature(Feature):
     """Actor feature, to be used within :class:`Event`"""
 
+    __slots__ = ()
+
 class PolarityFeature(Feature):
     """Polarity feature, to be used within :class:`Sentiment`"""
 
+    __slots__ = ()
+
 class StrengthFeature(Feature):
     """Strength feature, to be used within :class:`Sentiment`"""
 
+    __slots__ = ()
+
 class BegindatetimeFeature(Feature):
     """Begindatetime feature, to be used within :class:`Event`"""
 
+    __slots__ = ()
+
 class EnddatetimeFeature(Feature):
     """Enddatetime feature, to be used within :class:`Event`"""
 
+    __slots__ = ()
+
 class StyleFeature(Feature):
-    pass
+    __slots__ = ()
 
 class Note(AbstractStructureElement):
     """Element used for notes, such as footnotes or warnings or notice blocks."""
@@ -6002,6 +6229,7 @@ class ForeignData(AbstractElement):
         for subnode in self.node:
             self._checknamespace(subnode)
         self.doc = doc
+        self.parent = None
         self.id = None
         self.auth = True
         self.next = None #chains foreigndata
@@ -6283,6 +6511,123 @@ class NativeMetaData(object):
         self.order.remove(key)
 
 
+BINARYMAGIC = b'FoLiA-binary'
+BINARYVERSION = 1 #increment whenever the binary serialisation format (see Document.savebinary()) changes
+
+#Transient attributes that are not serialised in the binary format
+BINARYSKIPATTRIBS = frozenset(('_lazynode','_textcache','changedbyquery'))
+
+def binaryattributes(Class, cache={}): #pylint: disable=dangerous-default-value
+    """Internal function, returns the names of all slots of a class (and its ancestors) that are to be included in the binary serialisation"""
+    try:
+        return cache[Class]
+    except KeyError:
+        attribs = []
+        for C in reversed(Class.__mro__):
+            for attrib in C.__dict__.get('__slots__', ()):
+                if attrib not in BINARYSKIPATTRIBS and attrib not in attribs:
+                    attribs.append(attrib)
+        cache[Class] = tuple(attribs)
+        return cache[Class]
+
+def sourcesignature(filename):
+    """Internal function, returns a ``(filename, mtime, size, sha1)`` tuple used to validate binary files against the FoLiA XML they were derived from"""
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    return (filename, stat.st_mtime, stat.st_size, filechecksum(filename))
+
+def filechecksum(filename):
+    """Internal function, computes the SHA1 checksum of a file"""
+    h = hashlib.sha1()
+    with io.open(filename,'rb') as f:
+        while True:
+            buffer = f.read(1024*1024)
+            if not buffer:
+                break
+            h.update(buffer)
+    return h.hexdigest()
+
+def sourcevalid(signature, filename=None):
+    """Internal function, checks whether a source file still matches the signature recorded in a binary file. The cheap mtime check is done first, only if that fails is the checksum computed."""
+    if filename is None:
+        filename = signature[0]
+    if not os.path.exists(filename):
+        return False
+    stat = os.stat(filename)
+    if stat.st_size != signature[2]:
+        return False
+    elif stat.st_mtime == signature[1]:
+        return True
+    else:
+        return filechecksum(filename) == signature[3]
+
+def foreigndatafromstring(doc, xml):
+    """Internal function, reconstructs foreign data from its serialised XML (see :class:`BinaryPickler`)"""
+    return ForeignData(doc, node=xmltreefromstring(xml).getroot())
+
+class BinaryPickler(pickle.Pickler):
+    """Internal class, pickles the contents of a document for :meth:`Document.savebinary`.
+
+    Elements are reduced to their class and the values of their attributes, all strings are interned so that each distinct string (IDs, classes, sets, annotators, text) is stored only once and shared again after loading. The document itself is not pickled but stored as a persistent reference."""
+
+    def __init__(self, file, doc):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self.doc = doc
+        self.strings = {}
+        self.dispatch_table = dict( (Class, self.reduceelement) for Class in subclasses(AbstractElement) )
+        self.dispatch_table[ForeignData] = self.reduceforeigndata
+
+    def persistent_id(self, obj): #pylint: disable=method-hidden
+        if obj is self.doc:
+            return 'doc'
+        return None
+
+    def intern(self, value):
+        if isstring(value):
+            return self.strings.setdefault(value, value)
+        return value
+
+    def reduceelement(self, element):
+        Class = element.__class__
+        state = {}
+        for attrib in binaryattributes(Class):
+            try:
+                value = getattr(element, attrib)
+            except AttributeError:
+                continue #unset slot
+            if value is None and attrib in DEFAULTNONEATTRIBS:
+                continue #implied default
+            state[attrib] = self.intern(value)
+        if hasattr(element, '__dict__'):
+            for attrib, value in element.__dict__.items():
+                if attrib not in BINARYSKIPATTRIBS:
+                    state[attrib] = self.intern(value)
+        state['data'] = [ self.intern(child) for child in element.data ] #(materialises if needed)
+        return (copyreg.__newobj__, (Class,), (None, state))
+
+    def reduceforeigndata(self, element):
+        return (foreigndatafromstring, (self.doc, ElementTree.tostring(element.node)), (None, {'parent': element.parent, 'next': element.next}))
+
+class BinaryUnpickler(pickle.Unpickler):
+    """Internal class, unpickles the contents of a document written by :class:`BinaryPickler`"""
+
+    def __init__(self, file, doc):
+        pickle.Unpickler.__init__(self, file)
+        self.doc = doc
+
+    def persistent_load(self, pid): #pylint: disable=method-hidden
+        if pid == 'doc':
+            return self.doc
+        raise pickle.UnpicklingError("Invalid persistent id: " + repr(pid))
+
+def subclasses(Class):
+    """Internal function, returns all (direct and indirect) subclasses of a class"""
+    for SubClass in Class.__subclasses__():
+        yield SubClass
+        for SubSubClass in subclasses(SubClass):
+            yield SubSubClass
+
+
 class Document(object):
     """This is the FoLiA Document and holds all its data in memory.
 
@@ -6312,10 +6657,23 @@ class Document(object):
 
             doc = folia.Document(tree=xmltree)
 
+        5) Load a document from a binary file previously written with :meth:`Document.savebinary`, which is much faster than parsing XML::
+
+            doc = folia.Document(binaryfile='/path/to/doc.folia.bin')
+
+           The binary file is validated against the XML file it was derived from (if any). If that has changed since, the XML is parsed instead and the binary file is updated. Combine with ``file=`` to use the binary file as a transparent cache of an XML file, it will be created if it does not exist yet::
+
+            doc = folia.Document(file='/path/to/doc.xml', binaryfile='/path/to/doc.folia.bin')
+
+           Binary files can only be used in :class:`Mode.MEMORY`. No (deep) validation is performed when loading from a binary file.
+
+           .. warning:: Binary files are pickles, loading one can execute arbitrary code. Only load binary files you wrote yourself; never load untrusted files.
+
         Additionally, there are three modes that can be set with the ``mode=`` keyword argument:
 
              * folia.Mode.MEMORY - The entire FoLiA Document will be loaded into memory. This is the default mode and the only mode in which documents can be manipulated and saved again.
              * folia.Mode.XPATH - The full XML tree will still be loaded into memory, but conversion to FoLiA classes occurs only when queried. This mode can be used when the full power of XPath is required.
+             * folia.Mode.LAZY - The full XML tree will still be loaded into memory, but texts, divisions and paragraphs are converted to FoLiA classes only when first accessed (through ``select()``, ``words()``, ``sentences()``, ``paragraphs()``, ID lookups, or any other access of their children). Useful if you only need a small portion of a large document. Documents loaded in this mode can still be manipulated and saved.
 
         Keyword Arguments:
 
@@ -6344,6 +6702,8 @@ class Document(object):
         self.annotationdefaults[AnnotationType.PHON] = {'undefined': {} }
 
         self.index = {} #all IDs go here
+        self.selectindex = {} #secondary index for select(): (Class, set, ignore) => list of elements in document order, filled on first use and kept up to date by updateselectindex()
+        self.selectindexkeys = {} #element class => keys of the selectindex that select elements of that class, so updateselectindex() only visits the relevant ones
         self.declareprocessed = False # Will be set to True when declarations have been processed
 
         self.metadata = NativeMetaData() #will point to XML Element holding native metadata
@@ -6449,11 +6809,22 @@ class Document(object):
         else:
             self.parsexmlcallback = None
 
-        if 'id' in kwargs:
+        self.filename = None
+        if 'binaryfile' in kwargs and self.mode != Mode.MEMORY:
+            if 'file' not in kwargs:
+                raise ValueError("Binary files can only be loaded in Mode.MEMORY")
+            del kwargs['binaryfile'] #parse the XML instead
+
+        if 'binaryfile' in kwargs and self.loadbinary(kwargs['binaryfile'], kwargs.get('file')):
+            #loaded from a valid binary file, nothing left to do
+            pass
+        elif 'id' in kwargs:
             isncname(kwargs['id'])
             self.id = kwargs['id']
-        elif 'file' in kwargs:
-            self.filename = kwargs['file']
+        elif 'file' in kwargs or 'binaryfile' in kwargs:
+            if 'file' in kwargs:
+                self.filename = kwargs['file']
+            #else: the binary file is outdated, self.filename has been set to its source by loadbinary()
             if self.filename[-4:].lower() == '.bz2':
                 f = bz2.BZ2File(self.filename)
                 contents = f.read()
@@ -6470,20 +6841,24 @@ class Document(object):
                 self.parsexml(self.tree.getroot())
             else:
                 self.load(self.filename)
+            if 'binaryfile' in kwargs:
+                #(re)create the binary file
+                self.savebinary(kwargs['binaryfile'])
         elif 'string' in kwargs:
             self.tree = xmltreefromstring(kwargs['string'])
             del kwargs['string']
             self.parsexml(self.tree.getroot())
-            if self.mode != Mode.XPATH:
-                #XML Tree is now obsolete (only needed when partially loaded for xpath queries)
+            if self.mode == Mode.MEMORY:
+                #XML Tree is now obsolete (only needed when partially loaded for xpath queries or lazy loading)
                 self.tree = None
         elif 'tree' in kwargs:
-            self.parsexml(kwargs['tree'])
+            self.tree = kwargs['tree']
+            self.parsexml(self.tree)
         else:
             raise Exception("No ID, filename or tree specified")
 
-        if self.mode != Mode.XPATH:
-            #XML Tree is now obsolete (only needed when partially loaded for xpath queries), free memory
+        if self.mode == Mode.MEMORY:
+            #XML Tree is now obsolete (only needed when partially loaded for xpath queries or lazy loading), free memory
             self.tree = None
 
     #def __del__(self):
@@ -6507,8 +6882,8 @@ class Document(object):
         #else:
         self.tree = xmltreefromfile(filename)
         self.parsexml(self.tree.getroot())
-        if self.mode != Mode.XPATH:
-            #XML Tree is now obsolete (only needed when partially loaded for xpath queries)
+        if self.mode == Mode.MEMORY:
+            #XML Tree is now obsolete (only needed when partially loaded for xpath queries or lazy loading)
             self.tree = None
 
     def items(self):
@@ -6567,6 +6942,121 @@ class Document(object):
             f.write(self.xmlstring())
             f.close()
 
+    def savebinary(self, filename):
+        """Save the document to a compact binary file, from which it can be reloaded much faster than from XML, using ``Document(binaryfile=filename)``.
+
+        Elements are stored directly with their attributes (rather than as XML), all strings (IDs, classes, sets, annotators, text) are interned so each is stored only once, and the index is stored as well so it need not be rebuilt. If the document was loaded from a file, the modification time, size and checksum of that file are recorded so outdated binary files are detected.
+
+        The binary format is specific to this version of the library and is intended as a cache, not as an interchange format; use :meth:`Document.save` for that. It requires Python 3.
+
+        .. warning:: The binary file is a pickle, loading it can execute arbitrary code. Only load binary files you wrote yourself; never load untrusted files.
+
+        Arguments:
+            * filename (str): The filename to save to
+        """
+        if sys.version < '3':
+            raise NotImplementedError("Binary serialisation requires Python 3")
+        if self.subdocs or self.standoffdocs:
+            raise ValueError("Documents referring to external or standoff documents can not be saved to binary")
+        self.pendingvalidation()
+
+        state = {
+            'id': self.id,
+            'version': self.version,
+            'external': self.external,
+            'annotations': self.annotations,
+            'annotationdefaults': self.annotationdefaults,
+            'metadatatype': self.metadatatype,
+            'metadata': self.metadata,
+            'submetadata': self.submetadata,
+            'submetadatatype': self.submetadatatype,
+            'alias_set': self.alias_set,
+            'set_alias': self.set_alias,
+            'textclasses': self.textclasses,
+            'declareprocessed': self.declareprocessed,
+            'autodeclare': self.autodeclare,
+            'knownmetadata': (self._title, self._date, self._publisher, self._license, self._language),
+        }
+
+        if self.filename and os.path.exists(self.filename):
+            signature = sourcesignature(self.filename)
+        else:
+            signature = None
+
+        with io.open(filename,'wb') as f:
+            #the header is pickled separately so it can be validated without loading everything
+            pickle.dump( (BINARYMAGIC, BINARYVERSION, LIBVERSION, signature), f, 2)
+            BinaryPickler(f, self).dump( (state, self.data, self.index) )
+
+    def loadbinary(self, filename, source=None):
+        """Internal method to load a document from a binary file written by :meth:`Document.savebinary`, use ``Document(binaryfile=filename)`` instead.
+
+        .. warning:: The binary file is unpickled, which can execute arbitrary code. Only load binary files you wrote yourself; never load untrusted files.
+
+        Arguments:
+            * filename (str): The binary file
+            * source (str): The XML file the binary file should correspond to (defaults to the one recorded in the binary file)
+
+        Returns:
+            bool: ``True`` if the document was loaded, ``False`` if the binary file does not exist, is outdated or is incompatible with this version of the library, in which case ``self.filename`` is set to the XML file to parse instead
+        """
+        if not os.path.exists(filename):
+            if source is None:
+                raise IOError("Binary file " + filename + " not found and no XML source specified")
+            return False
+
+        with io.open(filename,'rb') as f:
+            try:
+                magic, version, libversion, signature = pickle.load(f)
+            except Exception: #pylint: disable=broad-except
+                magic = version = libversion = signature = None
+            if magic != BINARYMAGIC or version != BINARYVERSION or libversion != LIBVERSION:
+                if source is None and signature is None:
+                    raise ValueError("File " + filename + " is not a valid binary FoLiA file for this version of the library, and no XML source is specified")
+                if self.debug >= 1: print("[PyNLPl FoLiA DEBUG] Binary file " + filename + " is incompatible, parsing XML instead",file=stderr)
+                self.filename = source if source is not None else signature[0]
+                return False
+            if signature is not None and not sourcevalid(signature, source):
+                if self.debug >= 1: print("[PyNLPl FoLiA DEBUG] Binary file " + filename + " is outdated, parsing XML instead",file=stderr)
+                self.filename = source if source is not None else signature[0]
+                return False
+            if self.debug >= 1: print("[PyNLPl FoLiA DEBUG] Loading binary file " + filename,file=stderr)
+            gcenabled = gc.isenabled()
+            gc.disable() #the many objects created at once would otherwise trigger frequent (and pointless) garbage collection runs
+            try:
+                state, self.data, self.index = BinaryUnpickler(f, self).load()
+            finally:
+                if gcenabled:
+                    gc.enable()
+
+        self.id = state['id']
+        self.version = state['version']
+        self.external = state['external']
+        self.annotations = state['annotations']
+        self.annotationdefaults = state['annotationdefaults']
+        self.metadatatype = state['metadatatype']
+        self.metadata = state['metadata']
+        self.submetadata = state['submetadata']
+        self.submetadatatype = state['submetadatatype']
+        self.alias_set = state['alias_set']
+        self.set_alias = state['set_alias']
+        self.textclasses = state['textclasses']
+        self.declareprocessed = state['declareprocessed']
+        self.autodeclare = state['autodeclare']
+        self._title, self._date, self._publisher, self._license, self._language = state['knownmetadata']
+
+        if self.loadsetdefinitions:
+            for _, set in self.annotations:
+                if set and set not in self.setdefinitions and (set[:7] == "http://" or set[:8] == "https://" or set[:6] == "ftp://"):
+                    try:
+                        self.setdefinitions[set] = SetDefinition(set,verbose=self.verbose) #will raise exception on error
+                    except DeepValidationError:
+                        print("WARNING: Set " + set + " could not be downloaded, ignoring!",file=sys.stderr) #warning and ignore
+
+        if signature is not None:
+            self.filename = source if source is not None else signature[0]
+        return True
+
 
 
     def __len__(self):
@@ -6587,6 +7077,8 @@ class Document(object):
         """Tests if the specified element ID is in the document index"""
         if key in self.index:
             return True
+        elif self.mode == Mode.LAZY and self.materialiseid(key):
+            return True
         elif self.subdocs:
             for subdoc in self.subdocs.values():
                 if key in subdoc:
@@ -6608,7 +7100,9 @@ class Document(object):
             try:
                 return self.index[key]
             except KeyError:
-                if self.subdocs: #perhaps the key is in one of our subdocs?
+                if self.mode == Mode.LAZY and self.materialiseid(key): #perhaps the element simply hasn't been parsed yet?
+                    return self.index[key]
+                elif self.subdocs: #perhaps the key is in one of our subdocs?
                     for subdoc in self.subdocs.values():
                         try:
                             return subdoc[key]
@@ -6618,6 +7112,27 @@ class Document(object):
                     raise KeyError("No such key: " + key)
 
 
+    def materialiseid(self, id):
+        """Internal method for :class:`Mode.LAZY`. Finds the element with the specified ID in the XML tree and materialises all of its lazy ancestors, so that it ends up in the index.
+
+        Returns:
+            bool: ``True`` if the element could be found and is now in the index
+        """
+        if self.tree is None:
+            return False
+        nodes = self.tree.xpath('//*[@xml:id=$id]', id=id)
+        if not nodes:
+            return False
+        #walk down from the root towards the node, materialising lazy elements along the way
+        path = list(reversed(list(nodes[0].iterancestors())))
+        elements = self.data
+        for node in path:
+            for e in elements:
+                if isinstance(e, AbstractElement) and e._lazynode is node: #pylint: disable=protected-access
+                    elements = e.data #materialises
+                    break
+        return id in self.index
+
     def append(self,text):
         """Add a text (or speech) to the document:
 
@@ -6640,6 +7155,7 @@ class Document(object):
         else:
             assert isinstance(text, Text) or isinstance(text, Speech)
         self.data.append(text)
+        self.updateselectindex(text)
         return text
 
     def add(self,text):
@@ -7338,7 +7854,7 @@ class Document(object):
                 for subnode in node:
                     if subnode.tag == '{' + NSFOLIA + '}metadata':
                         self.parsemetadata(subnode)
-                    elif (subnode.tag == '{' + NSFOLIA + '}text' or subnode.tag == '{' + NSFOLIA + '}speech') and self.mode == Mode.MEMORY:
+                    elif (subnode.tag == '{' + NSFOLIA + '}text' or subnode.tag == '{' + NSFOLIA + '}speech') and self.mode in (Mode.MEMORY, Mode.LAZY):
                         if self.debug >= 1: print("[PyNLPl FoLiA DEBUG] Found Text",file=stderr)
                         e = self.parsexml(subnode)
                         if e is not None:
@@ -7425,22 +7941,98 @@ class Document(object):
 
 
     def select(self, Class, set=None, recursive=True,  ignore=True):
-        """See :meth:`AbstractElement.select`"""
-        if self.mode == Mode.MEMORY:
-            for t in self.data:
-                if Class.__name__ == 'Text':
-                    yield t
-                else:
-                    for e in t.select(Class,set,recursive,ignore):
-                        yield e
+        """See :meth:`AbstractElement.select`
+
+        In :class:`Mode.MEMORY`, the results of a recursive selection are stored in a secondary index (keyed by class, set and ignore list), so subsequent identical selections need not traverse the document again. The index is kept up to date as elements are added or removed through the API, see :meth:`Document.updateselectindex`."""
+        if self.mode == Mode.MEMORY and recursive:
+            key = selectindexkey(Class, set, ignore)
+            try:
+                found = self.selectindex[key]
+            except KeyError:
+                found = self.selectindex[key] = list(self._select(Class, set, recursive, ignore))
+                for c, keys in self.selectindexkeys.items():
+                    if issubclass(c, Class):
+                        keys.add(key)
+            for e in found:
+                yield e
+        elif self.mode in (Mode.MEMORY, Mode.LAZY):
+            for e in self._select(Class, set, recursive, ignore):
+                yield e
+
+    def _select(self, Class, set=None, recursive=True,  ignore=True):
+        """Internal method, does the actual traversal for :meth:`select`"""
+        for t in self.data:
+            if Class.__name__ == 'Text':
+                yield t
+            else:
+                for e in t.select(Class,set,recursive,ignore):
+                    yield e
 
     def count(self, Class, set=None, recursive=True,ignore=True):
         """See :meth:`AbstractElement.count`"""
-        if self.mode == Mode.MEMORY:
-            s = 0
-            for t in self.data:
-                s +=  sum( 1 for e in t.select(Class,recursive,True ) )
-            return s
+        if self.mode in (Mode.MEMORY, Mode.LAZY):
+            return sum( 1 for e in self.select(Class,set,recursive,ignore) )
+
+    def updateselectindex(self, element, parent=None, removed=False):
+        """Updates the secondary index for :meth:`select` after an element has been added to, or is about to be removed from, the specified parent (``None`` for the document root).
+
+        Selections in which the element (or anything below it) occurs are extended in-place if the element was appended at the very end of the document, and are otherwise dropped from the index so they will be rebuilt on the next :meth:`select`.
+
+        This is called automatically by :meth:`AbstractElement.append`, :meth:`AbstractElement.insert`, :meth:`AbstractElement.remove` and friends. Call :meth:`Document.clearselectindex` if you modify the ``data`` of elements directly or change the set or authority of elements already in the document.
+        """
+        if not self.selectindex or not isinstance(element, AbstractElement):
+            return
+
+        #gather the ancestors up to the document root, and see whether the element is at the very end of the document
+        ancestors = []
+        last = True
+        child = element
+        e = parent
+        while e is not None:
+            if not isinstance(e, AbstractElement):
+                return
+            if e.data and e.data[-1] is not child:
+                last = False
+            ancestors.append(e)
+            child = e
+            e = e.parent
+        if not any( t is child for t in self.data ):
+            return #not attached to this document (yet), nothing to do
+        if self.data[-1] is not child:
+            last = False
+
+        #only the selections of classes that occur in the added or removed subtree are affected
+        keys = set()
+        for c in subtreeclasses(element):
+            try:
+                keys |= self.selectindexkeys[c]
+            except KeyError:
+                self.selectindexkeys[c] = { key for key in self.selectindex if issubclass(c, key[0]) }
+                keys |= self.selectindexkeys[c]
+
+        for key in keys:
+            if key not in self.selectindex:
+                continue #dropped before
+            Class, selectset, ignore = key
+            if any( isignored(e, ignore) for e in ancestors[:-1] ) or (ancestors and isignored(element, ignore)):
+                continue
+            if ancestors or Class.__name__ != 'Text':
+                matches = [ e for e in element.select(Class, selectset, True, ignore) ]
+                if isinstance(element, Class) and (selectset is None or element.set == selectset) and ancestors:
+                    matches.insert(0, element)
+            else:
+                matches = [element] #Text elements at the root are selected without regard for set
+            if not matches:
+                continue
+            if last and not removed:
+                self.selectindex[key] += matches
+            else:
+                del self.selectindex[key]
+
+    def clearselectindex(self):
+        """Clears the secondary index for :meth:`select` entirely, it will be rebuilt as needed"""
+        self.selectindex = {}
+        self.selectindexkeys = {}
 
     def paragraphs(self, index = None):
         """Return a generator of all paragraphs found in the document.
@@ -7559,17 +8151,47 @@ class Document(object):
 #==============================================================================
 
 class Corpus:
-    """A corpus of various FoLiA documents. Yields a Document on each iteration. Suitable for sequential processing."""
+    """A corpus of various FoLiA documents. Yields a Document on each iteration. Suitable for sequential processing, or for parallel loading if ``workers`` is set.
+
+    Arguments:
+        corpusdir (str): The directory holding the documents, documents in direct subdirectories (collections) are included as well
+        extension (str): The extension of the files to load (default: ``xml``)
+        restrict_to_collection (str): Only load documents from the subdirectory (collection) by this name
+        conditionf (function): A function that takes a filename and returns a boolean indicating whether to load the file
+        ignoreerrors (bool): Print an error and continue with the next document if a document can not be loaded
+        workers (int): Parse the documents in this many worker processes (default: ``None``, sequential processing in the current process)
+        ordered (bool): When using workers, yield in corpus order (default). If set to ``False``, yield in order of completion instead.
+        function (function): When using workers, call this function on each loaded document in the worker process and yield its (picklable) result, rather than sending the document itself back to the main process
+        chunksize (int): When using workers, the number of documents to send to a worker at once
+        maxtasksperchild (int): When using workers, the number of tasks after which a worker is replaced by a fresh one (lxml may leak memory)
+        **kwargs: All other keyword arguments are passed to the :class:`Document` constructor
+
+    When using workers with ``loadsetdefinitions`` or ``deepvalidation``, the set definitions declared in the corpus are loaded only once, in the main process, and then shared with all workers (see :meth:`Corpus.loadsetdefinitions`), rather than downloaded and parsed again for every single document. Pass ``setdefinitions`` to provide an already populated store.
+
+    Example::
+
+        for doc in folia.Corpus('/path/to/corpus', workers=4, deepvalidation=True):
+            ..
+    """
 
-    def __init__(self,corpusdir, extension = 'xml', restrict_to_collection = "", conditionf=lambda x: True, ignoreerrors=False, **kwargs):
+    def __init__(self,corpusdir, extension = 'xml', restrict_to_collection = "", conditionf=lambda x: True, ignoreerrors=False, workers=None, ordered=True, function=None, chunksize=1, maxtasksperchild=100, **kwargs):
         self.corpusdir = corpusdir
         self.extension = extension
         self.restrict_to_collection = restrict_to_collection
         self.conditionf = conditionf
         self.ignoreerrors = ignoreerrors
+        self.workers = workers
+        self.ordered = ordered
+        self.function = function
+        self.chunksize = chunksize
+        self.maxtasksperchild = maxtasksperchild
         self.kwargs = kwargs
 
     def __iter__(self):
+        if self.workers:
+            for result in self.parallel():
+                yield result
+            return
         if not self.restrict_to_collection:
             for f in glob.glob(os.path.join(self.corpusdir,"*." + self.extension)):
                 if self.conditionf(f):
@@ -7591,6 +8213,92 @@ class Corpus:
                                 raise
 
 
+    def loadsetdefinitions(self, files, setdefinitions=None):
+        """Loads the set definitions for all sets declared in the specified files. Only the declarations of each file are read. Sets that were already loaded are not loaded again.
+
+        Arguments:
+            files (list): The filenames to scan
+            setdefinitions (dict): The store to add to (set => :class:`pynlpl.formats.foliaset.SetDefinition`). If ``None``, a new one will be created
+
+        Returns:
+            dict: The store of set definitions
+        """
+        if setdefinitions is None:
+            setdefinitions = {}
+        verbose = self.kwargs.get('verbose', False)
+        for filename in files:
+            try:
+                sets = declaredsets(filename)
+            except Exception as e: #pylint: disable=broad-except
+                print("Error, unable to read declarations from " + filename + ": " + e.__class__.__name__  + " - " + str(e),file=stderr)
+                if not self.ignoreerrors:
+                    raise
+                continue
+            for set in sets: #pylint: disable=redefined-builtin
+                if set not in setdefinitions and (set[:7] == "http://" or set[:8] == "https://" or set[:6] == "ftp://"):
+                    try:
+                        setdefinitions[set] = SetDefinition(set,verbose=verbose) #will raise exception on error
+                    except DeepValidationError:
+                        print("WARNING: Set " + set + " could not be downloaded, ignoring!",file=sys.stderr) #warning and ignore
+        return setdefinitions
+
+    def parallel(self):
+        """Parses the documents of the corpus in parallel, using as many worker processes as specified by ``workers`` upon instantiation. Normally you just iterate over the corpus instead of calling this directly.
+
+        Yields:
+            :class:`Document` or, if ``function`` was specified, whatever the function returns
+        """
+        files = list(CorpusFiles(self.corpusdir, self.extension, self.restrict_to_collection, self.conditionf, self.ignoreerrors))
+        kwargs = self.kwargs.copy()
+        setdefinitions = kwargs.pop('setdefinitions', None)
+        if kwargs.get('loadsetdefinitions') or kwargs.get('deepvalidation'):
+            setdefinitions = self.loadsetdefinitions(files, setdefinitions)
+        elif setdefinitions is None:
+            setdefinitions = {}
+
+        for result in parallelmap(corpusworker, files, self.workers, initcorpusworker, (setdefinitions, kwargs, self.function), self.ordered, self.chunksize, self.maxtasksperchild, errormessage="Error, unable to parse", ignoreerrors=self.ignoreerrors):
+            if self.function is None:
+                result.setdefinitions = setdefinitions #re-attach the shared store (not sent back by the workers)
+            yield result
+
+
+CORPUSWORKER = {} #state of a worker process of Corpus.parallel(), set up by initcorpusworker()
+
+def initcorpusworker(setdefinitions, kwargs, function):
+    """Internal function, initialises a worker process for :meth:`Corpus.parallel`"""
+    CORPUSWORKER['setdefinitions'] = setdefinitions #sets not loaded yet will be added to this store by the documents, so they are loaded at most once per worker
+    CORPUSWORKER['kwargs'] = kwargs
+    CORPUSWORKER['function'] = function
+
+def corpusworker(filename):
+    """Internal function, loads a single document in a worker process for :meth:`Corpus.parallel`"""
+    doc = Document(file=filename, setdefinitions=CORPUSWORKER['setdefinitions'], **CORPUSWORKER['kwargs'])
+    if CORPUSWORKER['function'] is not None:
+        return CORPUSWORKER['function'](doc)
+    doc.setdefinitions = {} #don't send the set definitions back with every document
+    doc.tree = None
+    return doc
+
+def declaredsets(filename):
+    """Returns a list of all sets declared in the specified FoLiA document (plain, gzip or bzip2 compressed), without parsing beyond the declarations"""
+    if filename[-4:].lower() == '.bz2':
+        f = bz2.BZ2File(filename)
+    elif filename[-3:].lower() == '.gz':
+        f = gzip.GzipFile(filename) #pylint: disable=redefined-variable-type
+    else:
+        f = open(filename,'rb')
+    sets = []
+    try:
+        for _, node in ElementTree.iterparse(f, events=('end',), tag='{' + NSFOLIA + '}annotations'):
+            for subnode in node:
+                if (isinstance(subnode.tag, str) or (sys.version < '3' and isinstance(subnode.tag, unicode))) and subnode.get('set'): #pylint: disable=undefined-variable
+                    sets.append(subnode.get('set'))
+            break
+    finally:
+        f.close()
+    return sets
+
+
 class CorpusFiles(Corpus):
     """A corpus of various FoLiA documents. Yields the filenames on each iteration."""
 
@@ -7652,12 +8360,7 @@ class CorpusProcessor(object):
     def run(self, *args, **kwargs):
         if not self.preindex:
             self.index = CorpusFiles(self.corpusdir, self.extension, self.restrict_to_collection, self.conditionf, True) #generator
-        pool = multiprocessing.Pool(self.threads,None,None, self.maxtasksperchild)
-        if self.ordered:
-            return pool.imap( self.function,  ( (filename, args, kwargs) for filename in self.index), self.chunksize)
-        else:
-            return pool.imap_unordered( self.function,  ( (filename, args, kwargs) for filename in self.index), self.chunksize)
-        #pool.close()
+        return parallelmap(self.function, ( (filename, args, kwargs) for filename in self.index), self.threads or multiprocessing.cpu_count(), ordered=self.ordered, chunksize=self.chunksize, maxtasksperchild=self.maxtasksperchild)
 
 
 
@@ -7893,7 +8596,9 @@ def findwords(doc, worditerator, *args, **kwargs):
 class Reader(object):
     """Streaming FoLiA reader.
 
-    The reader allows you to read a FoLiA Document without holding the whole tree structure in memory. The document will be read and the elements you seek returned as they are found. If you are querying a corpus of large FoLiA documents for a specific structure, then it is strongly recommend to use the Reader rather than the standard Document!"""
+    The reader allows you to read a FoLiA Document without holding the whole tree structure in memory. The document will be read and the elements you seek returned as they are found. If you are querying a corpus of large FoLiA documents for a specific structure, then it is strongly recommend to use the Reader rather than the standard Document!
+
+    The document is read in a single pass; the metadata and declarations are parsed upon instantiation (available in ``reader.doc``), the rest as you iterate. Memory usage does not depend on the size of the document, but only on the size of the elements you seek. Elements are only kept in the ID index of the document (``reader.doc``) until the next one is read."""
 
 
     def __init__(self, filename, target, *args, **kwargs):
@@ -7901,17 +8606,19 @@ class Reader(object):
 
         Arguments:
 
-            * ``filename``: The filename of the document to read
-            * ``target``: The FoLiA element(s) you want to read (with everything contained in its scope). Passed as a class. For example: ``folia.Sentence``, or a tuple of multiple element classes. Can also be set to ``None`` to return all elements, but that would load the full tree structure into memory.
+            * ``filename``: The filename of the document to read, may be compressed with gzip (``.gz``) or bzip2 (``.bz2``)
+            * ``target``: The FoLiA element(s) you want to read (with everything contained in its scope). Passed as a class. For example: ``folia.Sentence``, or a tuple of multiple element classes. If targets are nested, e.g. ``(folia.Sentence, folia.Word)``, all of them are returned in the order in which they end in the document (so words before the sentence that holds them). Can also be set to ``None`` to return all texts, but that would load the full tree structure into memory.
 
         """
 
+        self.filename = filename
         self.target = target
-        if not (isinstance(self.target, tuple) or isinstance(self.target, list) or issubclass(self.target, AbstractElement)):
-            raise ValueError("Target must be subclass of FoLiA element")
+        self.targettags() #validates the target
         if 'bypassleak' in kwargs:
             self.bypassleak = False
-        self.stream = io.open(filename,'rb')
+        self.stream = None
+        self.iterator = None
+        self.doc = None
         self.initdoc()
 
 
@@ -7920,58 +8627,240 @@ class Reader(object):
         for x in findwords(self.doc,self.__iter__,*args,**kwargs):
             yield x
 
+    def targettags(self):
+        """Internal method, returns a dictionary of XML tags of the target elements to their classes"""
+        if self.target is None:
+            targets = (Text, Speech)
+        elif isinstance(self.target, (tuple, list)):
+            targets = self.target
+        else:
+            targets = (self.target,)
+        tags = {}
+        for Class in targets:
+            if not inspect.isclass(Class) or not issubclass(Class, AbstractElement) or not Class.XMLTAG:
+                raise ValueError("Target must be subclass of FoLiA element")
+            tags['{' + NSFOLIA + '}' + Class.XMLTAG] = Class
+        return tags
+
+    def openstream(self):
+        """Internal method, opens the file (decompressing transparently if needed)"""
+        if self.filename[-4:].lower() == '.bz2':
+            return bz2.BZ2File(self.filename,'rb')
+        elif self.filename[-3:].lower() == '.gz':
+            return gzip.GzipFile(self.filename,'rb') #pylint: disable=redefined-variable-type
+        else:
+            return io.open(self.filename,'rb')
+
     def initdoc(self):
-        self.doc = None
-        metadata = False
-        for action, node in ElementTree.iterparse(self.stream, events=("start","end")):
+        """Internal method, (re)opens the document and reads it up to and including the metadata, which is parsed if no document was read yet. The parser is left at that point for :meth:`__iter__` to continue."""
+        if self.stream is not None:
+            self.stream.close()
+        self.stream = self.openstream()
+        tags = ['{' + NSFOLIA + '}FoLiA', '{' + NSFOLIA + '}metadata'] + list(self.targettags().keys())
+        self.iterator = ElementTree.iterparse(self.stream, events=("start","end"), tag=tags)
+        found = metadata = False
+        for action, node in self.iterator:
             if action == "start" and node.tag == "{" + NSFOLIA + "}FoLiA":
-                if '{http://www.w3.org/XML/1998/namespace}id' in node.attrib:
-                    id = node.attrib['{http://www.w3.org/XML/1998/namespace}id']
-                self.doc = Document(id=id)
-                if 'version' in node.attrib:
-                    self.doc.version = node.attrib['version']
+                found = True
+                if self.doc is None:
+                    id = None
+                    if '{http://www.w3.org/XML/1998/namespace}id' in node.attrib:
+                        id = node.attrib['{http://www.w3.org/XML/1998/namespace}id']
+                    self.doc = Document(id=id)
+                    if 'version' in node.attrib:
+                        self.doc.version = node.attrib['version']
             if action == "end" and node.tag == "{" + NSFOLIA + "}metadata":
-                if not self.doc:
+                if not found:
                     raise MalformedXMLError("Metadata found, but no document? Impossible")
                 metadata = True
-                self.doc.parsemetadata(node)
+                if not self.doc.declareprocessed:
+                    self.doc.parsemetadata(node)
                 break
 
-
-        if not self.doc:
+        if not found:
             raise MalformedXMLError("No FoLiA Document found!")
         elif not metadata:
             raise MalformedXMLError("No metadata found!")
 
-        self.stream.seek(0)
-
 
     def __iter__(self):
         """Iterating over a Reader instance will cause the FoLiA document to be read. This is a generator yielding instances of the object you specified"""
 
-        if not isinstance(self.target, tuple) or isinstance(self.target,list):
-            target = "{" + NSFOLIA + "}" + self.target.XMLTAG
-            Class = self.target
-            multitargets = False
-        else:
-            multitargets = True
-
-        for action, node in ElementTree.iterparse(self.stream, events=("end",), tag=target):
-            if not multitargets or (multitargets and node.tag.startswith('{' + NSFOLIA + '}')):
-                if not multitargets: Class = XML2CLASS[node.tag[nslen:]]
-                if not multitargets or (multitargets and Class in self.targets):
-                    element = Class.parsexml(node, self.doc)
-                    node.clear() #clean up children
-                    # Also eliminate now-empty references from the root node to
-                    # elem (http://www.ibm.com/developerworks/xml/library/x-hiperfparse/)
-                    #for ancestor in node.xpath('ancestor-or-self::*'):
-                    while node.getprevious() is not None:
-                        del node.getparent()[0]  # clean up preceding siblings
-                    yield element
+        if self.iterator is None:
+            #we have iterated before, start reading anew
+            self.initdoc()
+        iterator = self.iterator
+        self.iterator = None
+
+        tags = self.targettags()
+        depth = 0 #number of targets we are currently in
+        for action, node in iterator:
+            if node.tag not in tags:
+                continue
+            elif action == "start":
+                depth += 1
+                continue
+            depth -= 1
+            element = tags[node.tag].parsexml(node, self.doc)
+            if depth == 0:
+                #no enclosing target needs this node anymore, clean up (http://www.ibm.com/developerworks/xml/library/x-hiperfparse/)
+                node.clear()
+                for e in itertools.chain((node,), node.iterancestors()):
+                    while e.getprevious() is not None:
+                        del e.getparent()[0]  # clean up preceding siblings
+            yield element
+            self.purge(element)
 
-    def __del__(self):
         self.stream.close()
 
+    def purge(self, element):
+        """Internal method, removes a previously returned element from the index of the document, so it can be freed (and parsed anew as part of an enclosing target)"""
+        for e in itertools.chain((element,), element.select(AbstractElement, None, True, False)):
+            if e.id and self.doc.index.get(e.id) is e:
+                del self.doc.index[e.id]
+
+    def __del__(self):
+        if self.stream is not None:
+            self.stream.close()
+
+
+class Writer(object):
+    """Streaming FoLiA writer.
+
+    The writer allows you to write a FoLiA document of any size without holding the whole tree structure in memory. The header (declarations and metadata) is written first, after which the top-level structure elements (e.g. :class:`Division`, :class:`Paragraph`, :class:`Sentence`) of the text body are written to file one by one as they are appended, after which they are discarded.
+
+    An appended element is written as soon as the next one is appended or the writer is closed, so you can still add to the last appended element until then.
+
+    Example::
+
+        doc = folia.Document(id='example') #holds only the declarations and metadata
+        doc.declare(folia.AnnotationType.TOKEN, 'adhocset')
+        with folia.Writer('example.folia.xml', doc) as writer:
+            for line in lines:
+                sentence = writer.append(folia.Sentence)
+                for word in line.split():
+                    sentence.append(folia.Word, word)
+    """
+
+    def __init__(self, filename, doc, textid=None):
+        """
+        Arguments:
+            filename (str): The file to write to, will be compressed if it ends in ``.gz`` or ``.bz2``
+            doc (:class:`Document`): The document holding the declarations and metadata to write, and to which all appended elements pertain. Its text body (if any) is not written.
+            textid (str): The ID for the text element, defaults to the document ID with ``.text`` appended
+        """
+        self.doc = doc
+        self.filename = filename
+        if not textid:
+            textid = doc.id + '.text'
+        self.text = Text(doc, id=textid) #text element is only used as parent for appended elements, it never holds more than the pending one
+        self.pending = None
+        if filename[-4:].lower() == '.bz2':
+            self.stream = bz2.BZ2File(filename,'wb')
+        elif filename[-3:].lower() == '.gz':
+            self.stream = gzip.GzipFile(filename,'wb') #pylint: disable=redefined-variable-type
+        else:
+            self.stream = io.open(filename,'wb')
+        self.writer = self.write()
+        next(self.writer) #writes the header
+
+    def write(self):
+        """Internal generator (coroutine) writing the document, it is sent elements to write, and ``None`` to finish"""
+        E = ElementMaker(namespace=NSFOLIA,nsmap={None: NSFOLIA, 'xml' : "http://www.w3.org/XML/1998/namespace", 'xlink':"http://www.w3.org/1999/xlink"})
+        attribs = {}
+        attribs['{http://www.w3.org/XML/1998/namespace}id'] = self.doc.id
+        attribs['version'] = FOLIAVERSION
+        attribs['generator'] = 'pynlpl.formats.folia-v' + LIBVERSION
+
+        metadataattribs = {}
+        metadataattribs['type'] = self.doc.metadatatype
+        if isinstance(self.doc.metadata, ExternalMetaData):
+            metadataattribs['src'] = self.doc.metadata.url
+
+        with ElementTree.xmlfile(self.stream, encoding='utf-8') as xf:
+            xf.write_declaration()
+            with xf.element('{' + NSFOLIA + '}FoLiA', attribs, nsmap={None: NSFOLIA, 'xml' : "http://www.w3.org/XML/1998/namespace", 'xlink':"http://www.w3.org/1999/xlink"}):
+                xf.write("\n")
+                self.writenode(xf, E.metadata(E.annotations(*self.doc.xmldeclarations()), *self.doc.xmlmetadata(), **metadataattribs))
+                with xf.element('{' + NSFOLIA + '}' + self.text.XMLTAG, {'{http://www.w3.org/XML/1998/namespace}id': self.text.id}):
+                    xf.write("\n")
+                    while True:
+                        element = yield
+                        if element is None:
+                            break
+                        self.writenode(xf, element.xml())
+                xf.write("\n")
+
+    def writenode(self, xf, node, indent="", declared=None):
+        """Internal method, writes an XML node element by element within the open document, so the FoLiA namespace is only declared by the root element. The output is indented like :meth:`Document.xmlstring` does."""
+        if not isstring(node.tag): #comment or processing instruction
+            xf.write(node, with_tail=False)
+            return
+        if declared is None:
+            declared = {None: NSFOLIA, 'xml': "http://www.w3.org/XML/1998/namespace", 'xlink': "http://www.w3.org/1999/xlink"} #by the root element
+        attribs = {}
+        for key, value in node.attrib.items():
+            if key.startswith('{' + NSFOLIA + '}'): #FoLiA attributes are not namespaced (Document.xmlstring patches these out as well)
+                key = key[len(NSFOLIA)+2:]
+            attribs[key] = value
+        nsmap = dict( (prefix, namespace) for prefix, namespace in node.nsmap.items() if namespace != NSFOLIA and declared.get(prefix) != namespace ) #foreign namespaces (in foreign data) not declared yet
+        if nsmap:
+            declared = dict(declared, **nsmap)
+        with xf.element(node.tag, attribs, nsmap=nsmap or None):
+            children = list(node)
+            mixed = bool(node.text) or any(child.tail for child in children) #mixed content is not indented
+            if node.text:
+                xf.write(node.text)
+            for child in children:
+                if not mixed:
+                    xf.write("\n" + indent + "  ")
+                self.writenode(xf, child, indent + "  ", declared)
+                if child.tail:
+                    xf.write(child.tail)
+            if children and not mixed:
+                xf.write("\n" + indent)
+        if not indent:
+            xf.write("\n")
+
+    def append(self, child, *args, **kwargs):
+        """Append a top-level structure element to the text body. Takes the same arguments as :meth:`AbstractElement.append`, so you can pass either an instance or a class. The previously appended element is written to file now.
+
+        Returns:
+            the added element
+        """
+        self.flush()
+        self.pending = self.text.append(child, *args, **kwargs)
+        return self.pending
+
+    def flush(self):
+        """Writes the pending element (if any) to file, and removes it from memory"""
+        if self.pending is not None:
+            self.doc.pendingvalidation()
+            self.writer.send(self.pending)
+            #remove all traces from the document
+            for e in itertools.chain((self.pending,), self.pending.select(AbstractElement, None, True, False)):
+                if e.id and self.doc.index.get(e.id) is e:
+                    del self.doc.index[e.id]
+            self.text.data.remove(self.pending)
+            self.pending = None
+
+    def close(self):
+        """Writes any pending element, finishes the document and closes the file"""
+        if self.writer is not None:
+            self.flush()
+            try:
+                self.writer.send(None)
+            except StopIteration:
+                pass
+            self.writer = None
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 def isncname(name):
     #not entirely according to specs http://www.w3.org/TR/REC-xml/#NT-Name , but simplified:
     for i, c in enumerate(name):
@@ -8019,6 +8908,10 @@ def validate(filename,schema=None,deep=False):
     if deep:
         doc = Document(tree=doc, deepvalidation=True)
 
+#Elements of which the children are only parsed upon first access, when loading a document in Mode.LAZY
+LAZYELEMENTS = (Text, Speech, Division, Paragraph)
+LAZYTAGS = {} #cache for AbstractElement.lazycontains(): Class => XML tags
+
 #================================= FOLIA SPECIFICATION ==========================================================
 
 #foliaspec:header
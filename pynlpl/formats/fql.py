@@ -22,10 +22,13 @@ from __future__ import division
 from __future__ import absolute_import
 
 from pynlpl.formats import folia
+from pynlpl.common import isstring, parallelmap
 from copy import copy
+from collections import OrderedDict
 import json
 import re
 import sys
+import os
 import random
 import datetime
 
@@ -38,6 +41,9 @@ MAXEXPANSION = 99
 FOLIAVERSION = '1.5.0'
 FQLVERSION = '0.4.1'
 
+PREPAREDCACHESIZE = 1024 #maximum number of queries kept by prepare()
+PREPAREDCACHE = OrderedDict() #(query string, context) => Query, in least-recently-used order
+
 class SyntaxError(Exception):
     pass
 
@@ -190,6 +196,7 @@ class Filter(object): #WHERE ....
         self.filters = filters
         self.negation = negation
         self.disjunction = disjunction
+        self.compiled = self.compile()
 
     @staticmethod
     def parse(q, i=0):
@@ -277,35 +284,75 @@ class Filter(object): #WHERE ....
 
         return Filter(filters, negation, logop == "OR"), i
 
+    def compile(self):
+        """Compiles the filter into a single callable taking a query and an element, so evaluation need not inspect the filter structure for every element again. Used by :meth:`__call__` when not debugging."""
+        conditions = []
+        for filter in self.filters:
+            if isinstance(filter, tuple):
+                conditions.append( lambda query, element, filter=filter: self.testcontext(query, element, filter) )
+            elif isinstance(filter, Filter):
+                conditions.append( filter.compiled )
+            else:
+                conditions.append( lambda query, element, filter=filter: filter(element) )
+
+        if self.negation:
+            conditions = [ lambda query, element, condition=condition: not condition(query, element) for condition in conditions ]
+
+        if not conditions:
+            return lambda query, element: True
+        elif len(conditions) == 1:
+            return conditions[0]
+        elif self.disjunction:
+            def compiled(query, element):
+                for condition in conditions:
+                    if condition(query, element):
+                        return True
+                return False
+        else:
+            def compiled(query, element):
+                for condition in conditions:
+                    if not condition(query, element):
+                        return False
+                return True
+        return compiled
+
+    def testcontext(self, query, element, filter, debug=False):
+        """Tests a context filter (a ``(modifier, selector, subfilter)`` tuple, i.e. a HAS statement or a context keyword) on the specified element, returns a boolean"""
+        modifier, selector, subfilter = filter
+        if debug: print("[FQL EVALUATION DEBUG] Filter - Filter is a subfilter of type " + modifier + ", descending...",file=sys.stderr)
+        #we have a subfilter, i.e. a HAS statement on a subelement
+        match = False
+        if modifier == "CHILD":
+            for subelement,_ in selector(query, [element], True, debug): #if there are multiple subelements, they are always treated disjunctly
+                if not subfilter:
+                    match = True
+                else:
+                    match = subfilter(query, subelement, debug)
+                if match: break #only one subelement has to match by definition, then the HAS statement is matched
+        elif modifier == "PARENT":
+            match = selector.match(query, element.parent,debug)
+        elif modifier == "NEXT":
+            neighbour = element.next()
+            if neighbour:
+                match = selector.match(query, neighbour,debug)
+        elif modifier == "PREVIOUS":
+            neighbour = element.previous()
+            if neighbour:
+                match = selector.match(query, neighbour,debug)
+        else:
+            raise NotImplementedError("Context keyword " + modifier + " not implemented yet")
+        return match
+
     def __call__(self, query, element, debug=False):
         """Tests the filter on the specified element, returns a boolean"""
+        if not debug:
+            return self.compiled(query, element)
+
         match = True
-        if debug: print("[FQL EVALUATION DEBUG] Filter - Testing filter [" + str(self) + "] for ", repr(element),file=sys.stderr)
+        print("[FQL EVALUATION DEBUG] Filter - Testing filter [" + str(self) + "] for ", repr(element),file=sys.stderr)
         for filter in self.filters:
             if isinstance(filter,tuple):
-                modifier, selector, subfilter = filter
-                if debug: print("[FQL EVALUATION DEBUG] Filter - Filter is a subfilter of type " + modifier + ", descending...",file=sys.stderr)
-                #we have a subfilter, i.e. a HAS statement on a subelement
-                match = False
-                if modifier == "CHILD":
-                    for subelement,_ in selector(query, [element], True, debug): #if there are multiple subelements, they are always treated disjunctly
-                        if not subfilter:
-                            match = True
-                        else:
-                            match = subfilter(query, subelement, debug)
-                        if match: break #only one subelement has to match by definition, then the HAS statement is matched
-                elif modifier == "PARENT":
-                    match = selector.match(query, element.parent,debug)
-                elif modifier == "NEXT":
-                    neighbour = element.next()
-                    if neighbour:
-                        match = selector.match(query, neighbour,debug)
-                elif modifier == "PREVIOUS":
-                    neighbour = element.previous()
-                    if neighbour:
-                        match = selector.match(query, neighbour,debug)
-                else:
-                    raise NotImplementedError("Context keyword " + modifier + " not implemented yet")
+                match = self.testcontext(query, element, filter, debug)
             elif isinstance(filter, Filter):
                 #we have a nested filter (parentheses)
                 match = filter(query, element, debug)
@@ -317,14 +364,14 @@ class Filter(object): #WHERE ....
                 match = not match
             if match:
                 if self.disjunction:
-                    if debug: print("[FQL EVALUATION DEBUG] Filter returns True",file=sys.stderr)
+                    print("[FQL EVALUATION DEBUG] Filter returns True",file=sys.stderr)
                     return True
             else:
                 if not self.disjunction: #implies conjunction
-                    if debug: print("[FQL EVALUATION DEBUG] Filter returns False",file=sys.stderr)
+                    print("[FQL EVALUATION DEBUG] Filter returns False",file=sys.stderr)
                     return False
 
-        if debug: print("[FQL EVALUATION DEBUG] Filter returns ", str(match),file=sys.stderr)
+        print("[FQL EVALUATION DEBUG] Filter returns ", str(match),file=sys.stderr)
         return match
 
     def __str__(self):
@@ -460,7 +507,6 @@ class Selector(object):
                     if debug: print("[FQL EVALUATION DEBUG] Select - Selecting ID " + selector.id,file=sys.stderr)
                     try:
                         candidate = query.doc[selector.id]
-                        selector.Class = candidate.__class__
                         if not selector.filter or  selector.filter(query,candidate, debug):
                             if debug: print("[FQL EVALUATION DEBUG] Select - Yielding (by ID) ", repr(candidate),file=sys.stderr)
                             yield candidate, e
@@ -472,19 +518,21 @@ class Selector(object):
                         if isinstance(candidate, folia.AbstractElement):
                             yield candidate, e
                 elif selector.Class:
-                    if debug: print("[FQL EVALUATION DEBUG] Select - Selecting Class " + selector.Class.XMLTAG + " with set " + str(selector.set),file=sys.stderr)
                     if selector.Class.XMLTAG in query.defaultsets:
-                        selector.set = query.defaultsets[selector.Class.XMLTAG]
+                        selectset = query.defaultsets[selector.Class.XMLTAG]
+                    else:
+                        selectset = selector.set
+                    if debug: print("[FQL EVALUATION DEBUG] Select - Selecting Class " + selector.Class.XMLTAG + " with set " + str(selectset),file=sys.stderr)
                     isspan = issubclass(selector.Class, folia.AbstractSpanAnnotation)
                     if isinstance(e, tuple): e = e[0]
                     if isspan and (isinstance(e, folia.Word) or isinstance(e, folia.Morpheme)):
-                        for candidate in e.findspans(selector.Class, selector.set):
+                        for candidate in e.findspans(selector.Class, selectset):
                             if not selector.filter or  selector.filter(query,candidate, debug):
                                 if debug: print("[FQL EVALUATION DEBUG] Select - Yielding span, single reference: ", repr(candidate),file=sys.stderr)
                                 yield candidate, e
                     elif isspan and isinstance(e, SpanSet):
                         #we take the first item of the span to find the candidates
-                        for candidate in e[0].findspans(selector.Class, selector.set):
+                        for candidate in e[0].findspans(selector.Class, selectset):
                             if not selector.filter or  selector.filter(query,candidate, debug):
                                 #test if all the other elements in the span are in this candidate
                                 matched = True
@@ -500,9 +548,14 @@ class Selector(object):
                         yield e, e
                     else:
                         #print("DEBUG: doing select " + selector.Class.__name__ + " (recurse=" + str(recurse)+") on " + repr(e))
-                        for candidate  in e.select(selector.Class, selector.set, recurse):
+                        if recurse and selector.Class is not folia.Text and len(query.doc.data) == 1 and e is query.doc.data[0]:
+                            #selecting in the sole root element is selecting in the whole document, which can be answered from the select index of the document
+                            candidates = query.doc.select(selector.Class, selectset, recurse)
+                        else:
+                            candidates = e.select(selector.Class, selectset, recurse)
+                        for candidate in candidates:
                             try:
-                                if candidate.changedbyquery is query:
+                                if query.marker and candidate.changedbyquery is query.marker:
                                     #this candidate has been added/modified by the query, don't select it again
                                     continue
                             except AttributeError:
@@ -917,10 +970,14 @@ class Alternative(object):  #AS ALTERNATIVE ... expression
 
     def __call__(self, query, action, focus, target,debug=False):
         """Action delegates to this function"""
-        isspan = isinstance(action.focus.Class, folia.AbstractSpanAnnotation)
+        Class = action.focus.Class
+        if Class is None and focus is not None:
+            Class = focus.__class__ #focus selected by ID
+        assignments = query.assignments.get(id(action), action.assignments) #the set may have been resolved by the action
+        isspan = isinstance(Class, folia.AbstractSpanAnnotation)
 
         subassignments = {} #make a copy
-        for key, value in action.assignments.items():
+        for key, value in assignments.items():
             subassignments[key] = value
         for key, value in self.subassignments.items():
             subassignments[key] = value
@@ -928,7 +985,7 @@ class Alternative(object):  #AS ALTERNATIVE ... expression
         if action.action == "SELECT":
             if not focus: raise QueryError("SELECT requires a focus element")
             if not isspan:
-                for alternative in focus.alternatives(action.focus.Class, focus.set):
+                for alternative in focus.alternatives(Class, focus.set):
                     if not self.filter or (self.filter and self.filter.match(query, alternative, debug)):
                         yield alternative
             else:
@@ -937,11 +994,11 @@ class Alternative(object):  #AS ALTERNATIVE ... expression
             if not isspan:
                 if focus:
                     parent = focus.ancestor(folia.AbstractStructureElement)
-                    alternative = folia.Alternative( query.doc, action.focus.Class( query.doc , **subassignments), **self.assignments)
+                    alternative = folia.Alternative( query.doc, Class( query.doc , **subassignments), **self.assignments)
                     parent.append(alternative)
                     yield alternative
                 else:
-                    alternative = folia.Alternative( query.doc, action.focus.Class( query.doc , **subassignments), **self.assignments)
+                    alternative = folia.Alternative( query.doc, Class( query.doc , **subassignments), **self.assignments)
                     target.append(alternative)
                     yield alternative
             else:
@@ -1035,13 +1092,17 @@ class Correction(object): #AS CORRECTION/SUGGESTION expression...
 
     def __call__(self, query, action, focus, target,debug=False):
         """Action delegates to this function"""
+        Class = action.focus.Class
+        if Class is None and focus is not None:
+            Class = focus.__class__ #focus selected by ID
+        assignments = query.assignments.get(id(action), action.assignments) #the set may have been resolved by the action
         if debug: print("[FQL EVALUATION DEBUG] Correction - Processing ", repr(focus),file=sys.stderr)
 
-        isspan = isinstance(action.focus.Class, folia.AbstractSpanAnnotation)
+        isspan = isinstance(Class, folia.AbstractSpanAnnotation)
 
 
         actionassignments = {} #make a copy
-        for key, value in action.assignments.items():
+        for key, value in assignments.items():
             if key == 'class': key = 'cls'
             actionassignments[key] = value
         for key, value in self.actionassignments.items():
@@ -1049,13 +1110,13 @@ class Correction(object): #AS CORRECTION/SUGGESTION expression...
             actionassignments[key] = value
 
         if actionassignments:
-            if (not 'set' in actionassignments or actionassignments['set'] is None) and action.focus.Class:
+            if (not 'set' in actionassignments or actionassignments['set'] is None) and Class:
                 try:
-                    actionassignments['set'] = query.defaultsets[action.focus.Class.XMLTAG]
+                    actionassignments['set'] = query.defaultsets[Class.XMLTAG]
                 except KeyError:
-                    actionassignments['set'] = query.doc.defaultset(action.focus.Class)
-            if action.focus.Class.REQUIRED_ATTRIBS and folia.Attrib.ID in action.focus.Class.REQUIRED_ATTRIBS:
-                actionassignments['id'] = getrandomid(query, "corrected." + action.focus.Class.XMLTAG + ".")
+                    actionassignments['set'] = query.doc.defaultset(Class)
+            if Class.REQUIRED_ATTRIBS and folia.Attrib.ID in Class.REQUIRED_ATTRIBS:
+                actionassignments['id'] = getrandomid(query, "corrected." + Class.XMLTAG + ".")
 
         kwargs = {}
         if self.set:
@@ -1090,7 +1151,7 @@ class Correction(object): #AS CORRECTION/SUGGESTION expression...
                         inheritchildren.append(w)
 
             if actionassignments:
-                kwargs['new'] = action.focus.Class(query.doc,*inheritchildren, **actionassignments)
+                kwargs['new'] = Class(query.doc,*inheritchildren, **actionassignments)
                 if focus and action.action not in ('PREPEND','APPEND'):
                     kwargs['original'] = focus
                 #TODO: if not bare, fix all span annotation references to this element
@@ -1118,20 +1179,20 @@ class Correction(object): #AS CORRECTION/SUGGESTION expression...
             kwargs['suggestions'] = []
             for subassignments, suggestionassignments in self.suggestions:
                 subassignments = copy(subassignments) #assignment for the element in the suggestion
-                for key, value in action.assignments.items():
+                for key, value in assignments.items():
                     if not key in subassignments:
                         if key == 'class': key = 'cls'
                         subassignments[key] = value
-                if (not 'set' in subassignments or subassignments['set'] is None) and action.focus.Class:
+                if (not 'set' in subassignments or subassignments['set'] is None) and Class:
                     try:
-                        subassignments['set'] = query.defaultsets[action.focus.Class.XMLTAG]
+                        subassignments['set'] = query.defaultsets[Class.XMLTAG]
                     except KeyError:
-                        subassignments['set'] = query.doc.defaultset(action.focus.Class)
+                        subassignments['set'] = query.doc.defaultset(Class)
                 if focus and not self.bare: #copy all data within (we have to do this again for each suggestion as it will generate different ID suffixes)
                     inheritchildren = list(focus.copychildren(query.doc, True))
-                if action.focus.Class.REQUIRED_ATTRIBS and folia.Attrib.ID in action.focus.Class.REQUIRED_ATTRIBS:
+                if Class.REQUIRED_ATTRIBS and folia.Attrib.ID in Class.REQUIRED_ATTRIBS:
                     subassignments['id'] = getrandomid(query, "suggestion.")
-                kwargs['suggestions'].append( folia.Suggestion(query.doc, action.focus.Class(query.doc, *inheritchildren,**subassignments), **suggestionassignments )   )
+                kwargs['suggestions'].append( folia.Suggestion(query.doc, Class(query.doc, *inheritchildren,**subassignments), **suggestionassignments )   )
 
             if action.action == 'PREPEND':
                 index = parent.getindex(target,True) #recursive
@@ -1260,6 +1321,7 @@ class Correction(object): #AS CORRECTION/SUGGESTION expression...
             kwargs['suggestions'] = [] #stuff will be appended
 
         for i, (Class, actionassignments, subactions) in enumerate(substitution['new']):
+            actionassignments = copy(actionassignments) #don't alter the query
             if actionassignments:
                 if (not 'set' in actionassignments or actionassignments['set'] is None):
                     try:
@@ -1277,9 +1339,11 @@ class Correction(object): #AS CORRECTION/SUGGESTION expression...
 
         for subassignments, suggestionassignments in self.suggestions:
             suggestionchildren = []
+            suggestionassignments = copy(suggestionassignments) #don't alter the query
             if 'substitute' in subassignments:
                 #SUBTITUTE (or synonym ADD)
                 action = subassignments['substitute']
+                subassignments = copy(subassignments)
                 del subassignments['substitute']
             else:
                 #we have a suggested deletion
@@ -1287,17 +1351,17 @@ class Correction(object): #AS CORRECTION/SUGGESTION expression...
             if debug: print("[FQL EVALUATION DEBUG] Correction.assemblesuggestions - Adding suggestion",file=sys.stderr)
             while action:
                 subassignments = copy(subassignments) #assignment for the element in the suggestion
-                if isinstance(action.focus, tuple) and len(action.focus) == 2:
-                    action.focus = action.focus[0]
+                focus = action.focus
+                if isinstance(focus, tuple) and len(focus) == 2:
+                    focus = focus[0]
                 for key, value in action.assignments.items():
                     if key == 'class': key = 'cls'
                     subassignments[key] = value
-                if (not 'set' in subassignments or subassignments['set'] is None) and action.focus.Class:
+                if (not 'set' in subassignments or subassignments['set'] is None) and focus.Class:
                     try:
-                        subassignments['set'] = query.defaultsets[action.focus.Class.XMLTAG]
+                        subassignments['set'] = query.defaultsets[focus.Class.XMLTAG]
                     except KeyError:
-                        subassignments['set'] = query.doc.defaultset(action.focus.Class)
-                focus = action.focus
+                        subassignments['set'] = query.doc.defaultset(focus.Class)
                 focus.autodeclare(query.doc)
                 if focus.Class.REQUIRED_ATTRIBS and folia.Attrib.ID in focus.Class.REQUIRED_ATTRIBS:
                     subassignments['id'] = getrandomid(query, "suggestion.")
@@ -1522,7 +1586,10 @@ class Action(object): #Action expression
                 if debug: print("[FQL EVALUATION DEBUG] Action - Evaluating action ", action.action,file=sys.stderr)
                 focusselection = []
                 constrainedtargetselection = [] #selecting focus elements constrains the target selection
-                processed_form = []
+                processed_form = {}
+                #identities of the (non-span) elements in the above selections, so duplicates are detected without scanning the selections
+                focusids = set()
+                targetids = set()
 
                 if substitution and action.action != "SUBSTITUTE":
                     raise QueryError("SUBSTITUTE can not be chained with " + action.action)
@@ -1550,16 +1617,17 @@ class Action(object): #Action expression
                                 if not target.partof(constrainedtargetselection):
                                     if debug: print("[FQL EVALUATION DEBUG] Action - Got target result (spanset), adding ", repr(target),file=sys.stderr)
                                     constrainedtargetselection.append(target)
-                            elif not any(x is target for x in constrainedtargetselection):
+                            elif id(target) not in targetids:
                                 if debug: print("[FQL EVALUATION DEBUG] Action - Got target result, adding ", repr(target),file=sys.stderr)
+                                targetids.add(id(target))
                                 constrainedtargetselection.append(target)
 
 
                         if action.form and action.action != "SUBSTITUTE":
                             #Delegate action to form (= correction or alternative)
-                            if not any(x is focus for x in  processed_form):
+                            if id(focus) not in processed_form:
                                 if debug: print("[FQL EVALUATION DEBUG] Action - Got focus result, processing using form ", repr(focus),file=sys.stderr)
-                                processed_form.append(focus)
+                                processed_form[id(focus)] = focus
                                 focusselection += list(action.form(query, action,focus,target,debug))
                             else:
                                 if debug: print("[FQL EVALUATION DEBUG] Action - Focus result already obtained, skipping... ", repr(focus),file=sys.stderr)
@@ -1572,8 +1640,9 @@ class Action(object): #Action expression
                                 else:
                                     if debug: print("[FQL EVALUATION DEBUG] Action - Focus result (spanset) already obtained, skipping... ", repr(target),file=sys.stderr)
                                     continue
-                            elif not any(x is focus for x in  focusselection):
+                            elif id(focus) not in focusids:
                                 if debug: print("[FQL EVALUATION DEBUG] Action - Got focus result, adding ", repr(focus),file=sys.stderr)
+                                focusids.add(id(focus))
                                 focusselection.append(focus)
                             else:
                                 if debug: print("[FQL EVALUATION DEBUG] Action - Focus result already obtained, skipping... ", repr(focus),file=sys.stderr)
@@ -1595,9 +1664,13 @@ class Action(object): #Action expression
                                     elif attr == "class":
                                         if debug: print("[FQL EVALUATION DEBUG] Action - " + attr +  " = " + value + " on focus ", repr(focus),file=sys.stderr)
                                         focus.cls = value
+                                        focus.cleartextcache() #the text of the focus and its ancestors may depend on the class
                                     else:
                                         if debug: print("[FQL EVALUATION DEBUG] Action - " + attr +  " = " + value + " on focus ", repr(focus),file=sys.stderr)
                                         setattr(focus, attr, value)
+                                        focus.cleartextcache()
+                                        if attr == 'set' and focus.doc:
+                                            focus.doc.clearselectindex() #the select index of the document is keyed on set
                                 if action.span is not None: #respan
                                     if not isinstance(focus, folia.AbstractSpanAnnotation): raise QueryError("Can only perform RESPAN on span annotation elements!")
                                     spanset = next(action.span(query, contextselector, True, debug)) #there can be only one
@@ -1623,6 +1696,7 @@ class Action(object): #Action expression
                                 if debug: print("[FQL EVALUATION DEBUG] Action - Applying SUBSTITUTE to target ", repr(focus),file=sys.stderr)
                                 if not isinstance(target,SpanSet) or not target: raise QueryError("SUBSTITUTE requires a target SPAN")
                                 focusselection.remove(focus)
+                                focusids.discard(id(focus))
 
                                 if not substitution:
                                     #this is the first SUBSTITUTE in a chain
@@ -1653,13 +1727,16 @@ class Action(object): #Action expression
 
                     isspan = issubclass(action.focus.Class, folia.AbstractSpanAnnotation)
                     isspanrole = issubclass(action.focus.Class, folia.AbstractSpanRole)
-                    if 'set' not in action.assignments and action.focus.Class not in (folia.Description, folia.Comment, folia.Feature) and not isspanrole:
+                    #resolve the set against the document, on a copy of the assignments so the query itself is left as is
+                    assignments = copy(action.assignments)
+                    if 'set' not in assignments and action.focus.Class not in (folia.Description, folia.Comment, folia.Feature) and not isspanrole:
                         if action.focus.set and action.focus.set != "undefined":
-                            action.assignments['set'] = action.focus.set
+                            assignments['set'] = action.focus.set
                         elif action.focus.Class.XMLTAG in query.defaultsets:
-                            action.assignments['set'] = action.focus.set = query.defaultsets[action.focus.Class.XMLTAG]
+                            assignments['set'] = query.defaultsets[action.focus.Class.XMLTAG]
                         else:
-                            action.assignments['set'] = action.focus.set = query.doc.defaultset(action.focus.Class)
+                            assignments['set'] = query.doc.defaultset(action.focus.Class)
+                    query.assignments[id(action)] = assignments #for the form, if any
 
 
                     if isinstance(contextselector, tuple) and len(contextselector) == 2:
@@ -1676,33 +1753,34 @@ class Action(object): #Action expression
                                 if action.action == "ADD" or action.action == "EDIT":
                                     if debug: print("[FQL EVALUATION DEBUG] Action - Applying " + action.action + " of " + action.focus.Class.__name__ + " to target spanset " + repr(target),file=sys.stderr)
                                     if action.span is not None and len(action.span) == 0:
-                                        action.assignments['emptyspan'] = True
-                                    focusselection.append( target[0].add(action.focus.Class, *target, **action.assignments) ) #handles span annotation too
+                                        assignments['emptyspan'] = True
+                                    focusselection.append( target[0].add(action.focus.Class, *target, **assignments) ) #handles span annotation too
                                     query._touch(focusselection[-1])
                             else:
                                 if action.action == "ADD" or action.action == "EDIT":
                                     if debug: print("[FQL EVALUATION DEBUG] Action - Applying " + action.action + " of " + action.focus.Class.__name__ + " to target " + repr(target),file=sys.stderr)
-                                    focusselection.append( target.add(action.focus.Class, **action.assignments) ) #handles span annotation too
+                                    focusselection.append( target.add(action.focus.Class, **assignments) ) #handles span annotation too
                                     query._touch(focusselection[-1])
                                 elif action.action == "APPEND":
                                     if debug: print("[FQL EVALUATION DEBUG] Action - Applying " + action.action + " of " + action.focus.Class.__name__ +" to target " + repr(target),file=sys.stderr)
                                     index = target.parent.getindex(target)
                                     if index == -1:
                                         raise QueryError("Insertion point for APPEND action not found")
-                                    focusselection.append( target.parent.insert(index+1, action.focus.Class, **action.assignments) )
+                                    focusselection.append( target.parent.insert(index+1, action.focus.Class, **assignments) )
                                     query._touch(focusselection[-1])
                                 elif action.action == "PREPEND":
                                     if debug: print("[FQL EVALUATION DEBUG] Action - Applying " + action.action + " of " + action.focus.Class.__name__ +" to target " + repr(target),file=sys.stderr)
                                     index = target.parent.getindex(target)
                                     if index == -1:
                                         raise QueryError("Insertion point for PREPEND action not found")
-                                    focusselection.append( target.parent.insert(index, action.focus.Class, **action.assignments) )
+                                    focusselection.append( target.parent.insert(index, action.focus.Class, **assignments) )
                                     query._touch(focusselection[-1])
 
                         if isinstance(target, SpanSet):
                             if not target.partof(constrainedtargetselection):
                                 constrainedtargetselection.append(target)
-                        elif not any(x is target for x in constrainedtargetselection):
+                        elif id(target) not in targetids:
+                            targetids.add(id(target))
                             constrainedtargetselection.append(target)
 
                     if focusselection and action.span: #process SPAN keyword (ADD .. SPAN .. FOR .. rather than ADD ... FOR SPAN ..)
@@ -1778,6 +1856,26 @@ class Context(object):
         self.defaults = {}
         self.defaultsets = {}
 
+class Execution(object):
+    """The state of a single execution of a :class:`Query` on a document.
+
+    The query is the plan and is never written to while it runs, what is resolved against the document is kept here instead. An execution is passed down to the selectors, filters and actions of the query in its place (as their ``query`` argument)."""
+    def __init__(self, query, doc):
+        self.query = query
+        self.doc = doc
+        self.targets = query.targets
+        self.defaultsets = query.defaultsets
+        self.assignments = {} #id(action) -> assignments of the action with the set resolved against the document
+        self.marker = None #identifies elements touched by this execution, created by _touch()
+
+    def _touch(self, *args):
+        if self.marker is None:
+            self.marker = object()
+        for e in args:
+            if isinstance(e, folia.AbstractElement):
+                e.changedbyquery = self.marker
+                self._touch(*e.data)
+
 class Query(object):
     """This class represents an FQL query.
 
@@ -1894,9 +1992,10 @@ class Query(object):
             raise SyntaxError("Expected end of query, got " + str(q[i]) + " in: " + str(q))
 
     def __call__(self, doc, wrap=True,debug=False):
-        """Execute the query on the specified document"""
+        """Execute the query on the specified document.
 
-        self.doc = doc
+        Everything that is resolved against the document during execution is kept in an :class:`Execution`, the query itself is never altered, so the same query (see :func:`prepare`) can be executed on any number of documents, also concurrently."""
+        execution = Execution(self, doc)
 
         if debug: print("[FQL EVALUATION DEBUG] Query  - Starting on document ", doc.id,file=sys.stderr)
 
@@ -1908,9 +2007,9 @@ class Query(object):
         if self.action:
             targetselector = doc
             if self.targets and not (isinstance(self.targets.targets[0], Selector) and self.targets.targets[0].Class in ("ALL", folia.Text)):
-                targetselector = (self.targets, (self, targetselector, True, debug)) #function recipe to get the generator for the targets, (f, *args) (first is always recursive)
+                targetselector = (self.targets, (execution, targetselector, True, debug)) #function recipe to get the generator for the targets, (f, *args) (first is always recursive)
 
-            focusselection, targetselection = self.action(self, targetselector, debug) #selecting focus elements further constrains the target selection (if any), return values will be lists
+            focusselection, targetselection = self.action(execution, targetselector, debug) #selecting focus elements further constrains the target selection (if any), return values will be lists
 
             if self.returntype == "nothing":
                 return ""
@@ -2030,12 +2129,100 @@ class Query(object):
 
         return QueryError("Invalid format: " + self.format)
 
-    def _touch(self, *args):
-        for e in args:
-            if isinstance(e, folia.AbstractElement):
-                e.changedbyquery = self
-                self._touch(*e.data)
 
+def prepare(q, context=None):
+    """Returns a :class:`Query` for the specified FQL query string, which can be executed on any number of documents.
+
+    Prepared queries are kept in a cache (holding the :data:`PREPAREDCACHESIZE` most recently used ones) keyed by the query string and the context, so preparing a query that has been prepared before requires no parsing. Executing a query does not alter it (see :meth:`Query.__call__`), so a prepared query may be shared freely, also between threads.
+
+    Example::
+
+        for doc in docs:
+            for word in fql.prepare('SELECT w WHERE text = "house"')(doc):
+                print(word)
+    """
+    if context is None:
+        context = Context()
+    key = (q, context.format, context.returntype, tuple(context.request) if isinstance(context.request, list) else context.request, tuple(sorted(context.defaults.items())), tuple(sorted(context.defaultsets.items())))
+    try:
+        query = PREPAREDCACHE.pop(key)
+    except KeyError:
+        query = Query(q, context)
+        while len(PREPAREDCACHE) >= PREPAREDCACHESIZE:
+            PREPAREDCACHE.popitem(last=False)
+    PREPAREDCACHE[key] = query
+    return query
+
+
+def run_corpus(query, files, workers=None, mode='read', context=None, ordered=True, chunksize=1, maxtasksperchild=100, ignoreerrors=False, **kwargs):
+    """Executes an FQL query on all documents of a corpus, optionally in parallel, and yields a ``(filename, result)`` tuple for each document.
+
+    Arguments:
+        query (str): The FQL query, it is parsed only once in every worker (see :func:`prepare`)
+        files: An iterable of filenames, or a directory holding the documents (read using :class:`pynlpl.formats.folia.CorpusFiles`, i.e. including its direct subdirectories)
+        workers (int): Execute the query in this many worker processes (default: ``None``, sequential processing in the current process)
+        mode (str): ``read`` (default) only executes the query, ``edit`` also saves each document after executing the query on it. The modified document is first written to a temporary file next to the original, which then atomically replaces it.
+        context (:class:`Context`): The context for the query
+        ordered (bool): When using workers, yield in corpus order (default). If set to ``False``, yield in order of completion instead, so results are streamed back as soon as they are available.
+        chunksize (int): When using workers, the number of documents to send to a worker at once
+        maxtasksperchild (int): When using workers, the number of tasks after which a worker is replaced by a fresh one (lxml may leak memory)
+        ignoreerrors (bool): Print an error and continue with the next document if the query can not be executed on a document
+        **kwargs: All other keyword arguments are passed to the :class:`pynlpl.formats.folia.Document` constructor
+
+    The result is whatever the query returns in the requested format (see the ``FORMAT`` keyword). Elements can not be sent back from worker processes, so in the ``python`` and ``single-python`` formats each resulting element is returned as an XML fragment (a list of fragments for span sets) instead; this applies also when not using workers, so results do not depend on the number of workers.
+
+    Example::
+
+        for filename, results in fql.run_corpus('SELECT w WHERE text = "house" FORMAT xml', '/path/to/corpus', workers=8):
+            ..
+    """
+    if mode not in ('read', 'edit'):
+        raise ValueError("Invalid mode, expected read or edit, got " + str(mode))
+    if isstring(files) and os.path.isdir(files):
+        files = folia.CorpusFiles(files)
 
+    for filename, result in parallelmap(corpusworker, files, workers, initcorpusworker, (query, context, mode, kwargs), ordered, chunksize, maxtasksperchild, errormessage="Error, unable to execute query on", ignoreerrors=ignoreerrors):
+        yield filename, result
 
 
+def executefile(query, filename, mode, kwargs):
+    """Internal function, executes a query on a single document for :func:`run_corpus` and returns the result"""
+    doc = folia.Document(file=filename, **kwargs)
+    result = query(doc)
+    if mode == 'edit':
+        tmpfilename = os.path.join(os.path.dirname(filename), '.' + str(os.getpid()) + '.' + os.path.basename(filename)) #keep the extension, it determines the compression
+        try:
+            doc.save(tmpfilename)
+            if hasattr(os, 'replace'):
+                os.replace(tmpfilename, filename)
+            else:
+                os.rename(tmpfilename, filename) #atomic on POSIX only
+        except:
+            if os.path.exists(tmpfilename):
+                os.unlink(tmpfilename)
+            raise
+    if query.format == 'single-python':
+        result = fragment(result) if result is not None else None
+    elif query.format not in ('single-xml', 'single-json', 'xml', 'json') and isinstance(result, list):
+        result = [ fragment(e) for e in result ]
+    return result
+
+def fragment(e):
+    """Internal function, returns the XML fragment for a result element (a list of fragments for span sets)"""
+    if isinstance(e, SpanSet):
+        return [ e2.xmlstring(True) for e2 in e ]
+    else:
+        return e.xmlstring(True)
+
+
+CORPUSWORKER = {} #state of a worker process of run_corpus(), set up by initcorpusworker()
+
+def initcorpusworker(query, context, mode, kwargs):
+    """Internal function, initialises a worker process for :func:`run_corpus`"""
+    CORPUSWORKER['query'] = prepare(query, context)
+    CORPUSWORKER['mode'] = mode
+    CORPUSWORKER['kwargs'] = kwargs
+
+def corpusworker(filename):
+    """Internal function, executes the query on a single document in a worker process for :func:`run_corpus`. Returns a ``(filename, result)`` tuple."""
+    return filename, executefile(CORPUSWORKER['query'], filename, CORPUSWORKER['mode'], CORPUSWORKER['kwargs'])
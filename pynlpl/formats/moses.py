@@ -20,17 +20,28 @@ from __future__ import unicode_literals
 from __future__ import division
 from __future__ import absolute_import
 
-from pynlpl.common import u
+from pynlpl.common import u, parallelmap
 
 import sys
+import os
 import bz2
 import gzip
 import datetime
 import socket
+import threading
 import io
+import mmap
+import struct
+import heapq
+import itertools
+import shutil
+import tempfile
+import gc
+from array import array
+from collections import OrderedDict
 
 try:
-    from twisted.internet import protocol, reactor #No Python 3 support yet :(
+    from twisted.internet import protocol, reactor
     from twisted.protocols import basic
     twistedimported = True
 except:
@@ -38,82 +49,118 @@ except:
     twistedimported = False
 
 
-class PhraseTable(object):
-    def __init__(self,filename, quiet=False, reverse=False, delimiter="|||", score_column = 3, max_sourcen = 0,sourceencoder=None, targetencoder=None, scorefilter=None):
-        """Load a phrase table from file into memory (memory intensive!)"""
-        self.phrasetable = {}
-        self.sourceencoder = sourceencoder
-        self.targetencoder = targetencoder
-
-
-        if filename.split(".")[-1] == "bz2":
-            f = bz2.BZ2File(filename,'r')
-        elif filename.split(".")[-1] == "gz":
-            f = gzip.GzipFile(filename,'r')
+PHRASETABLEMAGIC = b'PyNLPl-phrasetable'
+PHRASETABLEVERSION = 1
+PHRASETABLEHEADER = struct.Struct(str('<18sIQQ')) #magic, version, number of source phrases, offset of the index
+PHRASETABLEINDEX = struct.Struct(str('<QII')) #offset of the record, length of the source phrase, length of the targets
+PHRASETABLETARGET = struct.Struct(str('<IH')) #length of the target phrase, number of scores
+
+
+def readphrasetable(filename, quiet=False, reverse=False, delimiter="|||", score_column = 3, max_sourcen = 0, scorefilter=None):
+    """Reads a Moses phrase table (plain, gzip or bzip2 compressed) and yields (source, target, scores) tuples, in the order of the file"""
+    if filename.split(".")[-1] == "bz2":
+        f = bz2.BZ2File(filename,'r')
+    elif filename.split(".")[-1] == "gz":
+        f = gzip.GzipFile(filename,'r')
+    else:
+        f = io.open(filename,'r',encoding='utf-8')
+    linenum = 0
+
+    while True:
+        if not quiet:
+            linenum += 1
+            if (linenum % 100000) == 0:
+                print("Loading phrase-table: @%d" % linenum, "\t(" + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ")",file=sys.stderr)
+        line = u(f.readline())
+        if not line:
+            break
+
+        #split into (trimmed) segments
+        segments = [ segment.strip() for segment in line.split(delimiter) ]
+
+        if len(segments) < 3:
+            print("Invalid line: ", line, file=sys.stderr)
+            continue
+
+        #Do we have a score associated?
+        if score_column > 0 and len(segments) >= score_column:
+            scores = tuple( ( float(x) for x in segments[score_column-1].strip().split() ) )
         else:
-            f = io.open(filename,'r',encoding='utf-8')
-        linenum = 0
-        prevsource = None
-        targets = []
+            scores = tuple()
 
-        while True:
-            if not quiet:
-                linenum += 1
-                if (linenum % 100000) == 0:
-                    print("Loading phrase-table: @%d" % linenum, "\t(" + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ")",file=sys.stderr)
-            line = u(f.readline())
-            if not line:
-                break
+        #if align2_column > 0:
+        #    try:
+        #        null_alignments = segments[align2_column].count("()")
+        #    except:
+        #        null_alignments = 0
+        #else:
+        #    null_alignments = 0
 
-            #split into (trimmed) segments
-            segments = [ segment.strip() for segment in line.split(delimiter) ]
+        if scorefilter:
+            if not scorefilter(scores): continue
 
-            if len(segments) < 3:
-                print("Invalid line: ", line, file=sys.stderr)
+        if reverse:
+            if max_sourcen > 0 and segments[1].count(' ') + 1 > max_sourcen:
+                continue
+            yield segments[1], segments[0], scores
+        else:
+            if max_sourcen > 0 and segments[0].count(' ') + 1 > max_sourcen:
                 continue
+            yield segments[0], segments[1], scores
 
-            #Do we have a score associated?
-            if score_column > 0 and len(segments) >= score_column:
-                scores = tuple( ( float(x) for x in segments[score_column-1].strip().split() ) )
-            else:
-                scores = tuple()
+    f.close()
 
-            #if align2_column > 0:
-            #    try:
-            #        null_alignments = segments[align2_column].count("()")
-            #    except:
-            #        null_alignments = 0
-            #else:
-            #    null_alignments = 0
 
-            if scorefilter:
-                if not scorefilter(scores): continue
+class PhraseTable(object):
+    def __init__(self,filename, quiet=False, reverse=False, delimiter="|||", score_column = 3, max_sourcen = 0,sourceencoder=None, targetencoder=None, scorefilter=None, backend='dict', workers=None, keepscores=None, compactscores=False):
+        """Load a phrase table from file into memory (memory intensive!)
 
-            if reverse:
-                if max_sourcen > 0 and segments[1].count(' ') + 1 > max_sourcen:
-                    continue
+        Uncompressed phrase tables can be loaded in parallel by setting ``workers`` to the number of worker processes: the file is split into as many byte ranges (aligned to the boundaries between source phrases), which are parsed by the workers and then merged. The encoders and score filter are then called in the worker processes.
 
-                if self.sourceencoder:
-                    source = self.sourceencoder(segments[1]) #tuple(segments[1].split(" "))
-                else:
-                    source = segments[1]
-                if self.targetencoder:
-                    target = self.targetencoder(segments[0]) #tuple(segments[0].split(" "))
-                else:
-                    target = segments[0]
-            else:
-                if max_sourcen > 0 and segments[0].count(' ') + 1 > max_sourcen:
-                    continue
+        Memory can be saved by keeping only some of the scores: ``keepscores`` is a list of the indices of the scores to keep (the score filter still receives all scores), and with ``compactscores`` the scores are stored as an ``array('f')`` (single precision) instead of a tuple of floats.
 
-                if self.sourceencoder:
-                    source = self.sourceencoder(segments[0]) #tuple(segments[0].split(" "))
-                else:
-                    source = segments[0]
-                if self.targetencoder:
-                    target = self.targetencoder(segments[1]) #tuple(segments[1].split(" "))
-                else:
-                    target = segments[1]
+        With ``backend='mmap'``, the file is instead a phrase table compiled by :func:`compilephrasetable`, which is memory-mapped and searched on disk (see :class:`MappedPhraseTable`). Loading is then instantaneous and the table is shared (through the page cache) by all processes using it. The phrase table options (``reverse``, ``delimiter``, ``score_column``, ``max_sourcen``, ``scorefilter``) apply when compiling and are ignored here. Phrases are looked up as strings; the ``sourceencoder`` only applies to the phrases yielded when iterating."""
+        self.sourceencoder = sourceencoder
+        self.targetencoder = targetencoder
+        self.backend = backend
+
+        if backend == 'mmap':
+            self.phrasetable = MappedPhraseTable(filename, sourceencoder, targetencoder)
+            return
+        elif backend != 'dict':
+            raise ValueError("Invalid backend, expected dict or mmap, got " + str(backend))
+
+        options = (reverse, delimiter, score_column, max_sourcen, sourceencoder, targetencoder, scorefilter, keepscores, compactscores)
+        if filename.split(".")[-1] not in ("bz2","gz"):
+            #uncompressed, parse directly or, when using workers, in (byte range) chunks
+            if not workers:
+                self.phrasetable = readphrasetablechunk(filename, 0, os.path.getsize(filename), *options, quiet=quiet)
+                return
+            self.phrasetable = {}
+            chunks = phrasetablechunks(filename, workers, delimiter, reverse)
+            gcenabled = gc.isenabled()
+            gc.disable() #don't let the garbage collector scan everything we receive from the workers, needlessly
+            try:
+                for i, phrasetable in enumerate(parallelmap(phrasetableworker, chunks, workers, initphrasetableworker, (filename, options))): #in order, so later occurrences of a source phrase replace earlier ones, as when loading sequentially
+                    if not quiet: print("Loading phrase-table: merging chunk %d of %d" % (i+1, len(chunks)), "\t(" + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ")",file=sys.stderr)
+                    self.phrasetable.update(phrasetable)
+            finally:
+                if gcenabled: gc.enable()
+            return
 
+        self.phrasetable = {}
+        prevsource = None
+        targets = []
+
+        for source, target, scores in readphrasetable(filename, quiet, reverse, delimiter, score_column, max_sourcen, scorefilter):
+            if self.sourceencoder:
+                source = self.sourceencoder(source) #tuple(source.split(" "))
+            if self.targetencoder:
+                target = self.targetencoder(target) #tuple(target.split(" "))
+            if keepscores is not None:
+                scores = tuple( scores[i] for i in keepscores )
+            if compactscores:
+                scores = array('f', scores)
 
             if prevsource and source != prevsource and targets:
                 self.phrasetable[prevsource] = tuple(targets)
@@ -126,12 +173,10 @@ class PhraseTable(object):
         if prevsource and targets:
             self.phrasetable[prevsource] = tuple(targets)
 
-        f.close()
-
 
     def __contains__(self, phrase):
         """Query if a certain phrase exist in the phrase table"""
-        if self.sourceencoder: phrase = self.sourceencoder(phrase)
+        if self.sourceencoder and self.backend == 'dict': phrase = self.sourceencoder(phrase)
         return (phrase in self.phrasetable)
         #d = self.phrasetable
         #for word in phrase:
@@ -152,7 +197,7 @@ class PhraseTable(object):
 
     def __getitem__(self, phrase): #same as translations
         """Return a list of (translation, scores) tuples"""
-        if self.sourceencoder: phrase = self.sourceencoder(phrase)
+        if self.sourceencoder and self.backend == 'dict': phrase = self.sourceencoder(phrase)
         return self.phrasetable[phrase]
 
 
@@ -167,14 +212,328 @@ class PhraseTable(object):
         #else:
         #    raise KeyError
 
+
+def phrasetablechunks(filename, n, delimiter="|||", reverse=False):
+    """Splits an uncompressed phrase table into (at most) n byte ranges of roughly equal size, such that all lines of a source phrase fall within the same range. Returns a list of (begin, end) tuples."""
+    delimiter = delimiter.encode('utf-8')
+    sourcefield = 1 if reverse else 0
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, n):
+            offset = size * i // n
+            if offset <= boundaries[-1]:
+                continue
+            f.seek(offset)
+            f.readline() #skip to the start of the next line
+            source = None
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                segments = line.split(delimiter)
+                if len(segments) > sourcefield:
+                    if source is not None and segments[sourcefield].strip() != source:
+                        break
+                    source = segments[sourcefield].strip()
+            if offset >= size:
+                break
+            boundaries.append(offset)
+    boundaries.append(size)
+    return [ (begin, end) for begin, end in zip(boundaries[:-1], boundaries[1:]) if end > begin ]
+
+def readphrasetablechunk(filename, begin, end, reverse=False, delimiter="|||", score_column = 3, max_sourcen = 0,sourceencoder=None, targetencoder=None, scorefilter=None, keepscores=None, compactscores=False, quiet=True):
+    """Parses the specified byte range of an uncompressed phrase table (see :func:`phrasetablechunks`) and returns it as a dictionary, as loaded by :class:`PhraseTable`. Unless quiet, the progress is reported on stderr every 100000 lines."""
+    gcenabled = gc.isenabled()
+    gc.disable() #the cyclic garbage collector would repeatedly scan all the tuples we create, needlessly
+    try:
+        lines = readphrasetablelines(filename, begin, end)
+        if not quiet:
+            lines = phrasetableprogress(lines)
+        return parsephrasetablelines(lines, reverse, delimiter, score_column, max_sourcen, sourceencoder, targetencoder, scorefilter, keepscores, compactscores)
+    finally:
+        if gcenabled: gc.enable()
+
+def readphrasetablelines(filename, begin, end, blocksize=16*1024*1024):
+    """Internal function, yields the lines in the specified byte range of an uncompressed phrase table, decoding a block at a time rather than line by line"""
+    with open(filename, 'rb') as f:
+        f.seek(begin)
+        remaining = end - begin
+        rest = b""
+        while remaining > 0:
+            block = f.read(min(blocksize, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            block = rest + block
+            if remaining > 0:
+                #hold back the last (partial) line, it is completed by the next block
+                cut = block.rfind(b"\n") + 1
+                rest = block[cut:]
+                block = block[:cut]
+            else:
+                rest = b""
+            for line in block.decode('utf-8').split('\n'):
+                yield line
+        if rest: #file was truncated
+            yield rest.decode('utf-8')
+
+def phrasetableprogress(lines, interval=100000):
+    """Internal function, passes the lines through while reporting the progress of loading a phrase table on stderr"""
+    for linenum, line in enumerate(lines, 1):
+        if (linenum % interval) == 0:
+            print("Loading phrase-table: @%d" % linenum, "\t(" + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ")",file=sys.stderr)
+        yield line
+
+def parsephrasetablelines(lines, reverse, delimiter, score_column, max_sourcen, sourceencoder, targetencoder, scorefilter, keepscores, compactscores):
+    """Internal function, does the actual parsing for :func:`readphrasetablechunk`"""
+    phrasetable = {}
+    prevsource = None
+    targets = []
+    sourcefield, targetfield = (1, 0) if reverse else (0, 1)
+    scorefield = score_column - 1
+    for line in lines:
+        if not line:
+            continue
+        segments = line.split(delimiter)
+        if len(segments) < 3:
+            print("Invalid line: ", line, file=sys.stderr)
+            continue
+
+        source = segments[sourcefield].strip()
+        if max_sourcen > 0 and source.count(' ') + 1 > max_sourcen:
+            continue
+
+        if score_column > 0 and len(segments) >= score_column:
+            scores = segments[scorefield].split()
+            if scorefilter:
+                scores = tuple(map(float, scores))
+                if not scorefilter(scores): continue
+                if keepscores is not None:
+                    scores = [ scores[i] for i in keepscores ]
+            elif keepscores is not None:
+                scores = [ float(scores[i]) for i in keepscores ] #no need to convert the other scores
+            else:
+                scores = map(float, scores)
+        else:
+            if scorefilter and not scorefilter(()): continue
+            scores = ()
+        scores = array('f', scores) if compactscores else tuple(scores)
+
+        target = segments[targetfield].strip()
+        if sourceencoder: source = sourceencoder(source)
+        if targetencoder: target = targetencoder(target)
+
+        if prevsource and source != prevsource and targets:
+            phrasetable[prevsource] = tuple(targets)
+            targets = []
+
+        targets.append( (target,scores) )
+        prevsource = source
+
+    #don't forget last one:
+    if prevsource and targets:
+        phrasetable[prevsource] = tuple(targets)
+    return phrasetable
+
+
+PHRASETABLEWORKER = {} #state of a worker process loading a phrase table, set up by initphrasetableworker()
+
+def initphrasetableworker(filename, options):
+    """Internal function, initialises a worker process for loading a phrase table in parallel"""
+    PHRASETABLEWORKER['filename'] = filename
+    PHRASETABLEWORKER['options'] = options
+
+def phrasetableworker(chunk):
+    """Internal function, parses a chunk of a phrase table in a worker process"""
+    begin, end = chunk
+    return readphrasetablechunk(PHRASETABLEWORKER['filename'], begin, end, *PHRASETABLEWORKER['options'])
+
+
+def compilephrasetable(filename, outputfilename, quiet=False, reverse=False, delimiter="|||", score_column = 3, max_sourcen = 0, scorefilter=None, buffersize=1000000, tmpdir=None):
+    """Compiles a Moses phrase table (plain, gzip or bzip2 compressed, sorted or not) into an indexed binary file that can be opened with ``PhraseTable(outputfilename, backend='mmap')``.
+
+    The entries are sorted on their source phrase using an external merge sort: at most ``buffersize`` entries are held in memory at once, larger tables are sorted in runs that are stored in temporary files (in ``tmpdir``) and merged afterwards. All targets of a source phrase are kept, in the order they occur in the file. The other arguments are as for :class:`PhraseTable`.
+    """
+    runs = []
+    buffer = []
+    try:
+        for i, (source, target, scores) in enumerate(readphrasetable(filename, quiet, reverse, delimiter, score_column, max_sourcen, scorefilter)):
+            buffer.append( (source.encode('utf-8'), i, encodephrasetabletarget(target, scores)) )
+            if len(buffer) >= buffersize:
+                buffer.sort()
+                runs.append(writephrasetablerun(buffer, tmpdir))
+                buffer = []
+        buffer.sort()
+        if runs:
+            runs.append(writephrasetablerun(buffer, tmpdir))
+            entries = heapq.merge(*[ readphrasetablerun(run) for run in runs ])
+        else:
+            entries = iter(buffer)
+
+        with open(outputfilename, 'wb') as f, tempfile.TemporaryFile(dir=tmpdir) as index:
+            f.write(PHRASETABLEHEADER.pack(PHRASETABLEMAGIC, PHRASETABLEVERSION, 0, 0))
+            count = 0
+            offset = PHRASETABLEHEADER.size
+            for source, group in itertools.groupby(entries, lambda entry: entry[0]):
+                targets = b"".join( entry[2] for entry in group )
+                f.write(source)
+                f.write(targets)
+                index.write(PHRASETABLEINDEX.pack(offset, len(source), len(targets)))
+                offset += len(source) + len(targets)
+                count += 1
+            index.seek(0)
+            shutil.copyfileobj(index, f)
+            f.seek(0)
+            f.write(PHRASETABLEHEADER.pack(PHRASETABLEMAGIC, PHRASETABLEVERSION, count, offset))
+    finally:
+        for run in runs:
+            os.unlink(run)
+
+def encodephrasetabletarget(target, scores):
+    """Internal function, returns the binary representation of a target and its scores in a compiled phrase table"""
+    target = target.encode('utf-8')
+    return PHRASETABLETARGET.pack(len(target), len(scores)) + target + struct.pack(str('<%dd' % len(scores)), *scores)
+
+def writephrasetablerun(entries, tmpdir=None):
+    """Internal function, writes a sorted run of entries for :func:`compilephrasetable` to a temporary file and returns its filename"""
+    fd, filename = tempfile.mkstemp(dir=tmpdir)
+    with os.fdopen(fd, 'wb') as f:
+        for source, i, target in entries:
+            f.write(struct.pack(str('<IQI'), len(source), i, len(target)))
+            f.write(source)
+            f.write(target)
+    return filename
+
+def readphrasetablerun(filename):
+    """Internal function, yields the entries of a run written by :func:`writephrasetablerun`"""
+    entry = struct.Struct(str('<IQI'))
+    with open(filename, 'rb') as f:
+        while True:
+            header = f.read(entry.size)
+            if not header:
+                break
+            sourcelength, i, targetlength = entry.unpack(header)
+            yield f.read(sourcelength), i, f.read(targetlength)
+
+
+class MappedPhraseTable(object):
+    """A phrase table compiled by :func:`compilephrasetable`, memory-mapped rather than loaded. Phrases are found by binary search on the index of the file, so a lookup takes O(log n) page reads. Normally used through ``PhraseTable(filename, backend='mmap')``."""
+
+    def __init__(self, filename, sourceencoder=None, targetencoder=None):
+        self.sourceencoder = sourceencoder
+        self.targetencoder = targetencoder
+        self.file = open(filename, 'rb')
+        try:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: #empty file
+            self.file.close()
+            raise ValueError("Not a compiled phrase table: " + filename)
+        magic, version, self.count, self.indexoffset = PHRASETABLEHEADER.unpack_from(self.mmap, 0)
+        if magic != PHRASETABLEMAGIC:
+            self.close()
+            raise ValueError("Not a compiled phrase table (see compilephrasetable()): " + filename)
+        elif version != PHRASETABLEVERSION:
+            self.close()
+            raise ValueError("Compiled phrase table " + filename + " has version " + str(version) + ", expected " + str(PHRASETABLEVERSION) + ", please compile it again")
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+    def find(self, phrase):
+        """Returns the offset and length of the targets of the specified phrase, or ``None`` if it is not in the phrase table"""
+        if not isinstance(phrase, bytes):
+            phrase = phrase.encode('utf-8')
+        begin = 0
+        end = self.count
+        while begin < end:
+            middle = (begin + end) // 2
+            offset, sourcelength, targetslength = PHRASETABLEINDEX.unpack_from(self.mmap, self.indexoffset + middle * PHRASETABLEINDEX.size)
+            source = self.mmap[offset:offset+sourcelength]
+            if source < phrase:
+                begin = middle + 1
+            elif source > phrase:
+                end = middle
+            else:
+                return offset + sourcelength, targetslength
+        return None
+
+    def targets(self, offset, length):
+        """Decodes the targets at the specified offset, returns a tuple of (target, scores) tuples"""
+        targets = []
+        end = offset + length
+        while offset < end:
+            targetlength, scorecount = PHRASETABLETARGET.unpack_from(self.mmap, offset)
+            offset += PHRASETABLETARGET.size
+            target = self.mmap[offset:offset+targetlength].decode('utf-8')
+            offset += targetlength
+            scores = struct.unpack_from(str('<%dd' % scorecount), self.mmap, offset)
+            offset += 8 * scorecount
+            if self.targetencoder:
+                target = self.targetencoder(target)
+            targets.append( (target, scores) )
+        return tuple(targets)
+
+    def __contains__(self, phrase):
+        return self.find(phrase) is not None
+
+    def __getitem__(self, phrase):
+        found = self.find(phrase)
+        if found is None:
+            raise KeyError(phrase)
+        return self.targets(*found)
+
+    def items(self):
+        for i in range(0, self.count):
+            offset, sourcelength, targetslength = PHRASETABLEINDEX.unpack_from(self.mmap, self.indexoffset + i * PHRASETABLEINDEX.size)
+            source = self.mmap[offset:offset+sourcelength].decode('utf-8')
+            if self.sourceencoder:
+                source = self.sourceencoder(source)
+            yield source, self.targets(offset + sourcelength, targetslength)
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
 if twistedimported:
     class PTProtocol(basic.LineReceiver):
-        def lineReceived(self, phrase):
-            try:
-                for target,Pst,Pts,null_alignments in self.factory.phrasetable[phrase]:
-                    self.sendLine(target+"\t"+str(Pst)+"\t"+str(Pts)+"\t"+str(null_alignments))
-            except KeyError:
-                self.sendLine("NOTFOUND")
+        """Answers phrase table queries, one source phrase per line.
+
+        A single phrase is answered with a line per target phrase (the target and its scores, tab-separated), or NOTFOUND. This is ambiguous to a client that sends several queries without waiting for the answers, so for pipelining, clients send a ``BATCH<tab>n`` line followed by n phrases. Each of these is answered by either ``FOUND<tab>m`` followed by m target lines, or ``NOTFOUND``; the answer to a whole batch is written at once."""
+
+        def connectionMade(self):
+            self.batch = 0
+            self.response = []
+
+        def lineReceived(self, line):
+            phrase = line.decode('utf-8')
+            if self.batch:
+                self.batch -= 1
+                try:
+                    targets = self.targets(phrase)
+                    self.response.append(b"FOUND\t" + str(len(targets)).encode('ascii') + b"\r\n")
+                    self.response += [ target + b"\r\n" for target in targets ]
+                except KeyError:
+                    self.response.append(b"NOTFOUND\r\n")
+                if not self.batch:
+                    self.transport.writeSequence(self.response)
+                    self.response = []
+            elif phrase.startswith("BATCH\t"):
+                self.batch = int(phrase[6:])
+            else:
+                try:
+                    for target in self.targets(phrase):
+                        self.sendLine(target)
+                except KeyError:
+                    self.sendLine(b"NOTFOUND")
+
+        def targets(self, phrase):
+            """Returns the encoded target lines for the phrase, raises KeyError if it is not in the phrase table"""
+            return [ (target + "\t" + " ".join(repr(score) for score in scores)).encode('utf-8') for target, scores in self.factory.phrasetable[phrase] ]
 
     class PTFactory(protocol.ServerFactory):
         protocol = PTProtocol
@@ -190,61 +549,152 @@ if twistedimported:
 
 
 class PhraseTableClient(object):
-
-    def __init__(self,host= "localhost",port=65432):
-        self.BUFSIZE = 4048
-        self.socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM) #Create the socket
-        self.socket.settimeout(120)
-        self.socket.connect((host, port)) #Connect to server
-        self.lastresponse = ""
-        self.lastquery = ""
-
-    def __getitem__(self, phrase):
-        solutions = []
-        if phrase != self.lastquery:
-            self.socket.send(phrase+ "\r\n")
-
-            data = b""
-            while not data or data[-1] != '\n':
-                data += self.socket.recv(self.BUFSIZE)
-        else:
-            data = self.lastresponse
-
-        data = u(data)
-
-        for line in data.split('\n'):
-            line = line.strip('\r\n')
-            if line == "NOTFOUND":
-                raise KeyError(phrase)
-            elif line:
-                fields = tuple(line.split("\t"))
-                if len(fields) == 4:
-                    solutions.append( fields )
+    """Client for a :class:`PhraseTableServer`. Phrases are looked up like in a :class:`PhraseTable`, returning a tuple of (target, scores) tuples.
+
+    Lookups go over a pool of at most ``poolsize`` persistent connections, so a client can be shared by multiple threads. Answers are kept in a least-recently-used cache of ``cachesize`` phrases (0 disables it). Use :meth:`lookup_many` to look up many phrases at once: they are sent in batches of ``batchsize`` phrases, pipelined over one connection."""
+
+    def __init__(self,host= "localhost",port=65432, poolsize=4, cachesize=10000, batchsize=1000, timeout=120):
+        self.pool = PhraseTableConnectionPool(host, port, poolsize, timeout)
+        self.pool.release(self.pool.acquire()) #connect now, so we fail early
+        self.cache = OrderedDict()
+        self.cachesize = cachesize
+        self.cachelock = threading.Lock()
+        self.batchsize = batchsize
+
+    def lookup_many(self, phrases):
+        """Looks up all the phrases and returns a list with, for each phrase, a tuple of (target, scores) tuples, or None if the phrase is not in the phrase table"""
+        found = {}
+        query = []
+        with self.cachelock:
+            for phrase in phrases:
+                if phrase in found:
+                    continue
+                elif phrase in self.cache:
+                    found[phrase] = self.cache.pop(phrase)
+                    self.cache[phrase] = found[phrase] #most recently used now
                 else:
-                    print >>sys.stderr,"PHRASETABLECLIENT WARNING: Unable to parse response line"
+                    found[phrase] = None
+                    query.append(phrase)
 
-        self.lastresponse = data
-        self.lastquery = phrase
+        if query:
+            connection = self.pool.acquire()
+            try:
+                for phrase, targets in zip(query, connection.lookup(query, self.batchsize)):
+                    found[phrase] = targets
+            except:
+                self.pool.discard(connection) #we can't tell what state the connection is in
+                raise
+            self.pool.release(connection)
+
+            if self.cachesize:
+                with self.cachelock:
+                    for phrase in query:
+                        self.cache[phrase] = found[phrase]
+                    while len(self.cache) > self.cachesize:
+                        self.cache.popitem(last=False)
+
+        return [ found[phrase] for phrase in phrases ]
 
-        return solutions
+    def __getitem__(self, phrase):
+        targets = self.lookup_many([phrase])[0]
+        if targets is None:
+            raise KeyError(phrase)
+        return targets
 
     def __contains__(self, phrase):
-        self.socket.send(phrase.encode('utf-8')+ b"\r\n")\
-
-
-        data = b""
-        while not data or data[-1] != '\n':
-            data += self.socket.recv(self.BUFSIZE)
-
-        data = u(data)
-
-        for line in data.split('\n'):
-            line = line.strip('\r\n')
-            if line == "NOTFOUND":
-                return False
-
-        self.lastresponse = data
-        self.lastquery = phrase
+        return self.lookup_many([phrase])[0] is not None
+
+    def close(self):
+        self.pool.close()
+
+
+class PhraseTableConnectionPool(object):
+    """Thread-safe pool of (at most ``size``) persistent connections to a :class:`PhraseTableServer`, used by :class:`PhraseTableClient`"""
+
+    def __init__(self, host, port, size=4, timeout=120):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+        self.available = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        """Returns an idle connection, or a new one. Blocks if all connections are in use."""
+        self.available.acquire()
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        try:
+            return PhraseTableConnection(self.host, self.port, self.timeout)
+        except:
+            self.available.release()
+            raise
+
+    def release(self, connection):
+        """Returns a connection to the pool"""
+        with self.lock:
+            self.idle.append(connection)
+        self.available.release()
+
+    def discard(self, connection):
+        """Closes a connection that can not be reused, instead of returning it to the pool"""
+        connection.close()
+        self.available.release()
+
+    def close(self):
+        """Closes all idle connections"""
+        with self.lock:
+            for connection in self.idle:
+                connection.close()
+            self.idle = []
+
+
+class PhraseTableConnection(object):
+    """A connection to a :class:`PhraseTableServer`, see :class:`PhraseTableConnectionPool`"""
+
+    def __init__(self, host, port, timeout=120):
+        self.socket = socket.create_connection((host, port), timeout)
+        self.file = self.socket.makefile('rb')
+
+    def lookup(self, phrases, batchsize=1000):
+        """Looks up the phrases in batches of ``batchsize``, sending each batch before reading the answers to the previous one. Yields, for each phrase, a tuple of (target, scores) tuples, or None."""
+        batches = [ phrases[i:i+batchsize] for i in range(0, len(phrases), batchsize) ]
+        for i, batch in enumerate(batches):
+            if i == 0:
+                self.send(batch)
+            if i + 1 < len(batches):
+                self.send(batches[i+1])
+            for _ in batch:
+                yield self.receive()
+
+    def send(self, batch):
+        request = [ "BATCH\t" + str(len(batch)) ]
+        for phrase in batch:
+            if "\n" in phrase or "\r" in phrase:
+                raise ValueError("Phrases can not contain newlines")
+            request.append(phrase)
+        self.socket.sendall(("\r\n".join(request) + "\r\n").encode('utf-8'))
+
+    def receive(self):
+        line = self.readline()
+        if line == "NOTFOUND":
+            return None
+        elif line.startswith("FOUND\t"):
+            targets = []
+            for _ in range(0, int(line[6:])):
+                target, scores = self.readline().split("\t")
+                targets.append( (target, tuple( float(score) for score in scores.split() )) )
+            return tuple(targets)
+        else:
+            raise IOError("Unable to parse response from phrase table server: " + line)
 
-        return True
+    def readline(self):
+        line = self.file.readline()
+        if not line:
+            raise IOError("Connection to phrase table server closed")
+        return line.decode('utf-8').rstrip("\r\n")
 
+    def close(self):
+        self.file.close()
+        self.socket.close()
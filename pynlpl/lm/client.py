@@ -4,42 +4,73 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
-from __future__ import absolute_import    
+from __future__ import absolute_import
 
 import socket
+import json
+
+from pynlpl.common import isstring
 
 class LMClient(object):
+    """Client for a :class:`pynlpl.lm.server.LMServer`. Use :meth:`score_many` to score many sentences or n-grams at once: they are sent in batches of ``batchsize``, pipelined over the connection."""
 
-    def __init__(self,host= "localhost",port=12346,n = 0):        
-        self.BUFSIZE = 1024
-        self.socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM) #Create the socket
-        self.socket.settimeout(120)
-        assert isinstance(port,int) 
-        self.socket.connect((host, port)) #Connect to server
+    def __init__(self,host= "localhost",port=12346,n = 0, batchsize=1000, timeout=120):
+        assert isinstance(port,int)
         assert isinstance(n,int)
+        self.socket = socket.create_connection((host, port), timeout) #Connect to server
+        self.file = self.socket.makefile('rb')
         self.n = n
+        self.batchsize = batchsize
 
     def scoresentence(self, sentence):
         if self.n > 0:
             raise Exception("This client instance has been set to send only " + str(self.n) +  "-grams")
-        if isinstance(sentence,list) or isinstance(sentence,tuple):
-            sentence = " ".join(sentence)
-        self.socket.send(sentence+ "\r\n")
-        return float(self.socket.recv(self.BUFSIZE).strip())
+        return self.score_many([sentence])[0]
 
     def __getitem__(self, ngram):
         if self.n == 0:
             raise Exception("This client  has been set to send only full sentence, not n-grams")
-        if isinstance(ngram,str) or isinstance(ngram,unicode):
-            ngram = ngram.split(" ")
-        if len(ngram) != self.n:
-            raise Exception("This client instance has been set to send only " + str(self.n) +  "-grams.")
-        ngram = " ".join(ngram)
-        if (sys.version < '3' and isinstance(ngram,unicode)) or( sys.version == '3' and isinstance(ngram,str)):
-            ngram = ngram.encode('utf-8')        
-        self.socket.send(ngram + b"\r\n")
-        return float(self.socket.recv(self.BUFSIZE).strip())
-        
-        
-        
-        
+        return self.score_many([ngram])[0]
+
+    def score_many(self, items):
+        """Scores all items and returns a list of scores. The items are sentences or, if this client has been set to send n-grams, n-grams; either as strings or as lists/tuples of words."""
+        batch = []
+        for item in items:
+            if isstring(item):
+                item = item.split(" ")
+            if self.n > 0 and len(item) != self.n:
+                raise Exception("This client instance has been set to send only " + str(self.n) +  "-grams.")
+            item = " ".join(item)
+            if "\n" in item or "\r" in item:
+                raise ValueError("Items can not contain newlines")
+            batch.append(item)
+        batches = [ batch[i:i+self.batchsize] for i in range(0, len(batch), self.batchsize) ]
+
+        scores = []
+        for i, batch in enumerate(batches):
+            if i == 0:
+                self.send(batch)
+            if i + 1 < len(batches):
+                self.send(batches[i+1]) #before reading the answers to this batch
+            for _ in batch:
+                scores.append(float(self.readline()))
+        return scores
+
+    def stats(self):
+        """Returns the metrics of the server, see :meth:`pynlpl.lm.server.LMServer.stats`"""
+        self.socket.sendall(b"STATS\t\r\n")
+        return json.loads(self.readline())
+
+    def send(self, batch):
+        command = "NGRAMS" if self.n > 0 else "SENTENCES"
+        self.socket.sendall(("\r\n".join([command + "\t" + str(len(batch))] + batch) + "\r\n").encode('utf-8'))
+
+    def readline(self):
+        line = self.file.readline() #reads until the end of the line, however many packets it spans
+        if not line:
+            raise IOError("Connection to language model server closed")
+        return line.decode('utf-8').rstrip("\r\n")
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
@@ -16,7 +16,17 @@ from __future__ import unicode_literals
 import io
 import math
 import sys
-
+import os
+import struct
+import zipfile
+import heapq
+import itertools
+import array
+import shutil
+import tempfile
+from collections import Counter
+
+from pynlpl.common import isstring, parallelmap
 from pynlpl.statistics import FrequencyList, product
 from pynlpl.textprocessors import Windower
 
@@ -29,6 +39,115 @@ else:
     stdout = sys.stdout
 
 
+def loadnpz(filename, mmap=False):
+    """Load all arrays from an (uncompressed) .npz file into a dictionary. With ``mmap``, the arrays are memory-mapped rather than read."""
+    import numpy as np
+    if not mmap:
+        with np.load(filename) as npz:
+            return dict( (name, npz[name]) for name in npz.files )
+
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as f:
+        for member in archive.infolist():
+            if member.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("Can not memory-map compressed .npz files")
+            f.seek(member.header_offset)
+            namelength, extralength = struct.unpack('<HH', f.read(30)[26:30]) #from the local file header
+            f.seek(member.header_offset + 30 + namelength + extralength)
+            version = np.lib.format.read_magic(f)
+            if version == (1,0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            name = member.filename[:-4] if member.filename.endswith('.npy') else member.filename
+            if not shape or all(shape):
+                arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=f.tell(), shape=shape, order='F' if fortran else 'C')
+            else:
+                arrays[name] = np.empty(shape, dtype=dtype) #can't memory-map an empty array
+    return arrays
+
+
+def openarpa(filename, encoding='utf-8'):
+    """Opens an ARPA file for reading as text, decompressing it if it is compressed with gzip, bzip2 or xz (regardless of its extension)"""
+    with open(filename, 'rb') as f:
+        magic = f.read(6)
+    if magic[:2] == b'\x1f\x8b':
+        import gzip
+        return io.TextIOWrapper(gzip.GzipFile(filename, 'rb'), encoding=encoding)
+    elif magic[:3] == b'BZh':
+        import bz2
+        return io.TextIOWrapper(bz2.BZ2File(filename, 'rb'), encoding=encoding)
+    elif magic == b'\xfd7zXZ\x00':
+        import lzma
+        return io.TextIOWrapper(lzma.LZMAFile(filename, 'rb'), encoding=encoding)
+    else:
+        return io.open(filename, 'rt', encoding=encoding)
+
+
+def readarpa(filename, encoding='utf-8', total=None, base_e=True, encoder=None, maxorder=None, vocabulary=None, threshold=None, debug=False):
+    """Reads a language model in ARPA format (optionally compressed, see :func:`openarpa`) and yields (ngram, (logprob, backoff)) tuples, in the order of the file (by increasing order), without holding the model in memory.
+
+    The counts in the header are stored in the ``total`` dictionary, if given. The n-grams can be filtered while reading:
+
+    * ``maxorder`` - skip n-grams of a higher order (and stop reading when they start)
+    * ``vocabulary`` - skip n-grams with words outside this collection of words (the markers <s>, </s> and <unk> are always kept). Scores of sentences that only use these words are the same.
+    * ``threshold`` - skip n-grams of order 2 and up whose (log10) probability is below this threshold, unless they carry a backoff weight (which the contexts of higher-order n-grams do).
+
+    With ``base_e``, probabilities and backoffs are converted from log10 to natural logarithms."""
+    if total is None:
+        total = {}
+    if vocabulary is not None:
+        vocabulary = set(vocabulary) | set(('<s>','</s>','<unk>'))
+    log10 = math.log(10) if base_e else 1.0
+    with openarpa(filename, encoding) as f:
+        order = None
+        for line in f:
+            if order: #fast path: an n-gram line
+                fields = line.rstrip().split('\t')
+                if len(fields) > 1:
+                    words = fields[1].split()
+                    if vocabulary is not None and not all( word in vocabulary for word in words ):
+                        continue
+                    logprob = float(fields[0])
+                    if len(fields) > 2:
+                        backoffprob = float(fields[2]) * log10
+                    else:
+                        if threshold is not None and order > 1 and logprob < threshold:
+                            continue
+                        backoffprob = 0.0
+                    logprob *= log10  # * log(10) does log10 to log_e conversion
+                    ngram = tuple(words)
+                    if encoder is not None:
+                        ngram = encoder(ngram)
+                    if debug:
+                        print("Adding to LM: {}\t{}\t{}".format(ngram, logprob, backoffprob), file=sys.stderr)
+                    yield ngram, (logprob, backoffprob)
+                    continue
+            line = line.strip()
+            if line == '\\data\\':
+                order = 0
+            elif line == '\\end\\':
+                break
+            elif line.startswith('\\') and line.endswith(':'):
+                for i in range(1, 10):
+                    if line == '\\{}-grams:'.format(i):
+                        order = i
+                        break
+                else:
+                    raise ValueError("Order of n-gram is not supported!")
+                if maxorder and order > maxorder:
+                    break
+            elif line:
+                if order == 0:  # still in \data\ section
+                    if line.startswith('ngram'):
+                        n = int(line[6])
+                        v = int(line[8:])
+                        if not maxorder or n <= maxorder:
+                            total[n] = v
+                elif debug:
+                    print("Unable to parse ARPA LM line: " + line, file=sys.stderr)
+
+
 class SimpleLanguageModel:
     """This is a simple unsmoothed language model. This class can both hold and compute the model."""
 
@@ -49,7 +168,7 @@ class SimpleLanguageModel:
             self._endgram = tuple([self.endmarker] * (n-1))
 
     def append(self, sentence):
-        if isinstance(sentence, str) or isinstance(sentence, unicode):
+        if isstring(sentence):
             sentence = sentence.strip().split(' ')
         self.sentences += 1
         for ngram in Windower(sentence,self.n, self.beginmarker, self.endmarker):
@@ -59,11 +178,17 @@ class SimpleLanguageModel:
 
 
     def load(self, filename):
+        """Load the model from file, either in the text format written by :meth:`save` or in the binary count format (see :class:`CountStore`)"""
+        with open(filename,'rb') as f:
+            binary = f.read(len(LMCOUNTSMAGIC)) == LMCOUNTSMAGIC
+        if binary:
+            self.loadcounts(filename)
+            return
         self.freqlistN = FrequencyList(None, self.casesensitive)
         self.freqlistNm1 = FrequencyList(None, self.casesensitive)
         f = io.open(filename,'r',encoding='utf-8')
         mode = False
-        for line in f.readlines():
+        for line in f:
             line = line.strip()
             if line:
                 if not mode:
@@ -96,21 +221,49 @@ class SimpleLanguageModel:
                             type, count = line.split("\t")
                             self.freqlistN.count(type.split(' '),int(count))
                         except:
-                            print("Warning, could not parse line whilst loading frequency list: ", line,file=stderr)
+                            print("Warning, could not parse line whilst loading frequency list: ", line,file=sys.stderr)
                 elif mode == 3:
                         try:
                             type, count = line.split("\t")
                             self.freqlistNm1.count(type.split(' '),int(count))
                         except:
-                            print("Warning, could not parse line whilst loading frequency list: ", line,file=stderr)
+                            print("Warning, could not parse line whilst loading frequency list: ", line,file=sys.stderr)
+        f.close()
 
         if self.beginmarker:
-            self._begingram = [self.beginmarker] * (self.n-1)
+            self._begingram = tuple([self.beginmarker] * (self.n-1))
         if self.endmarker:
-            self._endgram = [self.endmarker] * (self.n-1)
+            self._endgram = tuple([self.endmarker] * (self.n-1))
+
+    def loadcounts(self, filename):
+        """Load the model from a binary count file, as written by :meth:`save` with ``binary=True``, :class:`CountStore`, :func:`mergecounts` or :func:`countcorpus`"""
+        with open(filename,'rb') as f:
+            header, sections = readcounts(f)
+            self.n = header['n']
+            self.casesensitive = header['casesensitive']
+            self.sentences = header['sentences']
+            self.beginmarker = header['beginmarker']
+            self.endmarker = header['endmarker']
+            self.freqlistN = FrequencyList(None, self.casesensitive)
+            self.freqlistNm1 = FrequencyList(None, self.casesensitive)
+            for freqlist in (self.freqlistN, self.freqlistNm1):
+                counts = freqlist._count #filled directly, the keys have been validated when counting
+                for keys, blockcounts in next(sections):
+                    dict.update(counts, zip([ tuple(key.split(' ')) for key in keys ], blockcounts)) #Counter.update would count the pairs
+                freqlist.total = sum(counts.values())
+        if self.beginmarker:
+            self._begingram = tuple([self.beginmarker] * (self.n-1))
+        if self.endmarker:
+            self._endgram = tuple([self.endmarker] * (self.n-1))
 
+    def header(self):
+        return {'n': self.n, 'casesensitive': self.casesensitive, 'sentences': self.sentences, 'beginmarker': self.beginmarker, 'endmarker': self.endmarker}
 
-    def save(self, filename):
+    def save(self, filename, binary=False):
+        """Save the model to file. With ``binary``, the counts are saved in a (sorted) binary format that loads much faster, and that can be merged with other count files (see :func:`mergecounts`)."""
+        if binary:
+            writecounts(filename, self.header(), [ sorted( (" ".join(ngram), count) for ngram, count in freqlist.items() ) for freqlist in (self.freqlistN, self.freqlistNm1) ])
+            return
         f = io.open(filename,'w',encoding='utf-8')
         f.write("[simplelanguagemodel]\n")
         f.write("n="+str(self.n)+"\n")
@@ -128,6 +281,15 @@ class SimpleLanguageModel:
         f.close()
 
 
+    def __add__(self, other):
+        """Two models with the same parameters can be added together, summing their counts"""
+        assert isinstance(other, SimpleLanguageModel) and other.header() == dict(self.header(), sentences=other.sentences)
+        lm = SimpleLanguageModel(self.n, self.casesensitive, self.beginmarker, self.endmarker)
+        lm.freqlistN = self.freqlistN + other.freqlistN
+        lm.freqlistNm1 = self.freqlistNm1 + other.freqlistNm1
+        lm.sentences = self.sentences + other.sentences
+        return lm
+
     def scoresentence(self, sentence):
         return product([self[x] for x in Windower(sentence, self.n, self.beginmarker, self.endmarker)])
 
@@ -143,6 +305,224 @@ class SimpleLanguageModel:
             return self.freqlistN[ngram] / float(self.freqlistNm1[nm1gram])
 
 
+LMCOUNTSMAGIC = b'PyNLPl-lmcounts'
+LMCOUNTSVERSION = 1
+LMCOUNTSHEADER = struct.Struct(str('<15sIIBQ')) #magic, version, n, casesensitive, sentences
+LMCOUNTSBLOCK = struct.Struct(str('<IQ')) #number of records in a block, length of its keys in bytes
+LMCOUNTSBLOCKSIZE = 65536 #records per block
+LMCOUNTSNONE = 0xffffffff #length of a marker that is None
+
+
+def writecounts(filename, header, sections):
+    """Writes a binary count file. ``header`` is a dictionary with the parameters of the model (see :meth:`SimpleLanguageModel.header`), ``sections`` holds two iterables of (key, count) tuples, sorted by key: the n-grams and the (n-1)-grams, with the words of each key joined by spaces.
+
+    Each section is stored as blocks of records: the counts (unsigned 64-bit integers) followed by the keys (UTF-8, separated by newlines), so they can be read in bulk. An empty block ends the section."""
+    with open(filename,'wb') as f:
+        f.write(LMCOUNTSHEADER.pack(LMCOUNTSMAGIC, LMCOUNTSVERSION, header['n'], int(header['casesensitive']), header['sentences']))
+        for marker in (header['beginmarker'], header['endmarker']):
+            if marker is None:
+                f.write(struct.pack(str('<I'), LMCOUNTSNONE))
+            else:
+                marker = marker.encode('utf-8')
+                f.write(struct.pack(str('<I'), len(marker)) + marker)
+        for records in sections:
+            records = iter(records)
+            while True:
+                block = list(itertools.islice(records, LMCOUNTSBLOCKSIZE))
+                if not block:
+                    break
+                keys, counts = zip(*block)
+                keys = "\n".join(keys)
+                if keys.count("\n") != len(block) - 1:
+                    raise ValueError("Keys of a count file can not contain newlines")
+                keys = keys.encode('utf-8')
+                counts = array.array(str('Q'), counts)
+                if sys.byteorder == 'big': counts.byteswap()
+                f.write(LMCOUNTSBLOCK.pack(len(block), len(keys)))
+                f.write(counts.tostring() if sys.version < '3' else counts.tobytes())
+                f.write(keys)
+            f.write(LMCOUNTSBLOCK.pack(0, 0))
+
+def readcounts(f):
+    """Reads a binary count file from the (binary) file object. Returns the header, as a dictionary, and an iterator over the two sections, each an iterator over blocks of (key, count) tuples, as (keys, counts) tuples of lists. The sections have to be consumed in order."""
+    magic, version, n, casesensitive, sentences = LMCOUNTSHEADER.unpack(f.read(LMCOUNTSHEADER.size))
+    if magic != LMCOUNTSMAGIC:
+        raise ValueError("Not a count file")
+    elif version != LMCOUNTSVERSION:
+        raise ValueError("Unsupported version of count file: " + str(version))
+    header = {'n': n, 'casesensitive': bool(casesensitive), 'sentences': sentences}
+    for name in ('beginmarker','endmarker'):
+        length = struct.unpack(str('<I'), f.read(4))[0]
+        header[name] = None if length == LMCOUNTSNONE else f.read(length).decode('utf-8')
+
+    def section():
+        while True:
+            records, length = LMCOUNTSBLOCK.unpack(f.read(LMCOUNTSBLOCK.size))
+            if not records:
+                return
+            counts = array.array(str('Q'))
+            if sys.version < '3':
+                counts.fromstring(f.read(records * 8))
+            else:
+                counts.frombytes(f.read(records * 8))
+            if sys.byteorder == 'big': counts.byteswap()
+            yield f.read(length).decode('utf-8').split("\n"), counts.tolist()
+    return header, iter([section(), section()])
+
+def countrecords(blocks):
+    """Iterates over the (key, count) tuples in the blocks of a section of a count file (see :func:`readcounts`)"""
+    for keys, counts in blocks:
+        for record in zip(keys, counts):
+            yield record
+
+def mergecountrecords(iterables):
+    """Merges iterables of (key, count) tuples that are sorted by key, summing the counts of equal keys"""
+    prevkey = None
+    total = 0
+    for key, count in heapq.merge(*iterables):
+        if key != prevkey:
+            if prevkey is not None:
+                yield prevkey, total
+            prevkey = key
+            total = 0
+        total += count
+    if prevkey is not None:
+        yield prevkey, total
+
+def mergecounts(filenames, outputfilename):
+    """Merges binary count files (of models with the same parameters) into one, summing the counts. The files are streamed, so this takes little memory."""
+    files = [ open(filename,'rb') for filename in filenames ]
+    try:
+        headers, sections = zip(*[ readcounts(f) for f in files ])
+        header = dict(headers[0])
+        for other in headers[1:]:
+            if dict(other, sentences=header['sentences']) != header:
+                raise ValueError("Count files of models with different parameters can not be merged")
+        header['sentences'] = sum( other['sentences'] for other in headers )
+        writecounts(outputfilename, header, [ mergecountrecords([ countrecords(next(s)) for s in sections ]), mergecountrecords([ countrecords(next(s)) for s in sections ]) ])
+    finally:
+        for f in files:
+            f.close()
+
+
+class CountStore(object):
+    """Counts the n-grams and (n-1)-grams of sentences for a :class:`SimpleLanguageModel`, within a memory budget: when more than ``maxentries`` distinct n-grams and (n-1)-grams are held in memory (very roughly 150 bytes each), they are spilled to disk as a sorted run, and the runs are merged when the counts are saved (as a binary count file, see :meth:`SimpleLanguageModel.loadcounts`)."""
+
+    def __init__(self, n=2, casesensitive = True, beginmarker = "<begin>", endmarker = "<end>", maxentries=10000000, tmpdir=None):
+        assert isinstance(n,int) and n >= 2
+        self.n = n
+        self.casesensitive = casesensitive
+        self.beginmarker = beginmarker
+        self.endmarker = endmarker
+        self.maxentries = maxentries
+        self.tmpdir = tmpdir
+        self.sentences = 0
+        self.counts = (Counter(), Counter())
+        self.runs = []
+
+    def header(self):
+        return {'n': self.n, 'casesensitive': self.casesensitive, 'sentences': self.sentences, 'beginmarker': self.beginmarker, 'endmarker': self.endmarker}
+
+    def append(self, sentence):
+        """Counts the n-grams and (n-1)-grams of a sentence, like :meth:`SimpleLanguageModel.append`"""
+        if isstring(sentence):
+            sentence = sentence.strip().split(' ')
+        self.sentences += 1
+        if not self.casesensitive:
+            sentence = [ word.lower() for word in sentence ]
+        for counts, n in zip(self.counts, (self.n, self.n-1)):
+            if self.beginmarker and self.endmarker:
+                #same n-grams as Windower, the markers are lowercased too, as FrequencyList does
+                begin, end = self.beginmarker, self.endmarker
+                if not self.casesensitive:
+                    begin, end = begin.lower(), end.lower()
+                words = [begin] * (n-1) + list(sentence) + [end] * (n-1)
+                counts.update( " ".join(words[i:i+n]) for i in range(0, len(words) - n + 1) )
+            else:
+                counts.update( " ".join(ngram).lower() if not self.casesensitive else " ".join(ngram) for ngram in Windower(sentence, n, self.beginmarker, self.endmarker) )
+        if len(self.counts[0]) + len(self.counts[1]) > self.maxentries:
+            self.spill()
+
+    def spill(self):
+        """Writes the counts in memory to disk, as a sorted run"""
+        fd, filename = tempfile.mkstemp(prefix='pynlpl-lmcounts-', dir=self.tmpdir)
+        os.close(fd)
+        writecounts(filename, self.header(), [ sorted(counts.items()) for counts in self.counts ])
+        self.runs.append(filename)
+        self.counts = (Counter(), Counter())
+
+    def save(self, filename):
+        """Saves all counts as a binary count file, merging the runs on disk (which are then removed)"""
+        try:
+            if not self.runs:
+                writecounts(filename, self.header(), [ sorted(counts.items()) for counts in self.counts ])
+                return
+            if self.counts[0] or self.counts[1]:
+                self.spill()
+            header = self.header() #the runs only hold the number of sentences counted before they were spilled
+            files = [ open(run,'rb') for run in self.runs ]
+            try:
+                sections = [ readcounts(f)[1] for f in files ]
+                writecounts(filename, header, [ mergecountrecords([ countrecords(next(s)) for s in sections ]), mergecountrecords([ countrecords(next(s)) for s in sections ]) ])
+            finally:
+                for f in files:
+                    f.close()
+        finally:
+            for run in self.runs:
+                os.unlink(run)
+            self.runs = []
+
+
+COUNTWORKER = {}
+
+def countcorpus(filenames, outputfilename, n=2, workers=None, casesensitive=True, beginmarker="<begin>", endmarker="<end>", maxentries=10000000, tmpdir=None, chunksize=64*1024*1024):
+    """Counts the n-grams and (n-1)-grams of corpus files, with one tokenised sentence per line, into a binary count file for a :class:`SimpleLanguageModel` (see :meth:`SimpleLanguageModel.loadcounts`).
+
+    The files are split into shards of about ``chunksize`` bytes (at line boundaries), which are counted in parallel by ``workers`` processes (if set), each within the memory budget of ``maxentries`` (see :class:`CountStore`). The partial count files are written to ``tmpdir`` and then merged."""
+    if isstring(filenames):
+        filenames = [filenames]
+    options = (n, casesensitive, beginmarker, endmarker, maxentries, tmpdir)
+    shards = [ (filename, begin, min(begin + chunksize, os.path.getsize(filename))) for filename in filenames for begin in range(0, max(os.path.getsize(filename),1), chunksize) ]
+    partials = []
+    try:
+        for partial in parallelmap(countworker, shards, workers, initcountworker, (options,), ordered=False):
+            partials.append(partial)
+        if len(partials) == 1:
+            shutil.move(partials[0], outputfilename)
+        else:
+            mergecounts(partials, outputfilename)
+    finally:
+        for partial in partials:
+            if os.path.exists(partial):
+                os.unlink(partial)
+
+def initcountworker(options):
+    COUNTWORKER['options'] = options
+
+def countworker(shard):
+    """Counts the sentences in a shard (filename, begin, end) of a corpus file: those lines that start within the byte range. Returns the name of the partial count file."""
+    filename, begin, end = shard
+    n, casesensitive, beginmarker, endmarker, maxentries, tmpdir = COUNTWORKER['options']
+    store = CountStore(n, casesensitive, beginmarker, endmarker, maxentries, tmpdir)
+    with open(filename,'rb') as f:
+        if begin > 0:
+            f.seek(begin - 1)
+            f.readline() #the line that started before our range belongs to the previous shard
+        offset = f.tell()
+        while offset < end:
+            line = f.readline()
+            if not line:
+                break
+            offset += len(line)
+            line = line.decode('utf-8').strip()
+            if line:
+                store.append(line)
+    fd, partial = tempfile.mkstemp(prefix='pynlpl-lmcounts-', dir=tmpdir)
+    os.close(fd)
+    store.save(partial)
+    return partial
+
+
 class ARPALanguageModel(object):
 
     """Full back-off language model, loaded from file in ARPA format.
@@ -165,7 +545,8 @@ class ARPALanguageModel(object):
 
             'simple' method is a Python dictionary (quick, takes much memory).
             'trie' method is more space-efficient (~35% reduction) but slower.
-            data is a dictionary of ngram-tuple => (probability, backoff).
+            'numpy' method maps words to integer ids and keeps the ngrams of each order as a sorted array of integer keys, with the probabilities and backoffs in float32 arrays (5-10 times less memory than 'simple', and it can be saved and memory-mapped, see :meth:`ARPALanguageModel.save`).
+            data is a dictionary of ngram-tuple => (probability, backoff), or an iterable of (ngram-tuple, (probability, backoff)) tuples, such as :func:`readarpa` yields (for 'numpy', by increasing order).
             delim is the strings which converts ngrams between tuple and
             unicode string (for saving in trie mode).
 
@@ -173,26 +554,259 @@ class ARPALanguageModel(object):
             self.delim = delim
             self.mode = mode
             if mode == 'simple':
-                self._data = data
+                self._data = data if isinstance(data, dict) else dict(data)
             elif mode == 'trie':
                 import marisa_trie
-                self._data = marisa_trie.RecordTrie("@dd", [(self.delim.join(k), v) for k, v in data.items()])
+                self._data = marisa_trie.RecordTrie("@dd", ((self.delim.join(k), v) for k, v in (data.items() if isinstance(data, dict) else data)))
+            elif mode == 'numpy':
+                self.build(sorted(data.items(), key=lambda item: len(item[0])) if isinstance(data, dict) else data)
             else:
                 raise ValueError("mode {} is not supported for NgramsProbs".format(mode))
 
+        def build(self, entries):
+            """Builds the numpy storage from (ngram, (probability, backoff)) tuples ordered by increasing order, without holding them all in memory: the ngrams of one order are collected as compact arrays of word ids, and then encoded and sorted.
+
+            The key of an ngram of order n > 1 is index * V + id, where index is the position of its (n-1)-gram prefix in the arrays of order n-1 and id is the id of its last word (unigrams are stored at the position of their id). Prefixes and words that are missing from the model get a NaN probability, and are otherwise treated as absent."""
+            import numpy as np
+            from array import array
+
+            self.vocab = {}
+            self.vocabsize = 0
+            self.keys = {}
+            self.probs = {1: np.zeros(0, dtype=np.float32)}
+            self.backoffs = {1: np.zeros(0, dtype=np.float32)}
+            order = 0
+            ids = probs = backoffs = None
+            for ngram, (prob, backoff) in entries:
+                n = len(ngram)
+                if n != order:
+                    if n < order:
+                        raise ValueError("N-grams must be ordered by increasing order")
+                    if order:
+                        self.addorder(order, ids, probs, backoffs)
+                    order = n
+                    ids = array(str('q'))
+                    probs = array(str('f'))
+                    backoffs = array(str('f'))
+                if n == 1:
+                    i = self.vocab.get(ngram[0])
+                    if i is None:
+                        self.vocab[ngram[0]] = len(probs)
+                        probs.append(prob)
+                        backoffs.append(backoff)
+                    else: #duplicate, the last one counts
+                        probs[i] = prob
+                        backoffs[i] = backoff
+                else:
+                    for word in ngram:
+                        i = self.vocab.get(word)
+                        if i is None: #not in the unigrams, added as a placeholder
+                            i = self.vocab[word] = len(self.vocab)
+                        ids.append(i)
+                    probs.append(prob)
+                    backoffs.append(backoff)
+            if order:
+                self.addorder(order, ids, probs, backoffs)
+            if len(self.vocab) > self.vocabsize:
+                self.rebuild()
+            self.size = sum( int(np.count_nonzero(~np.isnan(probs))) for probs in self.probs.values() )
+
+        def addorder(self, n, ids, probs, backoffs):
+            """Encodes, sorts and stores the ngrams of order n, given as arrays"""
+            import numpy as np
+            probs = np.frombuffer(probs, dtype=np.float32).copy()
+            backoffs = np.frombuffer(backoffs, dtype=np.float32).copy()
+            if n == 1:
+                self.probs[1] = probs
+                self.backoffs[1] = backoffs
+                self.vocabsize = len(probs)
+                return
+            rows = np.frombuffer(ids, dtype=np.int64).reshape(-1, n)
+            if len(self.vocab) > self.vocabsize:
+                self.rebuild()
+            missing = self.index(rows[:, :-1]) < 0
+            if missing.any():
+                placeholders = {}
+                for row in set( tuple(row) for row in rows[missing, :-1].tolist() ):
+                    while len(row) > 1: #and its prefixes, if they exist this is harmless
+                        placeholders.setdefault(len(row), set()).add(row)
+                        row = row[:-1]
+                self.rebuild(placeholders)
+            self.store(n, rows, probs, backoffs)
+
+        def store(self, n, rows, probs, backoffs):
+            """Encodes and stores the ngrams of order n, given as rows of word ids, of which all prefixes must exist"""
+            import numpy as np
+            keys = self.index(rows[:, :-1]) * self.vocabsize + rows[:, -1]
+            perm = np.argsort(keys, kind='stable')
+            keys = keys[perm]
+            last = np.ones(len(keys), dtype=bool)
+            last[:-1] = keys[1:] != keys[:-1] #of duplicates, the last one counts
+            self.keys[n] = keys[last]
+            self.probs[n] = probs[perm][last]
+            self.backoffs[n] = backoffs[perm][last]
+
+        def index(self, rows):
+            """Returns the positions of the ngrams, given as rows of word ids, in the arrays of their order; -1 for those that do not exist"""
+            import numpy as np
+            index = rows[:, 0].copy()
+            for k in range(1, rows.shape[1]):
+                keys = self.keys.get(k+1)
+                if keys is None or not len(keys):
+                    return np.full(len(rows), -1, dtype=np.int64)
+                valid = index >= 0
+                key = np.where(valid, index, 0) * self.vocabsize + rows[:, k]
+                position = np.minimum(keys.searchsorted(key), len(keys)-1)
+                index = np.where(valid & (keys[position] == key), position, -1)
+            return index
+
+        def decode(self, n):
+            """Returns the ngrams of order n as rows of word ids"""
+            import numpy as np
+            if n == 1:
+                return np.arange(len(self.probs[1]), dtype=np.int64).reshape(-1, 1)
+            prefix, last = np.divmod(self.keys[n], self.vocabsize)
+            return np.column_stack([ self.decode(n-1)[prefix], last ])
+
+        def rebuild(self, placeholders=None):
+            """Adds placeholders for words that are not in the unigrams, and for the specified ngrams (a dictionary of order => set of rows of word ids), by decoding, extending and re-encoding all orders. Only needed for models that lack some prefixes."""
+            import numpy as np
+            rows = dict( (n, self.decode(n)) for n in self.keys )
+            added = len(self.vocab) - len(self.probs[1])
+            self.probs[1] = np.concatenate([ self.probs[1], np.full(added, np.nan, dtype=np.float32) ])
+            self.backoffs[1] = np.concatenate([ self.backoffs[1], np.zeros(added, dtype=np.float32) ])
+            self.vocabsize = len(self.vocab)
+            for n in sorted(set(rows) | set(placeholders or ())):
+                if n in rows:
+                    ngrams, probs, backoffs = rows[n], self.probs[n], self.backoffs[n]
+                else:
+                    ngrams, probs, backoffs = np.zeros((0, n), dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+                if placeholders and placeholders.get(n):
+                    extra = np.array(sorted(placeholders[n]), dtype=np.int64).reshape(-1, n)
+                    ngrams = np.concatenate([ extra, ngrams ]) #first, so existing ngrams take precedence
+                    probs = np.concatenate([ np.full(len(extra), np.nan, dtype=np.float32), probs ])
+                    backoffs = np.concatenate([ np.zeros(len(extra), dtype=np.float32), backoffs ])
+                self.store(n, ngrams, probs, backoffs)
+
+        def locate(self, ngram):
+            """Returns the position of the ngram in the numpy arrays of its order, raises KeyError if it does not exist"""
+            vocab = self.vocab
+            index = vocab[ngram[0]]
+            for n in range(2, len(ngram)+1):
+                keys = self.keys[n]
+                key = index * self.vocabsize + vocab[ngram[n-1]]
+                index = int(keys.searchsorted(key))
+                if index == len(keys) or keys[index] != key:
+                    raise KeyError(ngram)
+            return index
+
+        def arrays(self):
+            """Returns the numpy storage as a dictionary of arrays (see :meth:`fromarrays`)"""
+            import numpy as np
+            words = [ None ] * len(self.vocab)
+            for word, i in self.vocab.items():
+                words[i] = word
+            arrays = {'vocab': np.frombuffer("\n".join(words).encode('utf-8'), dtype=np.uint8)}
+            for n in self.probs:
+                arrays['probs' + str(n)] = self.probs[n]
+                arrays['backoffs' + str(n)] = self.backoffs[n]
+                if n > 1:
+                    arrays['keys' + str(n)] = self.keys[n]
+            return arrays
+
+        @classmethod
+        def fromarrays(cls, arrays):
+            """Creates a numpy storage from a dictionary of arrays, as returned by :meth:`arrays`"""
+            import numpy as np
+            ngrams = cls({}, 'simple')
+            ngrams.mode = 'numpy'
+            ngrams.vocab = dict( (word, i) for i, word in enumerate(arrays['vocab'].tobytes().decode('utf-8').split("\n")) ) if len(arrays['vocab']) else {}
+            ngrams.vocabsize = len(ngrams.vocab)
+            ngrams.keys = {}
+            ngrams.probs = {}
+            ngrams.backoffs = {}
+            for name in arrays:
+                if name.startswith('probs'):
+                    n = int(name[5:])
+                    ngrams.probs[n] = arrays[name]
+                    ngrams.backoffs[n] = arrays['backoffs' + str(n)]
+                    if n > 1:
+                        ngrams.keys[n] = arrays['keys' + str(n)]
+            ngrams.size = sum( int(np.count_nonzero(~np.isnan(probs))) for probs in ngrams.probs.values() )
+            return ngrams
+
         def prob(self, ngram):
             """Return probability of given ngram tuple"""
+            if self.mode == 'numpy':
+                prob = float(self.probs[len(ngram)][self.locate(ngram)])
+                if prob != prob: #NaN: placeholder for a missing prefix
+                    raise KeyError(ngram)
+                return prob
             return self._data[ngram][0] if self.mode == 'simple' else self._data[self.delim.join(ngram)][0][0]
 
         def backoff(self, ngram):
             """Return backoff value of a given ngram tuple"""
+            if self.mode == 'numpy':
+                index = self.locate(ngram)
+                if self.probs[len(ngram)][index] != self.probs[len(ngram)][index]: #NaN: placeholder for a missing prefix
+                    raise KeyError(ngram)
+                return float(self.backoffs[len(ngram)][index])
             return self._data[ngram][1] if self.mode == 'simple' else self._data[self.delim.join(ngram)][0][1]
 
+        def scorebatch(self, contexts, words, order):
+            """Vectorised backoff scoring for the numpy storage. The contexts are tuples of at most order-1 words. Returns two arrays: the scores, and a boolean mask of the words that were not found at all (their score then holds only the sum of the backoffs of their context, the caller adds the probability of the unknown word)."""
+            import numpy as np
+            N = len(words)
+            L = order
+            ids = np.full((N, L), -1, dtype=np.int64) #right-aligned: context, then the word in the last column
+            vocab = self.vocab
+            for i, (context, word) in enumerate(zip(contexts, words)):
+                row = ids[i]
+                row[L-1] = vocab.get(word, -1)
+                for j, w in enumerate(context):
+                    row[L-1-len(context)+j] = vocab.get(w, -1)
+
+            scores = np.zeros(N, dtype=np.float64)
+            found = np.zeros(N, dtype=bool)
+            for start in range(0, L): #longest suffix first
+                index = ids[:, start].copy()
+                contextindex = index if start == L-2 else None
+                for end in range(start+1, L):
+                    n = end - start + 1
+                    valid = (index >= 0) & (ids[:, end] >= 0)
+                    if n in self.keys and len(self.keys[n]):
+                        keys = self.keys[n]
+                        key = np.where(valid, index, 0) * self.vocabsize + np.where(valid, ids[:, end], 0)
+                        position = np.minimum(keys.searchsorted(key), len(keys)-1)
+                        index = np.where(valid & (keys[position] == key), position, -1)
+                    else:
+                        index = np.full(N, -1, dtype=np.int64)
+                    if end == L-2:
+                        contextindex = index
+                #the word suffix of order L-start
+                n = L - start
+                if n in self.probs:
+                    prob = np.where(index >= 0, self.probs[n][np.maximum(index, 0)], np.nan)
+                    hit = ~found & ~np.isnan(prob)
+                    scores[hit] += prob[hit]
+                    found |= hit
+                #words not found yet back off from the context suffix of order L-1-start
+                if contextindex is not None and n - 1 in self.probs:
+                    exists = (contextindex >= 0) & ~np.isnan(self.probs[n-1][np.maximum(contextindex, 0)])
+                    backoff = np.where(exists, self.backoffs[n-1][np.maximum(contextindex, 0)], 0.0)
+                    scores[~found] += backoff[~found]
+            return scores, ~found
+
         def __len__(self):
+            if self.mode == 'numpy':
+                return self.size
             return len(self._data)
 
 
-    def __init__(self, filename, encoding='utf-8', encoder=None, base_e=True, dounknown=True, debug=False, mode='simple'):
+    def __init__(self, filename, encoding='utf-8', encoder=None, base_e=True, dounknown=True, debug=False, mode='simple', mmap=False, maxorder=None, vocabulary=None, threshold=None):
+        """Load the language model from an ARPA file (which may be compressed with gzip, bzip2 or xz), or from a .npz file written by :meth:`save` (in which case ``mode`` and ``base_e`` are those of the saved model, and ``mmap`` can be set to memory-map it instead of reading it).
+
+        The ARPA file is streamed straight into the storage of the chosen mode. Loading can be restricted to n-grams up to ``maxorder``, to n-grams of which all words are in ``vocabulary``, and to n-grams with a (log10) probability of at least ``threshold``, see :func:`readarpa`."""
         # parameters
         self.encoder = (lambda x: x) if encoder is None else encoder
         self.base_e = base_e
@@ -202,52 +816,30 @@ class ARPALanguageModel(object):
         # other attributes
         self.total = {}
 
-        data = {}
+        if filename.endswith('.npz'):
+            arrays = loadnpz(filename, mmap)
+            self.mode = 'numpy'
+            self.base_e = bool(arrays.pop('base_e'))
+            self.order = int(arrays.pop('order'))
+            self.total = dict( (int(n), int(v)) for n, v in arrays.pop('total') )
+            self.ngrams = self.NgramsProbs.fromarrays(arrays)
+            return
 
-        with io.open(filename, 'rt', encoding=encoding) as f:
-            order = None
-            for line in f:
-                line = line.strip()
-                if line == '\\data\\':
-                    order = 0
-                elif line == '\\end\\':
-                    break
-                elif line.startswith('\\') and line.endswith(':'):
-                    for i in range(1, 10):
-                        if line == '\\{}-grams:'.format(i):
-                            order = i
-                            break
-                    else:
-                        raise ValueError("Order of n-gram is not supported!")
-                elif line:
-                    if order == 0:  # still in \data\ section
-                        if line.startswith('ngram'):
-                            n = int(line[6])
-                            v = int(line[8:])
-                            self.total[n] = v
-                    elif order > 0:
-                        fields = line.split('\t')
-                        logprob = float(fields[0])
-                        if base_e:  # * log(10) does log10 to log_e conversion
-                            logprob *= math.log(10)
-                        ngram = self.encoder(tuple(fields[1].split()))
-                        if len(fields) > 2:
-                            backoffprob = float(fields[2])
-                            if base_e:  # * log(10) does log10 to log_e conversion
-                                backoffprob *= math.log(10)
-                            if self.debug:
-                                msg = "Adding to LM: {}\t{}\t{}"
-                                print(msg.format(ngram, logprob, backoffprob), file=stderr)
-                        else:
-                            backoffprob = 0.0
-                            if self.debug:
-                                msg = "Adding to LM: {}\t{}"
-                                print(msg.format(ngram, logprob), file=stderr)
-                        data[ngram] = (logprob, backoffprob)
-                    elif self.debug:
-                        print("Unable to parse ARPA LM line: " + line, file=stderr)
-        self.order = order
-        self.ngrams = self.NgramsProbs(data, mode)
+        entries = readarpa(filename, encoding, self.total, base_e, encoder, maxorder, vocabulary, threshold, debug)
+        self.ngrams = self.NgramsProbs(entries, mode)
+        self.order = max(self.total) if self.total else 0
+
+    def save(self, filename):
+        """Save the language model as a .npz file, which loads much faster than an ARPA file. Only for mode 'numpy'."""
+        import numpy as np
+        if self.mode != 'numpy':
+            raise ValueError("Only language models in mode numpy can be saved")
+        arrays = self.ngrams.arrays()
+        arrays['base_e'] = np.array(self.base_e)
+        arrays['order'] = np.array(self.order)
+        arrays['total'] = np.array(sorted(self.total.items()), dtype=np.int64).reshape(-1,2)
+        with open(filename,'wb') as f: #a file object, so numpy does not append .npz to the filename
+            np.savez(f, **arrays)
 
     def score(self, data, history=None):
         result = 0
@@ -291,5 +883,102 @@ class ARPALanguageModel(object):
                     backoffweight = 0  # backoff weight will be 0 if not found
                 return backoffweight + self.scoreword(word, history[1:])
 
+    def scoreword_batch(self, words, histories=None):
+        """Score many words at once, each given its own history (or None), and return a numpy array with the scores. Equivalent to calling :meth:`scoreword` for each word, but much faster: every distinct (history, word) combination is scored only once, backoff weights are cached, and for mode 'numpy' the lookups are vectorised."""
+        if histories is None:
+            histories = [None] * len(words)
+        queries = {}
+        indices = []
+        for word, history in zip(words, histories):
+            query = (tuple(history[-(self.order-1):]) if history and self.order > 1 else (), word)
+            index = queries.get(query)
+            if index is None:
+                index = queries[query] = len(queries)
+            indices.append(index)
+        return self.scorequeries(list(queries))[indices]
+
+    def score_batch(self, sentences, histories=None):
+        """Score many sentences at once (each a list or tuple of words, optionally with its own history) and return a numpy array with the scores. Equivalent to calling :meth:`score` for each sentence, but much faster: sentences that share a prefix share its computation, as in a trie, and the words are scored as in :meth:`scoreword_batch`."""
+        import numpy as np
+        if histories is None:
+            histories = [None] * len(sentences)
+        width = self.order - 1
+        queries = {}
+        nodes = {} #(parent, word) => (query index, context); the parent of the first word is the context of the history
+        sentencequeries = []
+        for sentence, history in zip(sentences, histories):
+            parent = tuple(history[-width:]) if history and width else ()
+            context = parent
+            sentencequery = []
+            for word in sentence:
+                node = nodes.get((parent, word))
+                if node is None:
+                    query = (context, word)
+                    index = queries.get(query)
+                    if index is None:
+                        index = queries[query] = len(queries)
+                    node = nodes[(parent, word)] = (index, (context + (word,))[-width:] if width else ())
+                sentencequery.append(node[0])
+                parent = node
+                context = node[1]
+            sentencequeries.append(sentencequery)
+
+        wordscores = self.scorequeries(list(queries))
+        scores = np.zeros(len(sentences), dtype=np.float64)
+        for i, sentencequery in enumerate(sentencequeries):
+            if sentencequery:
+                scores[i] = wordscores[sentencequery].sum()
+        return scores
+
+    def scorequeries(self, queries):
+        """Scores a list of distinct (context, word) tuples, where the context holds at most order-1 words, and returns a numpy array"""
+        import numpy as np
+        if self.mode == 'numpy':
+            scores, unknown = self.ngrams.scorebatch([ context for context, _ in queries ], [ word for _, word in queries ], self.order)
+            if unknown.any():
+                scores[unknown] += self.unknownprob(queries[int(np.argmax(unknown))][1])
+            return scores
+
+        if self.ngrams.mode == 'simple':
+            get = self.ngrams._data.get #(probability, backoff) or None, without the overhead of exceptions
+        else:
+            def get(ngram):
+                try:
+                    return (self.ngrams.prob(ngram), self.ngrams.backoff(ngram))
+                except KeyError:
+                    return None
+        scores = np.empty(len(queries), dtype=np.float64)
+        backoffs = {}
+        for i, (context, word) in enumerate(queries):
+            score = 0.0
+            while True:
+                entry = get(context + (word,))
+                if entry is not None:
+                    score += entry[0]
+                    break
+                elif not context:
+                    score += self.unknownprob(word)
+                    break
+                backoff = backoffs.get(context)
+                if backoff is None:
+                    entry = get(context)
+                    backoff = backoffs[context] = entry[1] if entry is not None else 0.0
+                score += backoff
+                context = context[1:]
+            scores[i] = score
+        return scores
+
+    def unknownprob(self, word):
+        """Returns the probability of an unknown word, raises KeyError if there is none"""
+        if self.dounknown:
+            try:
+                return self.ngrams.prob(('<unk>',))
+            except KeyError:
+                msg = "Word {} not found. And no history specified and model has no <unk>."
+                raise KeyError(msg.format((word,)))
+        else:
+            msg = "Word {} not found. And no history specified."
+            raise KeyError(msg.format((word,)))
+
     def __len__(self):
         return len(self.ngrams)
@@ -11,49 +11,197 @@
 #
 #----------------------------------------------------------------
 
-#No Python 3 support for twisted yet...
+#Requires Python 3 (asyncio)
 
-from twisted.internet import protocol, reactor
-from twisted.protocols import basic
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import asyncio
+import threading
+import socket
+import errno
+import json
+import time
+from collections import deque
+
+from pynlpl.lm.lm import ARPALanguageModel
+
+MAXLINELENGTH = 1024 * 1024 #maximum length of a request line, in bytes
+LATENCYWINDOW = 10000 #number of most recent requests over which latency metrics are computed
+SCORECHUNKSIZE = 1000 #number of items of a request scored at once, before giving the other clients a turn
+
+
+def lmscorers(lm):
+    """Returns a (sentencescorer, ngramscorer) tuple of functions that score a list of words with the language model, which may be a :class:`pynlpl.lm.lm.SimpleLanguageModel`, :class:`pynlpl.lm.lm.ARPALanguageModel` or :class:`pynlpl.lm.srilm.SRILM`. Note that ARPA language models return log probabilities, the others probabilities."""
+    if isinstance(lm, ARPALanguageModel):
+        return lm.score, lambda ngram: lm.scoreword(ngram[-1], ngram[:-1] if len(ngram) > 1 else None)
+    else:
+        return lm.scoresentence, lambda ngram: lm[ngram]
 
-class LMSentenceProtocol(basic.LineReceiver):
-    def lineReceived(self, sentence):
-        try:
-            score = self.factory.lm.scoresentence(sentence)
-        except:
-            score = 0.0
-        self.sendLine(str(score))
 
-class LMSentenceFactory(protocol.ServerFactory):
-    protocol = LMSentenceProtocol
+class LMServer(object):
+    """Language Model Server, built on asyncio and serving any number of concurrent clients.
 
-    def __init__(self, lm):
+    The protocol is line based (UTF-8, lines terminated by CRLF). A request consists of a ``SENTENCES<tab>k`` or ``NGRAMS<tab>k`` line, followed by k lines with the sentences or n-grams (words separated by spaces) to score, and is answered by k lines with the scores, in order. Clients may send further requests without waiting for the answers (pipelining). Items that can not be scored (unknown n-grams in a model without backoff, for instance) get score 0.0.
+
+    A line without a tab is scored on its own, as a sentence or as an n-gram depending on ``n``, for compatibility with older clients. A ``STATS<tab>`` line is answered by a JSON line with the metrics of :meth:`stats`."""
+
+    def __init__(self, lm, port=12346, n=0, host=None, run=True):
+        """n indicates the n-gram size, if set to 0 (which is default), the server will expect to only receive whole sentence, if set to a particular value, it will only expect n-grams of that value. This only applies to requests of a single line, batch requests state what they contain.
+
+        The server runs until it is stopped (see :meth:`stop`), unless ``run`` is False, in which case it can be started later by calling :meth:`run` (in another thread, for instance).
+
+        With port 0 a free port is picked, the same one for all addresses of the host (all interfaces if no host is given), and can be read from ``port`` once the server is ready."""
         self.lm = lm
-        
-class LMNGramProtocol(basic.LineReceiver):
-    def lineReceived(self, ngram):
-        ngram = ngram.split(" ")    
+        self.port = port
+        self.host = host
+        self.n = n
+        self.sentencescorer, self.ngramscorer = lmscorers(lm)
+
+        self.requests = 0
+        self.items = 0
+        self.clients = 0
+        self.latencies = deque(maxlen=LATENCYWINDOW)
+
+        self.ready = threading.Event() #set once the server accepts connections
+        self.loop = None
+        self.stopped = None
+        self.stopping = False #set by stop(), also before the server runs
+        self.lock = threading.Lock() #guards the above, stop() may be called from any thread
+        self.connections = {} #task => writer
+
+        if run:
+            self.run()
+
+    def run(self):
+        """Runs the server until it is stopped"""
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            self.stopped = asyncio.Event()
+            if self.stopping:
+                self.stopped.set()
         try:
-            score = self.factory.lm[ngram]
-        except:
-            score = 0.0
-        self.sendLine(str(score))    
-        
-class LMNGramFactory(protocol.ServerFactory):
-    protocol = LMNGramProtocol
-
-    def __init__(self, lm):
-        self.lm = lm        
-        
-        
-
-class LMServer:
-    """Language Model Server"""
-    def __init__(self, lm, port=12346, n=0):
-        """n indicates the n-gram size, if set to 0 (which is default), the server will expect to only receive whole sentence, if set to a particular value, it will only expect n-grams of that value"""
-        if n == 0:
-            reactor.listenTCP(port, LMSentenceFactory(lm))
-        else:
-            reactor.listenTCP(port, LMNGramFactory(lm))
-        reactor.run()
+            servers = await self.listen()
+            self.ready.set()
+            await self.stopped.wait()
+            for server in servers:
+                server.close()
+            for server in servers:
+                await server.wait_closed()
+            for writer in self.connections.values():
+                writer.close() #the handlers will read the end of the stream and finish
+            await asyncio.gather(*self.connections, return_exceptions=True)
+        finally:
+            with self.lock:
+                self.loop = None #the loop is closed once run() returns
+                self.stopping = False
+
+    async def listen(self):
+        """Starts listening on all addresses of the host, returns the asyncio servers"""
+        if self.port:
+            return [ await asyncio.start_server(self.handle, self.host, self.port, limit=MAXLINELENGTH) ]
+
+        #port 0: every address (family) would get a different free port, so take one for the first address and bind the others to it
+        hosts = []
+        for _, _, _, _, sockaddr in await self.loop.getaddrinfo(self.host, 0, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE):
+            if sockaddr[0] not in hosts:
+                hosts.append(sockaddr[0])
+        while True:
+            server = await asyncio.start_server(self.handle, hosts[0], 0, limit=MAXLINELENGTH)
+            servers = [server]
+            port = server.sockets[0].getsockname()[1]
+            if len(hosts) > 1:
+                try:
+                    servers.append( await asyncio.start_server(self.handle, hosts[1:], port, limit=MAXLINELENGTH) )
+                except OSError as e:
+                    server.close()
+                    await server.wait_closed()
+                    if e.errno == errno.EADDRINUSE:
+                        continue #the port is taken for another address, try another one
+                    raise
+            self.port = port
+            return servers
+
+    def stop(self):
+        """Stops the server, may be called from any thread. If the server is not running yet, it stops as soon as it is started."""
+        with self.lock:
+            self.stopping = True
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.stopped.set)
+
+    async def handle(self, reader, writer):
+        self.connections[asyncio.current_task()] = writer
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode('utf-8').rstrip('\r\n')
+                if '\t' in line:
+                    command, k = line.split('\t',1)
+                    if command == 'STATS':
+                        writer.write(json.dumps(self.stats()).encode('utf-8') + b"\r\n")
+                    elif command in ('SENTENCES','NGRAMS'):
+                        items = []
+                        for _ in range(0, int(k)):
+                            item = await reader.readline()
+                            if not item:
+                                raise ConnectionError("Connection closed halfway a request")
+                            items.append(item.decode('utf-8').rstrip('\r\n'))
+                        answer, latency = await self.scorechunked(items, command == 'SENTENCES')
+                        writer.write(answer)
+                        self.latencies.append(latency)
+                        self.requests += 1
+                        self.items += len(items)
+                    else:
+                        raise ValueError("Invalid request: " + command)
+                else:
+                    writer.write(self.score([line], self.n == 0))
+                await writer.drain() #also gives the other clients a turn
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            del self.connections[asyncio.current_task()]
+            self.clients -= 1
+            writer.close()
+
+    async def scorechunked(self, items, sentences):
+        """Scores the items in chunks of :data:`SCORECHUNKSIZE`, giving the other clients a turn after each chunk, so a large request does not hold them up. Returns the encoded answer and the time spent scoring."""
+        answer = []
+        duration = 0.0
+        for i in range(0, len(items), SCORECHUNKSIZE):
+            if i > 0:
+                await asyncio.sleep(0)
+            begin = time.time()
+            answer.append(self.score(items[i:i+SCORECHUNKSIZE], sentences))
+            duration += time.time() - begin
+        return b"".join(answer), duration
+
+    def score(self, items, sentences):
+        """Scores the items (strings) and returns the encoded answer"""
+        scorer = self.sentencescorer if sentences else self.ngramscorer
+        scores = []
+        for item in items:
+            try:
+                score = float(scorer(tuple(item.split(' '))))
+            except Exception:
+                score = 0.0
+            scores.append(repr(score))
+        return ("\r\n".join(scores) + "\r\n").encode('utf-8')
 
+    def stats(self):
+        """Returns a dictionary with the number of connected clients, the number of batch requests and items scored, and the latency (in milliseconds, the time spent scoring) of the most recent requests: mean, median, 95th percentile and maximum"""
+        latencies = sorted(self.latencies)
+        stats = {'clients': self.clients, 'requests': self.requests, 'items': self.items}
+        if latencies:
+            stats['latency_mean'] = 1000 * sum(latencies) / len(latencies)
+            stats['latency_median'] = 1000 * latencies[len(latencies) // 2]
+            stats['latency_p95'] = 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['latency_max'] = 1000 * latencies[-1]
+        return stats
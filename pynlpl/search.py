@@ -25,15 +25,25 @@ if sys.version < '3':
 else:
     stderr = sys.stderr
     stdout = sys.stdout
-from pynlpl.datatypes import FIFOQueue, PriorityQueue
+from pynlpl.datatypes import FIFOQueue, HeapPriorityQueue, HashSet, BloomFilter, LRUSet
+from pynlpl.common import u, isstring
 from collections import deque
 from bisect import bisect_left
+import copy
+import io
+import multiprocessing
+from timeit import default_timer as timer
+
+VISITEDSIZE = 1000000 #default capacity of bloom and size of lru visited-state memories
+VISITEDERRORRATE = 0.001 #default false positive rate of bloom visited-state memories
+STATSINTERVAL = 1000 #default number of iterations between calls of the stats callback (beam searches call it every round)
 
 
 class AbstractSearchState(object):
     def __init__(self,  parent = None, cost = 0):
         self.parent = parent        
         self.cost = cost
+        self._depth = parent.depth() + 1 if parent else 0
 
     def test(self, goalstates = None):
         """Checks whether this state is a valid goal state, returns a boolean. If no goalstate is defined, then all states will test positively, this is what you usually want for optimisation problems."""
@@ -51,6 +61,16 @@ class AbstractSearchState(object):
         """Generates successor states, implement your custom operators in the derived method."""
         raise Exception("Classes derived from AbstractSearchState must define an expand() method!")
 
+    @classmethod
+    def expand_batch(cls, states):
+        """Expands a batch of states, returns a list with a list of successor states for each of them. Used by searches in batch mode, the default calls expand() on each state; override it if successors can be generated more efficiently at once."""
+        return [ list(state.expand()) for state in states ]
+
+    @classmethod
+    def score_batch(cls, states):
+        """Scores a batch of states, returns a NumPy array (or a sequence) with the score of each of them. Used by searches in batch mode, the default calls score() on each state; override it to score all states in one (vectorised) call, of a model for instance."""
+        return [ state.score() for state in states ]
+
     def __eq__(self):
         """Implement an equality test in the derived method, based only on the state's content (not its path etc!)"""
         raise Exception("Classes derived from AbstractSearchState must define an __eq__() method!")
@@ -70,10 +90,13 @@ class AbstractSearchState(object):
 
 
     def depth(self):
-        if not self.parent:
-            return 0
-        else:
-            return self.parent.depth() + 1            
+        try:
+            return self._depth #computed when the state was created
+        except AttributeError: #the constructor of AbstractSearchState was not called
+            if not self.parent:
+                return 0
+            else:
+                return self.parent.depth() + 1            
 
     #def __len__(self):
     #    return len(self.path())
@@ -101,9 +124,99 @@ class AbstractSearchState(object):
     #    else:
     #        return 0
 
+class SearchStats(object):
+    """Metrics of a search, collected when it is started with stats=True or with a callback (see :class:`AbstractSearch`):
+
+    * ``rounds`` - rounds of a beam search, iterations of the other searches
+    * ``expanded`` - states expanded
+    * ``generated`` - successor states generated by the expansions
+    * ``offers`` - successors offered to the fringe (in a beam search: to the beam of the next round)
+    * ``rejections`` - offered successors the fringe did not take in: worse ones when it was full, worse ones than their parent in eager mode, or duplicates
+    * ``beyondmaxdepth`` - successors not offered because they exceed the maximum depth
+    * ``duplicates`` - states taken from the fringe that were visited before, and skipped
+    * ``fill`` - for each round of a beam search, the number of states in the beam divided by the beam size
+    * ``peakfringe`` - the largest size of the fringe
+    * ``expandtime``, ``scoretime``, ``queuetime`` - seconds spent in expand(), in score() and in fringe operations other than scoring
+    """
+
+    def __init__(self):
+        self.rounds = 0
+        self.expanded = 0
+        self.generated = 0
+        self.offers = 0
+        self.rejections = 0
+        self.beyondmaxdepth = 0
+        self.duplicates = 0
+        self.fill = []
+        self.peakfringe = 0
+        self.expandtime = 0.0
+        self.scoretime = 0.0
+        self.queuetime = 0.0
+
+    def todict(self):
+        """Returns the metrics as a dictionary, with the mean fill ratio of the beam rather than the ratio of each round"""
+        d = dict(self.__dict__)
+        d['fill'] = sum(self.fill) / len(self.fill) if self.fill else None
+        return d
+
+    def __str__(self):
+        return ", ".join( key + "=" + str(value) for key, value in sorted(self.todict().items()) )
+
+
+class TraversalLog(object):
+    """A traversal of a search streamed to a file rather than kept in memory: each state is written as a line with its string representation. Iterating over the log yields these lines.
+
+    The file is only opened (and truncated) on the first append, and is closed again when the log is iterated over or closed; further appends reopen it. The log can be used as a context manager to close it."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.count = 0
+
+    def append(self, state):
+        if self.file is None:
+            self.file = io.open(self.filename,'w' if self.count == 0 else 'a',encoding='utf-8')
+        self.file.write(u(str(state)) + "\n")
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.close()
+        if self.count == 0:
+            return
+        with io.open(self.filename,'r',encoding='utf-8') as f:
+            for line in f:
+                yield line[:-1]
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 class AbstractSearch(object): #not a real search, just a base class for DFS and BFS
     def __init__(self, **kwargs):
-        """For graph-searches graph=True is required (default), otherwise the search may loop forever. For tree-searches, set tree=True for better performance"""
+        """For graph-searches graph=True is required (default), otherwise the search may loop forever. For tree-searches, set tree=True for better performance
+
+        The hashes of visited states are kept in memory as set by visited:
+
+        * ``exact`` (default) - a Python set
+        * ``compact`` - a :class:`pynlpl.datatypes.HashSet`, exact as well but several times smaller
+        * ``bloom`` - a :class:`pynlpl.datatypes.BloomFilter` for visitedsize states, of a fixed size; with a probability of errorrate a state that was not visited is taken to be visited and is skipped
+        * ``lru`` - a :class:`pynlpl.datatypes.LRUSet` of the visitedsize most recent states; older states may be visited again
+        * or a function that returns a new, empty object with add() and ``in``
+
+        With keeptraversal=True, all visited states are kept in memory, if keeptraversal is a filename they are streamed to that file instead (see :class:`TraversalLog`).
+
+        With stats=True, metrics of the search are collected in the :class:`SearchStats` object ``stats``; if a callback function is given, it is called with that object every statsinterval iterations (beam searches: rounds), and when the search is exhausted."""
         self.usememory = True
         self.poll = lambda x: x.pop
         self.maxdepth = False #unlimited
@@ -139,20 +252,49 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
                 self.exhaustive = True
             elif key == 'debug':
                 self.debug = value
-        self._visited = {}
-        self._traversal = []
+        self.visitedtype = kwargs['visited'] if 'visited' in kwargs else 'exact'
+        self.visitedsize = kwargs['visitedsize'] if 'visitedsize' in kwargs else VISITEDSIZE
+        self.errorrate = kwargs['errorrate'] if 'errorrate' in kwargs else VISITEDERRORRATE
+        self._visited = self.newvisited()
+        self._traversal = self.newtraversal()
+        self.callback = kwargs['callback'] if 'callback' in kwargs else None
+        self.statsinterval = kwargs['statsinterval'] if 'statsinterval' in kwargs else STATSINTERVAL
+        self.stats = SearchStats() if ('stats' in kwargs and kwargs['stats']) or self.callback else None
         self.incomplete = False
         self.traversed = 0
 
+    def newvisited(self):
+        """Returns a new, empty memory of visited states (their hashes)"""
+        if self.visitedtype == 'exact':
+            return set()
+        elif self.visitedtype == 'compact':
+            return HashSet()
+        elif self.visitedtype == 'bloom':
+            return BloomFilter(self.visitedsize, self.errorrate)
+        elif self.visitedtype == 'lru':
+            return LRUSet(self.visitedsize)
+        elif callable(self.visitedtype):
+            return self.visitedtype()
+        else:
+            raise ValueError("Invalid value for visited: " + str(self.visitedtype))
+
+    def newtraversal(self):
+        if isstring(self.keeptraversal):
+            return TraversalLog(self.keeptraversal)
+        else:
+            return []
+
     def reset(self):
-        self._visited = {}
-        self._traversal = []
+        self._visited = self.newvisited()
+        if isinstance(self._traversal, TraversalLog): self._traversal.close()
+        self._traversal = self.newtraversal()
+        if self.stats: self.stats = SearchStats()
         self.incomplete = False
         self.traversed = 0 #Count of all visited nodes
         self.solutions = 0 #Counts the number of solutions found     
 
     def traversal(self):
-        """Returns all visited states (only when keeptraversal=True), note that this is not equal to the path, but contains all states that were checked!"""
+        """Returns all visited states (only when keeptraversal=True, or a TraversalLog when keeptraversal is a filename), note that this is not equal to the path, but contains all states that were checked!"""
         if self.keeptraversal:
             return self._traversal
         else:
@@ -163,6 +305,49 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
         return self.traversed
         
 
+    def scorer(self):
+        """Returns the function with which the fringe scores states, which times score() when stats are collected"""
+        if self.stats is None:
+            return lambda x: x.score
+        def score(state):
+            begin = timer()
+            score = state.score()
+            self.stats.scoretime += timer() - begin #looked up on each call, reset() replaces the stats
+            return score
+        return score
+
+    def expansion(self, state):
+        """Expands the state, returns its successors (as a list when stats are collected, timing expand())"""
+        if self.stats is None:
+            return state.expand()
+        begin = timer()
+        successors = list(state.expand())
+        self.stats.expandtime += timer() - begin
+        self.stats.expanded += 1
+        self.stats.generated += len(successors)
+        return successors
+
+    def offer(self, queue, state):
+        """Offers the state to the queue when stats are collected, returns whether the queue took it in (rejections are counted by the caller)"""
+        stats = self.stats
+        scoretime = stats.scoretime
+        begin = timer()
+        accepted = queue.append(state)
+        stats.queuetime += timer() - begin - (stats.scoretime - scoretime) #scoring is timed by scorer()
+        stats.offers += 1
+        return accepted
+
+    def endround(self, fringe, beamsize=0, offers=None, final=False):
+        """Updates the stats at the end of an iteration or round, and calls the callback if it is due. For a beam search, offers is the number of offers before the round: all offers of the round that did not make it into the beam are rejections."""
+        stats = self.stats
+        if not final:
+            stats.rounds += 1
+            if offers is not None: stats.rejections += stats.offers - offers - len(fringe)
+            if len(fringe) > stats.peakfringe: stats.peakfringe = len(fringe)
+            if beamsize: stats.fill.append(len(fringe) / beamsize)
+        if self.callback and (final or stats.rounds % self.statsinterval == 0):
+            self.callback(stats)
+
     def visited(self, state):
         if self.usememory:
             return (hash(state) in self._visited)
@@ -172,6 +357,7 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
     def __iter__(self):
         """Generator yielding *all* valid goalstates it can find,"""
         n = 0
+        stats = self.stats
         while len(self.fringe) > 0:
             n += 1
             if self.debug: print("\t[pynlpl debug] *************** ITERATION #" + str(n) + " ****************",file=stderr)
@@ -206,7 +392,7 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
                 
                 #if self.debug: print >>stderr,"\t[pynlpl debug] EXPANDING:"
                 statecount = 0
-                for i, s in enumerate(state.expand()):
+                for i, s in enumerate(state.expand() if stats is None else self.expansion(state)):
                     statecount += 1
                     if self.debug >= 2:
                         print("\t[pynlpl debug] (Iteration #" + str(n) +") Expanded state #" + str(i+1) + ", adding to fringe: " + str(s),end="",file=stderr)
@@ -216,18 +402,25 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
                             print("ERROR SCORING!",file=stderr)
                             pass
                     if not self.maxdepth or s.depth() <= self.maxdepth:
-                        self.fringe.append(s)
+                        if stats is None:
+                            self.fringe.append(s)
+                        elif self.offer(self.fringe, s) is False:
+                            stats.rejections += 1
                     else:
                         if self.debug: print("\t[pynlpl debug] (Iteration #" + str(n) +") Not adding to fringe, maxdepth exceeded",file=stderr)
+                        if stats: stats.beyondmaxdepth += 1
                         self.incomplete = True
                 if self.debug:
                     print("\t[pynlpl debug] Expanded " + str(statecount) + " states, offered to fringe",file=stderr)
                 if self.keeptraversal: self._traversal.append(state)
-                if self.usememory: self._visited[hash(state)] = True
+                if self.usememory: self._visited.add(hash(state))
                 self.prune(state) #calls prune method
             else:
                 if self.debug:
                     print("\t[pynlpl debug] State already visited before, not expanding again...(hash="+str(hash(state))+")",file=stderr)
+                if stats: stats.duplicates += 1
+            if stats: self.endround(self.fringe)
+        if stats: self.endround(self.fringe, final=True)
         if self.debug:
             print("\t[pynlpl debug] Search complete: " + str(self.solutions) + " solution(s), " + str(self.traversed) + " states traversed in " + str(n) + " rounds",file=stderr)
     
@@ -262,7 +455,7 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
 
     def searchtop(self,n=10):
         """Return the top n best resulta (or possibly less if not enough is found)"""            
-        solutions = PriorityQueue([], lambda x: x.score, self.minimize, length=n, blockworse=False, blockequal=False,duplicates=False)
+        solutions = HeapPriorityQueue([], lambda x: x.score, self.minimize, length=n, blockworse=False, blockequal=False,duplicates=False)
         for solution in self:
             solutions.append(solution)
         return solutions
@@ -331,7 +524,7 @@ class BestFirstSearch(AbstractSearch):
     def __init__(self, state, **kwargs):
         super(BestFirstSearch,self).__init__(**kwargs)
         assert isinstance(state, AbstractSearchState)
-        self.fringe = PriorityQueue([state], lambda x: x.score, self.minimize, length=0, blockworse=False, blockequal=False,duplicates=False)
+        self.fringe = HeapPriorityQueue([state], self.scorer(), self.minimize, length=0, blockworse=False, blockequal=False,duplicates=False)
 
 class BeamSearch(AbstractSearch):
     """Local beam search algorithm"""
@@ -346,113 +539,249 @@ class BeamSearch(AbstractSearch):
             self.eager = kwargs['eager']
         else:
             self.eager = False
+        #batch mode: expand and score all states of a round at once, see AbstractSearchState.expand_batch() and score_batch()
+        self.batch = kwargs['batch'] if 'batch' in kwargs else False
+        #parallel mode: expand the states of a round concurrently with a concurrent.futures executor (see expandstates())
+        self.executor = kwargs['executor'] if 'executor' in kwargs else None
+        self.chunksize = kwargs['chunksize'] if 'chunksize' in kwargs else None
         super(BeamSearch,self).__init__(**kwargs)
+        if not 'statsinterval' in kwargs: self.statsinterval = 1 #call the stats callback every round
         self.incomplete = True
         self.duplicates = kwargs['duplicates'] if 'duplicates' in kwargs else False
-        self.fringe = PriorityQueue(states, lambda x: x.score, self.minimize, length=0, blockworse=False, blockequal=False,duplicates= self.duplicates)
+        self.fringe = HeapPriorityQueue(states, self.scorer(), self.minimize, length=0, blockworse=False, blockequal=False,duplicates= self.duplicates)
 
     def __iter__(self):
         """Generator yielding *all* valid goalstates it can find"""
+        if self.batch:
+            for state in self.iterbatch():
+                yield state
+            return
         i = 0
+        stats = self.stats
         while len(self.fringe) > 0:
             i +=1 
             if self.debug: print("\t[pynlpl debug] *************** STARTING ROUND #" + str(i) + " ****************",file=stderr)
-            
-            b = 0
-            #Create a new empty fixed-length priority queue (this implies there will be pruning if more items are offered than it can hold!)
-            successors = PriorityQueue([], lambda x: x.score, self.minimize, length=self.beamsize, blockworse=False, blockequal=False,duplicates= self.duplicates)
-            
-            while len(self.fringe) > 0:
-                b += 1
-                if self.debug: print("\t[pynlpl debug] *************** ROUND #" + str(i) + " BEAM# " + str(b) + " ****************",file=stderr)
-                #if self.debug: print >>stderr,"\t[pynlpl debug] FRINGE: ", self.fringe
-
-                state = self.poll(self.fringe)()
-                if self.debug:
-                    try:
-                        print("\t[pynlpl debug] CURRENT STATE (depth " + str(state.depth()) + "): " + str(state),end="",file=stderr)
-                    except AttributeError:
-                        print("\t[pynlpl debug] CURRENT STATE: " + str(state),end="",file=stderr)
-                    print(" hash="+str(hash(state)),file=stderr)
-                    try:
-                        print(" score="+str(state.score()),file=stderr)
-                    except:
-                        pass
 
+            states = []
+            for state in self.collectround(states):
+                yield state
+            if not states:
+                break
 
-                if not self.usememory or (self.usememory and not hash(state) in self._visited):
-                    
-                    self.traversed += 1
-                    #Evaluate state
-                    if state.test(self.goalstates):
-                        if self.debug: print("\t[pynlpl debug] Valid goalstate, yielding",file=stderr)
-                        self.solutions += 1 #counts the number of solutions
-                        yield state
-                    elif self.debug:
-                        print("\t[pynlpl debug] (no goalstate, not yielding)",file=stderr)
-
-                    if self.eager:
-                        score = state.score()                    
-
-                    #Expand the specified state and offer to the fringe
-                    
-                    statecount = offers = 0
-                    for j, s in enumerate(state.expand()):
-                        statecount += 1
+            #Create a new empty fixed-length priority queue (this implies there will be pruning if more items are offered than it can hold!)
+            successors = HeapPriorityQueue([], self.scorer(), self.minimize, length=self.beamsize, blockworse=False, blockequal=False,duplicates= self.duplicates)
+            offers = 0
+            if stats: offered = stats.offers
+
+            #Expand the states (concurrently if an executor is set) and offer their successors in order
+            for b, (state, expansion) in enumerate(zip(states, self.expandstates(states))):
+                if self.debug: print("\t[pynlpl debug] *************** ROUND #" + str(i) + " BEAM# " + str(b+1) + " ****************",file=stderr)
+                if self.eager:
+                    score = state.score()
+                stateoffers = 0
+                for j, s in enumerate(expansion):
+                    if self.debug >= 2:
+                        print("\t[pynlpl debug] (Round #" + str(i) +" Beam #" + str(b+1) + ") Expanded state #" + str(j+1) + ", offering to successor pool: " + str(s),end="",file=stderr)
+                        try:
+                            print(s.score(),end="",file=stderr)
+                        except:
+                            print("ERROR SCORING!",end="",file=stderr)
+                            pass
+                    if not self.maxdepth or s.depth() <= self.maxdepth:
+                        if not self.eager or s.score() >= score: #if eager, use only equal or better successors
+                            stateoffers += 1
+                            accepted = successors.append(s) if stats is None else self.offer(successors, s)
+                        else:
+                            accepted = False
+                            if stats: stats.offers += 1
                         if self.debug >= 2:
-                            print("\t[pynlpl debug] (Round #" + str(i) +" Beam #" + str(b) + ") Expanded state #" + str(j+1) + ", offering to successor pool: " + str(s),end="",file=stderr)
-                            try:
-                                print(s.score(),end="",file=stderr)
-                            except:
-                                print("ERROR SCORING!",end="",file=stderr)
-                                pass
-                        if not self.maxdepth or s.depth() <= self.maxdepth:
-                            if not self.eager:
-                                #use all successors (even worse ones than the current state)
-                                offers += 1
-                                accepted = successors.append(s)
+                            if accepted:
+                                print(" ACCEPTED",file=stderr)
                             else:
-                                #use only equal or better successors
-                                if s.score() >= score:
-                                    offers += 1
-                                    accepted = successors.append(s)
-                                else:
-                                    accepted = False
-                            if self.debug >= 2:
-                                if accepted:
-                                    print(" ACCEPTED",file=stderr)
-                                else:
-                                    print(" REJECTED",file=stderr)
-                        else:                            
-                            if self.debug >= 2:
-                                print(" REJECTED, MAXDEPTH EXCEEDED.",file=stderr)
-                            elif self.debug:
-                                print("\t[pynlpl debug] Not offered to successor pool, maxdepth exceeded",file=stderr)
-                    if self.debug:
-                        print("\t[pynlpl debug] Expanded " + str(statecount) + " states, " + str(offers) + " offered to successor pool",file=stderr)
-                    if self.keeptraversal: self._traversal.append(state)
-                    if self.usememory: self._visited[hash(state)] = True
-                    self.prune(state) #calls prune method (does nothing by default in this search!!!)
-
-                else:
-                    if self.debug:
-                        print("\t[pynlpl debug] State already visited before, not expanding again... (hash=" + str(hash(state))  +")",file=stderr)
+                                print(" REJECTED",file=stderr)
+                    else:
+                        if stats: stats.beyondmaxdepth += 1
+                        if self.debug >= 2:
+                            print(" REJECTED, MAXDEPTH EXCEEDED.",file=stderr)
+                        elif self.debug:
+                            print("\t[pynlpl debug] Not offered to successor pool, maxdepth exceeded",file=stderr)
+                if self.debug:
+                    print("\t[pynlpl debug] Expanded " + str(len(expansion)) + " states, " + str(stateoffers) + " offered to successor pool",file=stderr)
+                offers += stateoffers
             #AFTER EXPANDING ALL NODES IN THE FRINGE/BEAM:
-            
+
             #set fringe for next round
             self.fringe = successors
+            if stats: self.endround(self.fringe, self.beamsize, offered)
 
             #Pruning is implicit, successors was a fixed-size priority queue
-            if self.debug: 
-                print("\t[pynlpl debug] (Round #" + str(i) + ") Implicitly pruned with beamsize " + str(self.beamsize) + "...",file=stderr)
-            #self.fringe.prune(self.beamsize)
-            if self.debug: print(" (" + str(offers) + " to " + str(len(self.fringe)) + " items)",file=stderr)
-        
+            if self.debug: print("\t[pynlpl debug] (Round #" + str(i) + ") Implicitly pruned with beamsize " + str(self.beamsize) + " (" + str(offers) + " to " + str(len(self.fringe)) + " items)",file=stderr)
+
+        if stats: self.endround(self.fringe, final=True)
         if self.debug:
-            print("\t[pynlpl debug] Search complete: " + str(self.solutions) + " solution(s), " + str(self.traversed) + " states traversed in " + str(i) + " rounds with " + str(b) + "  beams",file=stderr)            
-        
-        
-        
+            print("\t[pynlpl debug] Search complete: " + str(self.solutions) + " solution(s), " + str(self.traversed) + " states traversed in " + str(i) + " rounds",file=stderr)
+
+    def iterbatch(self):
+        """Generator yielding *all* valid goalstates it can find, in batch mode: the states of each round are expanded at once, all their successors are scored at once, and the best ones are selected for the next round with numpy.argpartition (successors with equal scores at the edge of the beam are selected in the order they were generated)"""
+        import numpy as np
+        i = 0
+        stats = self.stats
+        while len(self.fringe) > 0:
+            i += 1
+            if self.debug: print("\t[pynlpl debug] *************** STARTING ROUND #" + str(i) + " (BATCH) ****************",file=stderr)
+
+            states = []
+            for state in self.collectround(states):
+                yield state
+            if not states:
+                break
+
+            if stats: offered = stats.offers
+            successors, parents = self.expandbatch(states)
+            if self.debug: print("\t[pynlpl debug] Expanded " + str(len(states)) + " states to " + str(len(successors)) + " successors",file=stderr)
+            if not successors:
+                if stats: self.endround(self.fringe, self.beamsize, offered) #the fringe is empty
+                break
+            if stats:
+                stats.offers += len(successors)
+                begin = timer()
+            scores = np.asarray(self.scorebatch(successors), dtype=float)
+            if self.eager:
+                #use only equal or better successors
+                parentscores = np.asarray(self.scorebatch(states), dtype=float)
+                keep = np.flatnonzero(scores >= parentscores[parents])
+                successors = [ successors[j] for j in keep ]
+                scores = scores[keep]
+            if stats:
+                stats.scoretime += timer() - begin
+                begin = timer()
+            selection = topk(scores, self.beamsize, self.minimize)
+            if self.debug: print("\t[pynlpl debug] (Round #" + str(i) + ") Pruned with beamsize " + str(self.beamsize) + " (" + str(len(successors)) + " to " + str(len(selection)) + " items)",file=stderr)
+
+            #set fringe for next round
+            self.fringe = HeapPriorityQueue([], lambda x: x.score, self.minimize, length=0, blockworse=False, blockequal=False,duplicates= self.duplicates)
+            self.fringe.reset([ (scores[j], successors[j]) for j in selection ])
+            if stats:
+                stats.queuetime += timer() - begin
+                self.endround(self.fringe, self.beamsize, offered)
+
+        if stats: self.endround(self.fringe, final=True)
+        if self.debug:
+            print("\t[pynlpl debug] Search complete: " + str(self.solutions) + " solution(s), " + str(self.traversed) + " states traversed in " + str(i) + " rounds",file=stderr)
+
+    def collectround(self, states):
+        """Polls all states from the fringe, yields those that are valid goalstates and appends those that are to be expanded (i.e. not visited before) to states"""
+        while len(self.fringe) > 0:
+            state = self.poll(self.fringe)()
+            if self.debug:
+                try:
+                    print("\t[pynlpl debug] CURRENT STATE (depth " + str(state.depth()) + "): " + str(state),end="",file=stderr)
+                except AttributeError:
+                    print("\t[pynlpl debug] CURRENT STATE: " + str(state),end="",file=stderr)
+                print(" hash="+str(hash(state)),file=stderr)
+                try:
+                    print(" score="+str(state.score()),file=stderr)
+                except:
+                    pass
+            if not self.usememory or (self.usememory and not hash(state) in self._visited):
+                self.traversed += 1
+                if state.test(self.goalstates):
+                    if self.debug: print("\t[pynlpl debug] Valid goalstate, yielding",file=stderr)
+                    self.solutions += 1 #counts the number of solutions
+                    yield state
+                elif self.debug:
+                    print("\t[pynlpl debug] (no goalstate, not yielding)",file=stderr)
+                states.append(state)
+                if self.keeptraversal: self._traversal.append(state)
+                if self.usememory: self._visited.add(hash(state))
+                self.prune(state) #calls prune method (does nothing by default in this search!!!)
+            else:
+                if self.debug:
+                    print("\t[pynlpl debug] State already visited before, not expanding again... (hash=" + str(hash(state))  +")",file=stderr)
+                if self.stats: self.stats.duplicates += 1
+
+    def expandstates(self, states):
+        """Expands the states, returns a list with a list of successor states for each of them (see AbstractSearchState.expand_batch()).
+
+        If an executor is set (a concurrent.futures.ThreadPoolExecutor or ProcessPoolExecutor), the states are divided into chunks of chunksize states (by default four chunks per CPU) that are expanded concurrently. The states are sent to the workers without their parent (their depth is retained), and the successors are attached to the original states again when they come back; so expand() should not depend on the path to a state. With a ProcessPoolExecutor, states and successors are pickled, and any data they share at class level has to be available in the worker processes (set before they are started, for instance)."""
+        begin = timer()
+        if not self.executor:
+            expansions = states[0].expand_batch(states)
+        else:
+            expansions = self.expandconcurrently(states)
+        if self.stats:
+            self.stats.expandtime += timer() - begin
+            self.stats.expanded += len(states)
+            self.stats.generated += sum( len(expansion) for expansion in expansions )
+        return expansions
+
+    def expandconcurrently(self, states):
+        chunksize = self.chunksize or max(1, -(-len(states) // (4 * multiprocessing.cpu_count())))
+        chunks = [ [ detachstate(state) for state in states[j:j+chunksize] ] for j in range(0, len(states), chunksize) ]
+        expansions = []
+        for chunkexpansions in self.executor.map(expandchunk, chunks): #map() returns the results in order
+            expansions += chunkexpansions
+        for state, expansion in zip(states, expansions):
+            for s in expansion:
+                if s.parent is None:
+                    s.parent = state
+        return expansions
+
+    def expandbatch(self, states):
+        """Expands the states at once, returns the successors (within the maximum depth, without duplicates unless these are allowed) and, for each of them, the index of the state it was expanded from"""
+        successors = []
+        parents = []
+        seen = set()
+        for parent, expansion in enumerate(self.expandstates(states)):
+            for s in expansion:
+                if self.maxdepth and s.depth() > self.maxdepth:
+                    if self.stats: self.stats.beyondmaxdepth += 1
+                    continue
+                if not self.duplicates:
+                    try:
+                        n = len(seen)
+                        seen.add(s)
+                        if len(seen) == n:
+                            if self.stats: self.stats.offers += 1 #and rejected
+                            continue
+                    except Exception: #unhashable
+                        pass
+                successors.append(s)
+                parents.append(parent)
+        return successors, parents
+
+    def scorebatch(self, states):
+        return states[0].score_batch(states)
+
+
+def detachstate(state):
+    """Returns a shallow copy of the state without its parent (but with its depth), to send to the worker processes of BeamSearch in parallel mode"""
+    detached = copy.copy(state)
+    detached._depth = state.depth()
+    detached.parent = None
+    return detached
+
+def expandchunk(states):
+    """Expands the (detached) states in a worker of BeamSearch in parallel mode; the successors are returned without their parent"""
+    expansions = type(states[0]).expand_batch(states)
+    for state, expansion in zip(states, expansions):
+        for s in expansion:
+            if s.parent is state:
+                s.parent = None
+    return expansions
+
+def topk(scores, k, minimize=False):
+    """Returns the indices of the k best scores (a NumPy array), from best to worst; of equal scores, those with the lowest index are selected and come first"""
+    import numpy as np
+    keys = scores if minimize else -scores
+    if k < len(keys):
+        kth = keys[np.argpartition(keys, k - 1)[k - 1]]
+        better = np.flatnonzero(keys < kth)
+        selection = np.concatenate((better, np.flatnonzero(keys == kth)[:k - len(better)]))
+    else:
+        selection = np.arange(len(keys))
+    return selection[np.lexsort((selection, keys[selection]))]
+
 
 class EarlyEagerBeamSearch(AbstractSearch):
     """A beam search that prunes early (after each state expansion) and eagerly (weeding out worse successors)"""
@@ -461,7 +790,7 @@ class EarlyEagerBeamSearch(AbstractSearch):
         assert isinstance(state, AbstractSearchState)
         self.beamsize = beamsize       
         super(EarlyEagerBeamSearch,self).__init__(**kwargs)
-        self.fringe = PriorityQueue(state, lambda x: x.score, self.minimize, length=0, blockworse=False, blockequal=False,duplicates= kwargs['duplicates'] if 'duplicates' in kwargs else False)
+        self.fringe = HeapPriorityQueue(state, self.scorer(), self.minimize, length=0, blockworse=False, blockequal=False,duplicates= kwargs['duplicates'] if 'duplicates' in kwargs else False)
         self.incomplete = True
     
     
@@ -502,7 +831,7 @@ class HillClimbingSearch(AbstractSearch): #TODO: TEST
     def __init__(self, state, **kwargs):
         assert isinstance(state, AbstractSearchState)
         super(HillClimbingSearch,self).__init__(**kwargs)
-        self.fringe = PriorityQueue([state], lambda x: x.score, self.minimize, length=0, blockworse=True, blockequal=False,duplicates=False)
+        self.fringe = HeapPriorityQueue([state], self.scorer(), self.minimize, length=0, blockworse=True, blockequal=False,duplicates=False)
 
 #From http://stackoverflow.com/questions/212358/binary-search-in-python
 def binary_search(a, x, lo=0, hi=None):   # can't use a to specify default for hi 
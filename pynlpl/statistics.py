@@ -172,7 +172,7 @@ class FrequencyList(object):
     def __add__(self, otherfreqlist):
         """Multiple frequency lists can be added together"""
         assert isinstance(otherfreqlist,FrequencyList)
-        product = FrequencyList(None,)
+        product = FrequencyList(None, self.casesensitive, self.dovalidation)
         for type, count in self.items():
             product.count(type,count)
         for type, count in otherfreqlist.items():
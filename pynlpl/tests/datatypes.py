@@ -12,7 +12,7 @@ import sys
 import unittest
 
 
-from pynlpl.datatypes import PriorityQueue
+from pynlpl.datatypes import PriorityQueue, HeapPriorityQueue, HashSet, BloomFilter, LRUSet
 
 values = [3,6,6,1,8,2]
 mintomax = sorted(values)
@@ -71,5 +71,106 @@ class PriorityQueueTest(unittest.TestCase):
         self.assertEqual(result, maxtomin[:4])                
 
 
+class HeapPriorityQueueTest(unittest.TestCase):
+    def test_append(self):
+        """Heap-based PriorityQueue"""
+        for minimize, length, blockworse, blockequal in ((True,0,False,False),(False,0,False,False),(False,0,True,False),(False,0,True,True),(True,0,True,False),(True,4,False,False),(False,4,False,False)):
+            pq = HeapPriorityQueue(values, lambda x: x, minimize, length, blockworse, blockequal)
+            self.assertEqual(list(iter(pq)), list(iter(PriorityQueue(values, lambda x: x, minimize, length, blockworse, blockequal))))
+
+    def test_pop(self):
+        """Heap-based PriorityQueue (pop)"""
+        pq = HeapPriorityQueue(values, lambda x: x, False, 4)
+        self.assertEqual([ pq.pop() for _ in range(0,4) ], maxtomin[:4])
+        self.assertRaises(IndexError, pq.pop)
+        pq = HeapPriorityQueue(values, lambda x: x, True)
+        pq.append(0)
+        self.assertEqual(pq.pop(), 0)
+        self.assertEqual(pq.pop(), 1)
+        self.assertEqual(pq[0], 2)
+        self.assertEqual(pq.score(1), 3)
+        self.assertEqual(len(pq), 5)
+
+    def test_duplicates(self):
+        """Heap-based PriorityQueue (without duplicates)"""
+        pq = HeapPriorityQueue(values, lambda x: x, False, 0, duplicates=False)
+        self.assertEqual(list(iter(pq)), [8,6,3,2,1])
+        self.assertFalse(pq.append(6))
+        pq.pop()
+        pq.pop()
+        self.assertTrue(pq.append(6))
+        pq = HeapPriorityQueue([[1],[2],[1]], lambda x: x[0], False, 0, duplicates=False) #unhashable items
+        self.assertEqual(list(iter(pq)), [[2],[1]])
+
+    def test_prune(self):
+        """Heap-based PriorityQueue (pruning)"""
+        pq = HeapPriorityQueue(values, lambda x: x, True)
+        pq.prunebyscore(6, retainequalscore=True)
+        self.assertEqual(list(iter(pq)), [1,2,3,6,6])
+        pq.prune(2)
+        self.assertEqual(list(iter(pq)), [1,2])
+        self.assertEqual(pq, PriorityQueue([2,1], lambda x: x, True))
+
+    def test_stochasticprune(self):
+        """Heap-based PriorityQueue (stochastic pruning)"""
+        kept = {}
+        for minimize in (False, True):
+            kept[minimize] = dict( (value, 0) for value in (1,2,4,8) )
+            for _ in range(0,1000):
+                pq = HeapPriorityQueue([1,2,4,8], lambda x: x, minimize)
+                pq.stochasticprune(2)
+                self.assertEqual(len(pq), 2)
+                self.assertEqual(list(iter(pq)), sorted(pq, reverse=not minimize))
+                for value in pq:
+                    kept[minimize][value] += 1
+        self.assertTrue(kept[False][8] > kept[False][4] > kept[False][2] > kept[False][1])
+        self.assertTrue(kept[True][1] > kept[True][2] > kept[True][4] > kept[True][8])
+        pq = HeapPriorityQueue([0,1,2,3], lambda x: x, True)
+        pq.stochasticprune(1)
+        self.assertEqual(list(iter(pq)), [0]) #zero is always kept when minimizing
+        pq = HeapPriorityQueue([0,1,2,3], lambda x: x, False)
+        pq.stochasticprune(3)
+        self.assertEqual(list(iter(pq)), [3,2,1]) #and dropped first when maximizing
+        pq.stochasticprune(5)
+        self.assertEqual(len(pq), 3)
+        self.assertRaises(ValueError, HeapPriorityQueue([-1,1], lambda x: x).stochasticprune, 1)
+
+
+class VisitedSetTest(unittest.TestCase):
+    def test_hashset(self):
+        """Compact hash set"""
+        keys = [ hash(str(i)) for i in range(0,10000) ] + list(range(-5,5))
+        hashset = HashSet(16)
+        for key in keys + keys:
+            hashset.add(key)
+        self.assertEqual(len(hashset), len(keys))
+        self.assertTrue(all( key in hashset for key in keys ))
+        self.assertFalse(any( hash(str(-i)) in hashset for i in range(1,10000) ))
+        self.assertEqual(sorted(hashset), sorted(keys))
+        hashset.clear()
+        self.assertFalse(0 in hashset or keys[0] in hashset)
+
+    def test_bloomfilter(self):
+        """Bloom filter"""
+        bloomfilter = BloomFilter(10000, 0.01)
+        added = sum( bloomfilter.add(hash(str(i))) for i in range(0,10000) ) #may have false positives already
+        self.assertTrue(added > 9900)
+        self.assertTrue(all( hash(str(i)) in bloomfilter for i in range(0,10000) )) #no false negatives
+        falsepositives = sum( hash(str(-i)) in bloomfilter for i in range(1,10001) )
+        self.assertTrue(falsepositives < 200)
+        self.assertFalse(bloomfilter.add(hash('0')))
+        self.assertEqual(len(bloomfilter), added)
+
+    def test_lruset(self):
+        """LRU set"""
+        lruset = LRUSet(3)
+        for key in (1,2,3):
+            lruset.add(key)
+        self.assertTrue(1 in lruset) #now most recently used
+        lruset.add(4)
+        self.assertEqual(list(lruset), [3,1,4])
+        self.assertFalse(2 in lruset)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+from pynlpl.datatypes import PriorityQueue, HeapPriorityQueue, HashSet, BloomFilter, LRUSet
+import time
+import sys
+import random
+import tracemalloc
+
+
+class Hypothesis(object):
+    """A search state as beam searches see it: a score, equality and a hash"""
+
+    def __init__(self, key, score):
+        self.key = key
+        self._score = score
+
+    def score(self):
+        return self._score
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __lt__(self, other):
+        return self._score < other._score
+
+    def __gt__(self, other):
+        return self._score > other._score
+
+
+def offers(n, keys=None):
+    """Returns n random hypotheses, with keys from a range of the specified size (so there are duplicates) or all distinct"""
+    random.seed(1)
+    return [ Hypothesis(random.randint(0, keys) if keys else i, random.random()) for i in range(0, n) ]
+
+def beam(queuetype, beamsize, hypotheses, duplicates=True):
+    """A round of beam search: all expansions are offered to a fixed-length queue, which evicts the worst"""
+    successors = queuetype([], lambda x: x.score, False, length=beamsize, duplicates=duplicates)
+    for hypothesis in hypotheses:
+        successors.append(hypothesis)
+    return list(successors)
+
+def fringe(queuetype, hypotheses):
+    """Best-first search: an unbounded fringe, the best state is popped and a few successors are added"""
+    queue = queuetype(hypotheses[:100], lambda x: x.score, True)
+    popped = []
+    i = 100
+    while len(queue) > 0:
+        popped.append(queue.pop())
+        queue.extend(hypotheses[i:i+3])
+        i += 3
+    return popped
+
+def measure(label, f, *args):
+    results = {}
+    for queuetype in (PriorityQueue, HeapPriorityQueue):
+        start = time.time()
+        results[queuetype] = f(queuetype, *args)
+        duration = time.time() - start
+        print("priorityqueue -- " + label + " -- " + queuetype.__name__ + " -- took " + str(round(duration,3)) + "s")
+    assert [ id(x) for x in results[PriorityQueue] ] == [ id(x) for x in results[HeapPriorityQueue] ], "Results differ"
+
+def priorityqueue(n):
+    """Compares PriorityQueue with HeapPriorityQueue under beam search and best-first search workloads (n offers each)"""
+    hypotheses = offers(n)
+    for beamsize in (10, 100, 1000, 10000):
+        measure("beam of " + str(beamsize) + ", " + str(n) + " offers", beam, beamsize, hypotheses)
+    improving = sorted(hypotheses, key=lambda x: x.score())
+    measure("beam of 10000, " + str(n) + " offers, each better than the last (all accepted)", beam, 10000, improving)
+    measure("beam of 1000, " + str(n) + " offers, without duplicates", beam, 1000, offers(n, n // 10), False)
+    measure("unbounded fringe, " + str(n) + " appends and pops", fringe, hypotheses)
+
+def visitedsets(n):
+    """Compares the memory and time it takes to add the hashes of n states to the visited-state memories of the searches, and to look them up"""
+    random.seed(1)
+    states = [ str(random.random()) for _ in range(0, n) ] #hashed in the loops, so the visited-state memories own the hashes, as in a search
+    scenarios = [
+        ('exact (set)', set),
+        ('compact (HashSet)', HashSet),
+        ('bloom (BloomFilter, error rate 0.001)', lambda: BloomFilter(n, 0.001)),
+        ('lru (LRUSet, size n/10)', lambda: LRUSet(n // 10)),
+    ]
+    for label, f in scenarios:
+        tracemalloc.start()
+        visited = f()
+        for state in states:
+            visited.add(hash(state))
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del visited
+        start = time.time()
+        visited = f()
+        for state in states:
+            visited.add(hash(state))
+        duration = time.time() - start
+        start = time.time()
+        found = sum( 1 for state in states if hash(state) in visited )
+        lookupduration = time.time() - start
+        print("visitedsets -- " + label + " -- " + str(n) + " hashes, " + str(round(memory / n, 1)) + " bytes per hash, adding took " + str(round(duration,3)) + "s, looking up took " + str(round(lookupduration,3)) + "s, " + str(found) + " found")
+
+BENCHMARKS = ('priorityqueue','visitedsets')
+
+def main():
+    try:
+        args = sys.argv[1:]
+        if args[0] in ('all',) + BENCHMARKS or ',' in args[0]:
+            selectedtests = args.pop(0).split(',')
+        else:
+            selectedtests = ['all']
+        n = int(args[0]) if args else 100000
+    except:
+        print("Syntax: datatypes_benchmark [testfunctions] [n]",file=sys.stderr)
+        print(" testfunctions is a comma separated list of: " + ", ".join(BENCHMARKS) + ", or the special keyword 'all'", file=sys.stderr)
+        sys.exit(2)
+
+    for f in BENCHMARKS:
+        if f in selectedtests or 'all' in selectedtests:
+            globals()[f](n)
+
+if __name__ == '__main__':
+    main()
@@ -2261,6 +2261,215 @@ class Test4Create(unittest.TestCase):
 
         self.assertEqual( len(self.doc.index[self.doc.id + '.s.1']), 5)
 
+    def test002_slots(self):
+        """Creating a FoLiA Document from scratch - Token-level elements have no instance dictionary"""
+        doc = folia.Document(id='example')
+        doc.declare(folia.PosAnnotation, 'adhocpos')
+        sentence = doc.append( folia.Text(doc, id=doc.id + '.text.1') ).append( folia.Sentence, id=doc.id + '.s.1' )
+        word = sentence.append( folia.Word, 'online', space=False )
+        pos = word.append( folia.PosAnnotation, cls='ADJ', set='adhocpos' )
+        pos.append( folia.HeadFeature, cls='ADJ')
+        for e in (word, word.textcontent(), pos, next(pos.select(folia.HeadFeature))):
+            self.assertFalse( hasattr(e, '__dict__'), repr(e) )
+        #generic attributes behave as before
+        self.assertEqual( word.id, doc.id + '.s.1.w.1' )
+        self.assertEqual( word.text(), 'online' )
+        self.assertEqual( word.space, False )
+        self.assertEqual( word.annotator, None )
+        self.assertEqual( pos.cls, 'ADJ' )
+        self.assertEqual( pos.feat('head'), 'ADJ' )
+        word.confidence = 0.5
+        self.assertEqual( word.confidence, 0.5 )
+        self.assertEqual( word.copy(), word )
+
+    def test003_selectindex(self):
+        """Creating a FoLiA Document from scratch - Select index is kept up to date"""
+        doc = folia.Document(id='example')
+        doc.declare(folia.PosAnnotation, 'adhocpos')
+        sentence = doc.append( folia.Text ).append( folia.Sentence )
+        for text in ('De','site','staat'):
+            sentence.append( folia.Word, text )
+        self.assertEqual( [ w.text() for w in doc.words() ], ['De','site','staat'] )
+        self.assertEqual( doc.count(folia.Word), 3 )
+        self.assertTrue( doc.selectindex )
+
+        #appending at the end of the document extends the index
+        sentence.append( folia.Word, 'online')
+        self.assertEqual( [ w.text() for w in doc.words() ], ['De','site','staat','online'] )
+        #inserting elsewhere keeps document order
+        sentence.insert( 0, folia.Word, 'Nu')
+        self.assertEqual( [ w.text() for w in doc.words() ], ['Nu','De','site','staat','online'] )
+        sentence.remove( doc.words(1) )
+        self.assertEqual( [ w.text() for w in doc.words() ], ['Nu','site','staat','online'] )
+        #annotations that are not selected don't affect the words
+        doc.words(0).append( folia.PosAnnotation, cls='ADV', set='adhocpos')
+        self.assertEqual( doc.count(folia.PosAnnotation, 'adhocpos'), 1 )
+        self.assertEqual( doc.count(folia.Word), 4 )
+        #elements in a new text
+        doc.append( folia.Text ).append( folia.Sentence ).append( folia.Word, '!')
+        self.assertEqual( [ w.text() for w in doc.words() ], ['Nu','site','staat','online','!'] )
+        self.assertEqual( list(doc.words()), list(doc._select(folia.Word, None, True, folia.default_ignore_structure)) )
+
+    def test004_textcache(self):
+        """Creating a FoLiA Document from scratch - Cached text is invalidated on changes"""
+        doc = folia.Document(id='example')
+        paragraph = doc.append( folia.Text ).append( folia.Paragraph )
+        sentence = paragraph.append( folia.Sentence )
+        for text in ('De','site','staat'):
+            sentence.append( folia.Word, text )
+        self.assertEqual( paragraph.text(), 'De site staat' )
+        self.assertEqual( paragraph.text(retaintokenisation=True), 'De site staat' )
+        self.assertEqual( paragraph.text(normalize_spaces=True), 'De site staat' )
+        self.assertEqual( sentence.text(previousdelimiter='> '), '> De site staat' )
+        self.assertTrue( paragraph._textcache ) #pylint: disable=protected-access
+
+        sentence.append( folia.Word, 'online', space=False )
+        self.assertEqual( paragraph.text(), 'De site staat online' )
+        sentence.words(0).settext('Het')
+        self.assertEqual( paragraph.text(), 'Het site staat online' )
+        sentence.insert( 0, folia.Word, 'Nu')
+        self.assertEqual( paragraph.text(), 'Nu Het site staat online' )
+        sentence.remove( sentence.words(1) )
+        self.assertEqual( paragraph.text(), 'Nu site staat online' )
+        sentence.words(-1).textcontent().settext('offline')
+        self.assertEqual( paragraph.text(), 'Nu site staat offline' )
+        sentence.append( folia.Word, '.' )
+        self.assertEqual( paragraph.text(), 'Nu site staat offline.' )
+        #direct manipulation requires explicit invalidation
+        sentence.words(-2).space = True
+        sentence.words(-2).cleartextcache()
+        self.assertEqual( paragraph.text(), 'Nu site staat offline .' )
+        #elements without text are cached as such too
+        empty = paragraph.append( folia.Sentence )
+        self.assertRaises( folia.NoSuchText, empty.text )
+        self.assertRaises( folia.NoSuchText, empty.text )
+        empty.append( folia.Word, 'Klaar' )
+        self.assertEqual( empty.text(), 'Klaar' )
+
+class Test4Writer(unittest.TestCase):
+    def test001_write(self):
+        """Streaming writer - Writing a document incrementally"""
+        doc = folia.Document(id='example')
+        doc.declare(folia.PosAnnotation, 'adhocpos')
+        doc.metadata['language'] = 'nld'
+        with folia.Writer(os.path.join(TMPDIR,'foliatest.writer.xml'), doc) as writer:
+            for i in range(3):
+                sentence = writer.append(folia.Sentence)
+                for text in ('De','site','staat','online','.'):
+                    sentence.append(folia.Word, text).append(folia.PosAnnotation, cls='X', set='adhocpos')
+                self.assertEqual( sentence.id, 'example.text.s.' + str(i+1) )
+            writer.append( folia.Paragraph(doc, folia.Sentence(doc, folia.Word(doc, 'Klaar', id='example.p.1.s.1.w.1'), id='example.p.1.s.1'), id='example.p.1') )
+        #written elements are no longer held in memory
+        self.assertEqual( list(doc.index.keys()), ['example.text'] )
+
+        doc = folia.Document(file=os.path.join(TMPDIR,'foliatest.writer.xml'))
+        self.assertEqual( doc.metadata['language'], 'nld' )
+        self.assertEqual( doc.count(folia.Sentence), 4 )
+        self.assertEqual( doc['example.text.s.2'].text(), 'De site staat online .' )
+        self.assertEqual( doc['example.text.s.2.w.4'].pos(), 'X' )
+        self.assertEqual( doc.paragraphs(0).text(), 'Klaar' )
+
+    def test002_write_compressed(self):
+        """Streaming writer - Writing a gzip compressed document"""
+        doc = folia.Document(id='example')
+        writer = folia.Writer(os.path.join(TMPDIR,'foliatest.writer.xml.gz'), doc, textid='example.text.1')
+        writer.append(folia.Sentence).append(folia.Word, 'Hallo')
+        writer.close()
+        doc = folia.Document(file=os.path.join(TMPDIR,'foliatest.writer.xml.gz'))
+        self.assertEqual( doc.data[0].id, 'example.text.1' )
+        self.assertEqual( doc.text(), 'Hallo' )
+
+    def test003_namespace(self):
+        """Streaming writer - The namespace is declared once, by the root element"""
+        doc = folia.Document(id='example')
+        doc.declare(folia.PosAnnotation, 'adhocpos')
+        with folia.Writer(os.path.join(TMPDIR,'foliatest.writer.xml'), doc) as writer:
+            for i in range(3):
+                writer.append(folia.Sentence).append(folia.Word, 'Hallo').append(folia.PosAnnotation, cls='X', set='adhocpos')
+        with io.open(os.path.join(TMPDIR,'foliatest.writer.xml'),'r',encoding='utf-8') as f:
+            xml = f.read()
+        self.assertEqual( xml.count('xmlns="' + folia.NSFOLIA + '"'), 1 )
+        self.assertNotIn( 'ns0', xml )
+        doc = folia.Document(file=os.path.join(TMPDIR,'foliatest.writer.xml'))
+        self.assertEqual( [ word.pos() for word in doc.words() ], ['X','X','X'] )
+
+class Test4Binary(unittest.TestCase):
+    def setUp(self):
+        self.xmlfile = os.path.join(TMPDIR,'foliatest.binary.xml')
+        self.binaryfile = os.path.join(TMPDIR,'foliatest.binary.bin')
+        with io.open(self.xmlfile,'w',encoding='utf-8') as f:
+            f.write(LAZYEXAMPLE)
+        if os.path.exists(self.binaryfile):
+            os.unlink(self.binaryfile)
+
+    def test001_roundtrip(self):
+        """Binary serialisation - Saving and reloading"""
+        doc = folia.Document(file=self.xmlfile)
+        doc.metadata['language'] = 'nld'
+        doc.savebinary(self.binaryfile)
+        bindoc = folia.Document(binaryfile=self.binaryfile)
+        self.assertEqual( bindoc.xmlstring(), doc.xmlstring() )
+        self.assertEqual( sorted(bindoc.index.keys()), sorted(doc.index.keys()) )
+        self.assertEqual( bindoc.filename, os.path.abspath(self.xmlfile) )
+        self.assertEqual( bindoc.metadata['language'], 'nld' )
+        self.assertTrue( bindoc.declared(folia.PosAnnotation, 'pos') )
+        word = bindoc['test.p.1.s.1.w.1']
+        self.assertTrue( word.doc is bindoc )
+        self.assertTrue( word.parent is bindoc['test.p.1.s.1'] )
+        #references in span annotations point to the same elements as the index
+        entity = list(bindoc.select(folia.Entity))[0]
+        self.assertTrue( entity.wrefs(0) is bindoc[entity.wrefs(0).id] )
+        #the document can be manipulated as usual
+        sentence = bindoc['test.p.1.s.1']
+        word = sentence.append(folia.Word, 'nieuw')
+        self.assertEqual( word.id, 'test.p.1.s.1.w.' + str(sentence.count(folia.Word)) )
+        self.assertTrue( word.id in bindoc )
+
+    def test002_cache(self):
+        """Binary serialisation - Using a binary file as cache for XML"""
+        doc = folia.Document(file=self.xmlfile, binaryfile=self.binaryfile)
+        self.assertTrue( os.path.exists(self.binaryfile) ) #created on first use
+        doc = folia.Document(file=self.xmlfile, binaryfile=self.binaryfile)
+        self.assertIsNone( doc.tree )
+        self.assertEqual( doc.text(), folia.Document(file=self.xmlfile).text() )
+
+    def test003_outdated(self):
+        """Binary serialisation - Outdated binary files are detected"""
+        folia.Document(file=self.xmlfile).savebinary(self.binaryfile)
+        #same content, different modification time: still valid (checksum matches)
+        os.utime(self.xmlfile, (0,0))
+        self.assertTrue( folia.Document(id='dummy').loadbinary(self.binaryfile) )
+        #changed content
+        with io.open(self.xmlfile,'w',encoding='utf-8') as f:
+            f.write(LAZYEXAMPLE.replace('test.p.1.s.1"', 'test.p.1.s.one"'))
+        self.assertFalse( folia.Document(id='dummy').loadbinary(self.binaryfile) )
+        doc = folia.Document(binaryfile=self.binaryfile) #falls back to the XML and updates the binary file
+        self.assertTrue( 'test.p.1.s.one' in doc )
+        doc = folia.Document(binaryfile=self.binaryfile)
+        self.assertTrue( 'test.p.1.s.one' in doc )
+
+    def test004_foreigndata(self):
+        """Binary serialisation - Foreign data (Dublin Core metadata)"""
+        xml = """<?xml version="1.0" encoding="UTF-8"?>
+<FoLiA xmlns="http://ilk.uvt.nl/folia" xml:id="test" version="{version}" generator="{generator}">
+<metadata type="dc">
+  <annotations>
+  </annotations>
+  <foreign-data xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier>mydoc</dc:identifier>
+    <dc:creator>proycon</dc:creator>
+  </foreign-data>
+</metadata>
+<text xml:id="test.text" />
+</FoLiA>""".format(version=folia.FOLIAVERSION, generator='pynlpl.formats.folia-v' + folia.LIBVERSION)
+        doc = folia.Document(string=xml)
+        doc.savebinary(self.binaryfile)
+        bindoc = folia.Document(binaryfile=self.binaryfile)
+        self.assertEqual( bindoc.metadatatype, "dc" )
+        self.assertEqual( bindoc.metadata.node.xpath('//dc:creator', namespaces={'dc':'http://purl.org/dc/elements/1.1/'})[0].text , 'proycon' )
+        parser = ElementTree.XMLParser(remove_blank_text=True) #the whitespace around the foreign data is not retained
+        self.assertEqual( ElementTree.tostring(ElementTree.fromstring(bindoc.xmlstring().encode('utf-8'), parser)), ElementTree.tostring(ElementTree.fromstring(doc.xmlstring().encode('utf-8'), parser)) )
+
 class Test5Correction(unittest.TestCase):
     def setUp(self):
         self.doc = folia.Document(id='example', textvalidation=True)
@@ -2660,6 +2869,54 @@ class Test9Reader(unittest.TestCase):
         matches = list(self.reader.findwords( folia.Pattern('bli','bla','blu', matchannotation=folia.SenseAnnotation) ))
         self.assertEqual( len(matches), 0 )
 
+class Test9ReaderStream(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for filename in ('foliatest.stream.xml','foliatest.stream.xml.gz'):
+            doc = folia.Document(id='example')
+            doc.declare(folia.PosAnnotation, 'adhocpos')
+            with folia.Writer(os.path.join(TMPDIR,filename), doc) as writer:
+                for i in range(3):
+                    paragraph = writer.append(folia.Paragraph)
+                    for text in ('De site staat online .','Hij is weer weg .'):
+                        sentence = paragraph.append(folia.Sentence)
+                        for word in text.split(' '):
+                            sentence.append(folia.Word, word).append(folia.PosAnnotation, cls='X', set='adhocpos')
+
+    def test001_multitarget(self):
+        """Stream reader - Iterating over multiple targets"""
+        reader = folia.Reader(os.path.join(TMPDIR,'foliatest.stream.xml'), (folia.Sentence, folia.Word))
+        #declarations are available before iteration starts
+        self.assertTrue( reader.doc.declared(folia.PosAnnotation, 'adhocpos') )
+        elements = list( (e.__class__, e.id) for e in reader )
+        self.assertEqual( len(elements), 6 * 6 )
+        #nested targets are yielded before their parent
+        self.assertEqual( elements[:6], [ (folia.Word, 'example.text.p.1.s.1.w.' + str(i)) for i in range(1,6) ] + [ (folia.Sentence, 'example.text.p.1.s.1') ] )
+
+    def test002_elements(self):
+        """Stream reader - Yielded elements are fully functional and purged afterwards"""
+        reader = folia.Reader(os.path.join(TMPDIR,'foliatest.stream.xml.gz'), folia.Sentence)
+        sentences = []
+        for sentence in reader:
+            self.assertEqual( sentence.count(folia.Word), 5 )
+            self.assertEqual( sentence.words(0).pos(), 'X' )
+            self.assertTrue( sentence.id in reader.doc )
+            sentences.append( sentence.text() )
+        self.assertEqual( sentences, ['De site staat online .','Hij is weer weg .'] * 3 )
+        self.assertFalse( 'example.text.p.3.s.2' in reader.doc )
+
+    def test003_reiterate(self):
+        """Stream reader - Iterating multiple times"""
+        reader = folia.Reader(os.path.join(TMPDIR,'foliatest.stream.xml'), folia.Paragraph)
+        self.assertEqual( len(list(reader)), 3 )
+        self.assertEqual( len(list(reader)), 3 )
+        matches = list(reader.findwords( folia.Pattern('weer','weg') ))
+        self.assertEqual( len(matches), 3 )
+
+    def test004_invalidtarget(self):
+        """Stream reader - Invalid target"""
+        self.assertRaises( ValueError, folia.Reader, os.path.join(TMPDIR,'foliatest.stream.xml'), str)
+
 class Test7XpathQuery(unittest.TestCase):
     def test050_findwords_xpath(self):
         """Xpath Querying - Collect all words (including non-authoritative)"""
@@ -2678,6 +2935,103 @@ class Test7XpathQuery(unittest.TestCase):
         self.assertEqual(count, 190)
 
 
+LAZYEXAMPLE = """<?xml version="1.0" encoding="UTF-8"?>
+<FoLiA xmlns="http://ilk.uvt.nl/folia" xmlns:xlink="http://www.w3.org/1999/xlink" xml:id="test" version="1.5">
+  <metadata type="native">
+    <annotations>
+      <token-annotation set="tok"/>
+      <pos-annotation set="pos"/>
+      <entity-annotation set="ent"/>
+    </annotations>
+  </metadata>
+  <text xml:id="test.text">
+    <div xml:id="test.div">
+      <p xml:id="test.p.1">
+        <s xml:id="test.p.1.s.1">
+          <w xml:id="test.p.1.s.1.w.1"><t>Hello</t><pos class="X"/></w>
+          <w xml:id="test.p.1.s.1.w.2"><t>world</t></w>
+        </s>
+      </p>
+      <p xml:id="test.p.2">
+        <s xml:id="test.p.2.s.1">
+          <w xml:id="test.p.2.s.1.w.1"><t>Bye</t></w>
+          <entities>
+            <entity class="per"><wref id="test.p.2.s.1.w.1" t="Bye"/></entity>
+          </entities>
+        </s>
+      </p>
+    </div>
+  </text>
+</FoLiA>"""
+
+class Test7LazyLoading(unittest.TestCase):
+    def test001_skeleton(self):
+        """Lazy loading - Only the skeleton is parsed initially"""
+        doc = folia.Document(string=LAZYEXAMPLE, mode=folia.Mode.LAZY)
+        self.assertEqual( list(doc.index.keys()), ['test.text'] )
+
+    def test002_select(self):
+        """Lazy loading - Selection only materialises what is needed"""
+        doc = folia.Document(string=LAZYEXAMPLE, mode=folia.Mode.LAZY)
+        entities = list(doc.select(folia.Entity))
+        self.assertEqual( len(entities), 1 )
+        self.assertEqual( entities[0].text(), "Bye" )
+        self.assertTrue( 'test.p.2.s.1.w.1' in doc.index )
+        self.assertFalse( 'test.p.1.s.1' in doc.index ) #first paragraph was never parsed
+
+    def test003_idlookup(self):
+        """Lazy loading - ID lookup materialises ancestors"""
+        doc = folia.Document(string=LAZYEXAMPLE, mode=folia.Mode.LAZY)
+        self.assertEqual( doc['test.p.1.s.1.w.2'].text(), "world" )
+        self.assertTrue( 'test.p.2.s.1' in doc )
+        self.assertEqual( doc['test.p.1.s.1.w.1'].pos(), "X" )
+
+    def test004_equality(self):
+        """Lazy loading - Lazily loaded document equals fully loaded document"""
+        doc = folia.Document(string=LAZYEXAMPLE, mode=folia.Mode.LAZY)
+        self.assertEqual( [ w.text() for w in doc.words() ], ["Hello","world","Bye"] )
+        self.assertEqual( doc.paragraphs(1).id, 'test.p.2' )
+        self.assertEqual( doc, folia.Document(string=LAZYEXAMPLE) )
+        self.assertEqual( doc.xmlstring(), folia.Document(string=LAZYEXAMPLE).xmlstring() )
+
+
+def countwords(doc):
+    """Used by Test7Corpus, must be picklable"""
+    return doc.id, len(list(doc.words()))
+
+class Test7Corpus(unittest.TestCase):
+    def setUp(self):
+        self.corpusdir = os.path.join(TMPDIR, 'foliatestcorpus')
+        for collection in ('', 'a'):
+            if not os.path.isdir(os.path.join(self.corpusdir, collection)):
+                os.makedirs(os.path.join(self.corpusdir, collection))
+        for i, collection in enumerate(('', '', 'a')):
+            with io.open(os.path.join(self.corpusdir, collection, 'doc' + str(i) + '.folia.xml'),'w',encoding='utf-8') as f:
+                f.write(LAZYEXAMPLE.replace('"test', '"doc' + str(i)))
+
+    def test001_sequential(self):
+        """Corpus - Sequential loading"""
+        docs = list(folia.Corpus(self.corpusdir))
+        self.assertEqual( sorted(doc.id for doc in docs), ['doc0','doc1','doc2'] )
+
+    def test002_parallel(self):
+        """Corpus - Parallel loading yields the same documents in the same order"""
+        docs = list(folia.Corpus(self.corpusdir))
+        pdocs = list(folia.Corpus(self.corpusdir, workers=2))
+        self.assertEqual( [ doc.id for doc in pdocs ], [ doc.id for doc in docs ] )
+        self.assertEqual( pdocs, docs )
+        self.assertEqual( [ w.text() for w in pdocs[0].words() ], ["Hello","world","Bye"] )
+
+    def test003_parallel_function(self):
+        """Corpus - Parallel processing with a custom function"""
+        results = sorted(folia.Corpus(self.corpusdir, workers=2, ordered=False, function=countwords))
+        self.assertEqual( results, [('doc0',3),('doc1',3),('doc2',3)] )
+
+    def test004_declaredsets(self):
+        """Corpus - Reading the declared sets"""
+        self.assertEqual( folia.declaredsets(os.path.join(self.corpusdir, 'doc0.folia.xml')), ['tok', 'pos', 'ent'] )
+
+
 class Test8Validation(unittest.TestCase):
     def test000_relaxng(self):
         """Validation - RelaxNG schema generation"""
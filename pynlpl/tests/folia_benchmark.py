@@ -7,6 +7,8 @@ import time
 import sys
 import os
 import glob
+import resource
+import tempfile
 try:
     from pympler import asizeof
 except ImportError:
@@ -50,6 +52,39 @@ def loadfile(**kwargs):
     doc = folia.Document(file=kwargs['filename'],bypassleak=False)
 
 
+def binaryspeedup(filename):
+    """Compares loading from XML with loading from a binary file written by savebinary()"""
+    binaryfile = os.path.join(tempfile.gettempdir(), 'folia_benchmark.' + os.path.basename(filename) + '.bin')
+    folia.Document(file=filename).savebinary(binaryfile)
+    times = {}
+    for key, kwargs in (('xml', {'file': filename}), ('binary', {'binaryfile': binaryfile})):
+        start = time.time()
+        for i in range(0, repetitions):
+            folia.Document(**kwargs)
+        times[key] = (time.time() - start) / repetitions
+    print("binaryspeedup -- Loading from XML versus binary -- on file " + filename + " -- xml " + str(round(times['xml'],4)) + "s, binary " + str(round(times['binary'],4)) + "s (" + str(round(os.path.getsize(binaryfile)/1024/1024,2)) + " MB), speedup " + str(round(times['xml'] / times['binary'],1)) + "x (averaged over " + str(repetitions) + " runs)")
+    os.unlink(binaryfile)
+
+FQLQUERIES = (
+    'SELECT w WHERE text = "house"',
+    'SELECT w WHERE text != "house" AND text != "the"',
+    'SELECT w WHERE text MATCHES "^hou"',
+    'SELECT pos WHERE class = "N" FOR w WHERE text != "the"',
+    'SELECT s WHERE (w HAS text = "house")',
+)
+
+def fqllatency(filename):
+    """Compares the per-document latency of a set of FQL queries parsed anew for every document with that of prepared queries"""
+    doc = folia.Document(file=filename)
+    times = {}
+    for key, getquery in (('parsed', fql.Query), ('prepared', fql.prepare)):
+        start = time.time()
+        for i in range(0, repetitions):
+            for q in FQLQUERIES:
+                getquery(q)(doc)
+        times[key] = (time.time() - start) / repetitions
+    print("fqllatency -- Per-document latency of " + str(len(FQLQUERIES)) + " FQL queries, parsed versus prepared -- on file " + filename + " -- parsed " + str(round(times['parsed']*1000,2)) + "ms, prepared " + str(round(times['prepared']*1000,2)) + "ms (averaged over " + str(repetitions) + " runs)")
+
 @timeit
 def savefile(**kwargs): #careful with SSDs
     """Saving file"""
@@ -71,6 +106,14 @@ def text(**kwargs):
     """text serialisation"""
     kwargs['doc'].text()
 
+@timeit
+def sentencetext(**kwargs):
+    """text serialisation of all sentences and paragraphs"""
+    for sentence in kwargs['doc'].sentences():
+        sentence.text()
+    for paragraph in kwargs['doc'].paragraphs():
+        paragraph.text()
+
 @timeit
 def countwords(**kwargs):
     """Counting words"""
@@ -148,18 +191,80 @@ def readerwords(**kwargs):
     for word in reader:
         pass
 
+@timeit
+def readerstream(**kwargs):
+    """Streaming sentences and words using Reader, reporting peak memory usage along the way"""
+    reader = folia.Reader(kwargs['filename'], (folia.Sentence, folia.Word))
+    checkpoint = 1000
+    for i, element in enumerate(reader):
+        if i + 1 == checkpoint:
+            print("\n\t" + str(checkpoint) + " elements read, peak memory usage " + str(round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,2)) + " MB", end="")
+            checkpoint *= 10
+    print("\n\t" + str(i+1) + " elements read, peak memory usage " + str(round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,2)) + " MB\n\t", end="")
+
+def syntheticdocument(filename, size):
+    """Writes a synthetic FoLiA document of approximately the specified size (in MB), using the streaming writer"""
+    print("Generating synthetic document " + filename + " of " + str(size) + " MB ...", file=sys.stderr)
+    doc = folia.Document(id='synthetic')
+    doc.declare(folia.PosAnnotation, 'synthetic-pos')
+    doc.declare(folia.LemmaAnnotation, 'synthetic-lemma')
+    with folia.Writer(filename, doc) as writer:
+        while writer.stream.tell() < size * 1024 * 1024:
+            paragraph = writer.append(folia.Paragraph)
+            for _ in range(10):
+                sentence = paragraph.append(folia.Sentence)
+                for j in range(15):
+                    word = sentence.append(folia.Word, 'word' + str(j))
+                    word.append(folia.PosAnnotation, cls='N', set='synthetic-pos')
+                    word.append(folia.LemmaAnnotation, cls='word', set='synthetic-lemma')
+
+class Unslotted(object):
+    """Plain object with an instance dictionary, used as a reference to estimate the footprint of dictionary-based elements"""
+    pass
+
+def attributes(element):
+    """Returns all instance attributes of an element, whether held in slots or in a dictionary"""
+    attribs = dict(getattr(element, '__dict__', {}))
+    for Class in type(element).__mro__:
+        for attr in Class.__dict__.get('__slots__', ()):
+            try:
+                attribs[attr] = object.__getattribute__(element, attr)
+            except AttributeError:
+                pass
+    return attribs
+
+def tokenfootprint(doc):
+    """Returns the number of tokens and the bytes per token for the (slotted) token-level elements, as well as for equivalent dictionary-based elements. Shared references (the document, parents, strings) are not counted."""
+    tokens = slotted = unslotted = 0
+    for word in doc.words():
+        tokens += 1
+        for e in [word] + list(word.select(folia.AbstractElement)):
+            slotted += asizeof.flatsize(e)
+            if hasattr(e, '__dict__'):
+                slotted += asizeof.flatsize(e.__dict__)
+            reference = Unslotted()
+            for attr, value in attributes(e).items():
+                setattr(reference, attr, value)
+            unslotted += asizeof.flatsize(reference) + asizeof.flatsize(reference.__dict__)
+    if not tokens:
+        return 0, 0, 0
+    return tokens, slotted / tokens, unslotted / tokens
+
+def isinput(arg):
+    return os.path.exists(arg) or arg.startswith('synthetic:')
+
 def main():
     global repetitions, target
     files = []
     try:
         begin = 1
-        if os.path.exists(sys.argv[1]):
+        if isinput(sys.argv[1]):
             begin = 1
             selectedtests = "all"
             repetitions = 1
         else:
             selectedtests = sys.argv[1].split(',')
-            if os.path.exists(sys.argv[2]):
+            if isinput(sys.argv[2]):
                 repetitions = 1
                 begin = 2
             else:
@@ -170,10 +275,18 @@ def main():
         print("Syntax: folia_benchmark [testfunctions [repetitions]] files-or-directories+",file=sys.stderr)
         print(" testfunctions is a comma separated list of function names, or the special keyword 'all'", file=sys.stderr)
         print(" directories are recursively searched for files with the extension folia.xml, +gz and +bz2 is supported too.", file=sys.stderr)
+        print(" synthetic:SIZE generates (once) and uses a synthetic document of SIZE MB, e.g. readerstream synthetic:1024", file=sys.stderr)
         sys.exit(2)
 
 
     for fd in filesordirs:
+        if fd.startswith('synthetic:'):
+            size = int(fd[10:])
+            filename = os.path.join(tempfile.gettempdir(), 'folia_benchmark.synthetic.' + str(size) + 'mb.folia.xml')
+            if not os.path.exists(filename):
+                syntheticdocument(filename, size)
+            files.append(filename)
+            continue
         if not os.path.exists(fd):
             raise Exception("No such file or directory" + fd)
         if os.path.isfile(fd):
@@ -189,24 +302,37 @@ def main():
                         files.append(filename)
 
 
-    for f in ('loadfile','loadfileleakbypass','readerwords'):
+    for f in ('loadfile','loadfileleakbypass','readerwords','readerstream'):
         if f in selectedtests or 'all' in selectedtests:
             for filename in files:
                 globals()[f](filename=filename)
 
 
-    for f in ('xml','text','json','countwords','selectwords','nextwords','ancestors','selectwordsfql','selectwordsfqlforp','selectwordsfqlxml','selectwordsfqlwhere','editwordsfql', 'addelement' ):
+    for f in ('xml','text','sentencetext','json','countwords','selectwords','nextwords','ancestors','selectwordsfql','selectwordsfqlforp','selectwordsfqlxml','selectwordsfqlwhere','editwordsfql', 'addelement' ):
         if f in selectedtests or 'all' in selectedtests:
             for filename in files:
                 doc = folia.Document(file=filename)
                 globals()[f](doc=doc)
 
+    for f in ('binaryspeedup','fqllatency'):
+        if f in selectedtests or 'all' in selectedtests:
+            for filename in files:
+                globals()[f](filename)
+
     for f in ('memtest',):
         if f in selectedtests or 'all' in selectedtests:
             for filename in files:
                 doc = folia.Document(file=filename)
                 print("memtest -- Memory test on document " + filename + " -- memory consumption estimated at " + str(round(asizeof.asizeof(doc) / 1024 / 1024,2)) + " MB" + " (filesize " + str(round(os.path.getsize(filename)/1024/1024,2)) + " MB)")
 
+    for f in ('memtokens',):
+        if f in selectedtests or 'all' in selectedtests:
+            for filename in files:
+                doc = folia.Document(file=filename)
+                tokens, slotted, unslotted = tokenfootprint(doc)
+                if tokens:
+                    print("memtokens -- Memory per token on document " + filename + " -- " + str(round(slotted)) + " bytes per token (dictionary-based: " + str(round(unslotted)) + " bytes per token, reduction " + str(round(100 * (1 - slotted / unslotted),1)) + "%) -- whole document " + str(round(asizeof.asizeof(doc) / tokens)) + " bytes per token (" + str(tokens) + " tokens)")
+
 
 
 if __name__ == '__main__':
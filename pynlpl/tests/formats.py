@@ -1,10 +1,17 @@
 import sys
 import os
 import unittest
+import tempfile
+import shutil
+import io
+import time
+import socket
+import subprocess
 
 sys.path.append(sys.path[0] + '/../../')
 os.environ['PYTHONPATH'] = sys.path[0] + '/../../'
 from pynlpl.formats.timbl import TimblOutput
+from pynlpl.formats.moses import PhraseTable, PhraseTableClient, compilephrasetable, phrasetablechunks, twistedimported
 if sys.version < '3':
     from StringIO import StringIO
 else:
@@ -80,3 +87,151 @@ class TimblTest(unittest.TestCase):
                 self.assertEqual(distribution['c'], 0.5)
                 self.assertEqual(distribution['e'], 0.5)
                 self.assertEqual(distance,1.0)
+
+
+PHRASETABLE = u"""the house ||| het huis ||| 0.5 0.25 0.1 0.2 ||| 0-0 1-1 |||
+the house ||| de woning ||| 0.3 0.15 0.1 0.2 ||| 0-0 1-1 |||
+zebra ||| zebra ||| 1 1 1 1 ||| 0-0 |||
+a ||| een ||| 0.9 0.8 0.7 0.6 ||| 0-0 |||
+a ||| \u00e9\u00e9n ||| 0.1 0.2 0.3 0.4 ||| 0-0 |||
+"""
+
+class PhraseTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'phrase-table')
+        with io.open(self.filename, 'w', encoding='utf-8') as f:
+            f.write(PHRASETABLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test1_dict(self):
+        """Moses phrase table - Loading in memory"""
+        phrasetable = PhraseTable(self.filename, quiet=True)
+        self.assertEqual(len(phrasetable), 3)
+        self.assertEqual(phrasetable['the house'], ((u'het huis', (0.5, 0.25, 0.1, 0.2)), (u'de woning', (0.3, 0.15, 0.1, 0.2))))
+        self.assertFalse('house' in phrasetable)
+
+    def test2_mmap(self):
+        """Moses phrase table - Compiled and memory-mapped"""
+        compiledfilename = self.filename + '.bin'
+        compilephrasetable(self.filename, compiledfilename, quiet=True)
+        phrasetable = PhraseTable(compiledfilename, backend='mmap')
+        self.assertEqual(len(phrasetable), 3)
+        self.assertTrue('zebra' in phrasetable)
+        self.assertFalse('house' in phrasetable)
+        self.assertFalse('zzz' in phrasetable)
+        self.assertEqual(phrasetable['the house'], PhraseTable(self.filename, quiet=True)['the house'])
+        self.assertEqual(phrasetable['a'], ((u'een', (0.9, 0.8, 0.7, 0.6)), (u'\u00e9\u00e9n', (0.1, 0.2, 0.3, 0.4))))
+        self.assertRaises(KeyError, phrasetable.__getitem__, 'house')
+        self.assertEqual([ source for source, _ in phrasetable ], [u'a', u'the house', u'zebra'])
+
+    def test3_mmap_runs(self):
+        """Moses phrase table - Compiled in multiple sorted runs"""
+        compilephrasetable(self.filename, self.filename + '.bin', quiet=True)
+        compilephrasetable(self.filename, self.filename + '.runs.bin', quiet=True, buffersize=2, tmpdir=self.tmpdir)
+        with open(self.filename + '.bin','rb') as f1, open(self.filename + '.runs.bin','rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['phrase-table', 'phrase-table.bin', 'phrase-table.runs.bin'])
+
+    def test4_mmap_invalid(self):
+        """Moses phrase table - Opening an uncompiled phrase table with the mmap backend"""
+        self.assertRaises(ValueError, PhraseTable, self.filename, backend='mmap')
+
+    def test5_chunks(self):
+        """Moses phrase table - Splitting in chunks at source phrase boundaries"""
+        chunks = phrasetablechunks(self.filename, 4)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], os.path.getsize(self.filename))
+        with open(self.filename,'rb') as f:
+            data = f.read()
+        for begin, end in chunks:
+            self.assertTrue(begin == 0 or data[begin-1:begin] == b"\n")
+            self.assertFalse(data[begin:end].startswith(b"the house ||| de woning"))
+            self.assertFalse(data[begin:end].startswith(u"a ||| \u00e9\u00e9n".encode('utf-8')))
+
+    def test6_workers(self):
+        """Moses phrase table - Loading in parallel"""
+        phrasetable = PhraseTable(self.filename, quiet=True, workers=2)
+        self.assertEqual(phrasetable.phrasetable, PhraseTable(self.filename, quiet=True).phrasetable)
+
+    def test7_keepscores(self):
+        """Moses phrase table - Keeping only some score columns, compactly"""
+        phrasetable = PhraseTable(self.filename, quiet=True, keepscores=[0,2], compactscores=True)
+        target, scores = phrasetable['a'][0]
+        self.assertEqual(target, u'een')
+        self.assertEqual(len(scores), 2)
+        self.assertAlmostEqual(scores[0], 0.9, places=5)
+        self.assertAlmostEqual(scores[1], 0.7, places=5)
+        phrasetable = PhraseTable(self.filename, quiet=True, keepscores=[0], scorefilter=lambda scores: scores[3] > 0.5)
+        self.assertEqual(phrasetable['a'], ((u'een', (0.9,)),))
+        self.assertFalse('the house' in phrasetable)
+
+    def test8_progress(self):
+        """Moses phrase table - Reporting progress when loading sequentially"""
+        with io.open(self.filename, 'w', encoding='utf-8') as f:
+            for i in range(0,250000):
+                f.write(u"w%d ||| v%d ||| 0.1 0.2 0.3 0.4\n" % (i, i))
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            phrasetable = PhraseTable(self.filename)
+            progress = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(len(phrasetable), 250000)
+        self.assertEqual([ line.split("\t")[0].strip() for line in progress.strip().split("\n") ], ["Loading phrase-table: @100000", "Loading phrase-table: @200000"])
+
+
+@unittest.skipIf(not twistedimported, "Twisted is not available")
+class PhraseTableServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'phrase-table')
+        with io.open(self.filename, 'w', encoding='utf-8') as f:
+            f.write(PHRASETABLE)
+        s = socket.socket()
+        s.bind(('localhost',0))
+        self.port = s.getsockname()[1]
+        s.close()
+        self.server = subprocess.Popen([sys.executable, '-c', 'import sys; from pynlpl.formats.moses import PhraseTable, PhraseTableServer; PhraseTableServer(PhraseTable(sys.argv[1], quiet=True), int(sys.argv[2]))', self.filename, str(self.port)], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        for _ in range(0,100):
+            try:
+                self.client = PhraseTableClient('localhost', self.port, poolsize=2, batchsize=2)
+                break
+            except socket.error:
+                time.sleep(0.1)
+        else:
+            self.fail("Phrase table server did not start")
+
+    def tearDown(self):
+        self.client.close()
+        self.server.terminate()
+        self.server.wait()
+        shutil.rmtree(self.tmpdir)
+
+    def test1_lookup(self):
+        """Moses phrase table - Client lookups"""
+        self.assertEqual(self.client['the house'], PhraseTable(self.filename, quiet=True)['the house'])
+        self.assertEqual(self.client[u'a'][1], (u'\u00e9\u00e9n', (0.1, 0.2, 0.3, 0.4)))
+        self.assertTrue('zebra' in self.client)
+        self.assertFalse('house' in self.client)
+        self.assertRaises(KeyError, self.client.__getitem__, 'house')
+
+    def test2_lookup_many(self):
+        """Moses phrase table - Client batched lookups"""
+        phrasetable = PhraseTable(self.filename, quiet=True)
+        phrases = ['a','house','the house','zebra','a','zzz','the house']
+        self.assertEqual(self.client.lookup_many(phrases), [ phrasetable.phrasetable.get(phrase) for phrase in phrases ])
+        self.assertEqual(list(self.client.cache.keys()), ['a','house','the house','zebra','zzz'])
+
+    def test3_cache(self):
+        """Moses phrase table - Client cache is bounded"""
+        self.client.cachesize = 2
+        self.client.lookup_many(['a','zebra','the house'])
+        self.assertEqual(list(self.client.cache.keys()), ['zebra','the house'])
+        self.assertTrue('zebra' in self.client)
+        self.assertEqual(list(self.client.cache.keys()), ['the house','zebra'])
@@ -29,6 +29,9 @@ import sys
 import os
 import unittest
 import io
+import shutil
+import threading
+import tempfile
 from pynlpl.formats import fql, folia, cql
 
 FOLIARELEASE = "v1.5.1.60"
@@ -1008,6 +1011,130 @@ class Test4Evaluation(unittest.TestCase):
         self.assertEqual(results[0][1].text(), "on")
         self.assertEqual(results[0][2].text(), "weer")
 
+class Test5Prepare(unittest.TestCase):
+    """Prepared queries, executed on multiple documents"""
+    def makedocument(self, posset):
+        doc = folia.Document(id='prepare')
+        doc.declare(folia.PosAnnotation, posset)
+        sentence = doc.append(folia.Text).append(folia.Sentence)
+        for text in ("the", "house", "on", "the", "hill"):
+            word = sentence.append(folia.Word, text=text)
+            if text != "hill":
+                word.append(folia.PosAnnotation, cls="n" if text == "house" else "x")
+        return doc
+
+    def test1_cache(self):
+        """Prepare - Queries are cached"""
+        q = fql.prepare(Q1)
+        self.assertIs(fql.prepare(Q1), q)
+        context = fql.Context()
+        context.format = "xml"
+        self.assertIsNot(fql.prepare(Q1, context), q)
+        self.assertIn(Q1, [key[0] for key in fql.PREPAREDCACHE])
+
+    def test2_eviction(self):
+        """Prepare - Least recently used queries are evicted"""
+        cachesize = fql.PREPAREDCACHESIZE
+        fql.PREPAREDCACHESIZE = 2
+        try:
+            q1 = fql.prepare(Qhas)
+            q2 = fql.prepare(Qhas_shortcut)
+            self.assertIs(fql.prepare(Qhas), q1)
+            fql.prepare(Qboolean) #evicts Qhas_shortcut
+            self.assertIs(fql.prepare(Qhas), q1)
+            self.assertIsNot(fql.prepare(Qhas_shortcut), q2)
+            self.assertEqual(len(fql.PREPAREDCACHE), 2)
+        finally:
+            fql.PREPAREDCACHESIZE = cachesize
+
+    def test3_reuse(self):
+        """Prepare - Executing a prepared query on multiple documents"""
+        for query in ('SELECT w WHERE text = "the"', 'SELECT w WHERE NOT (text = "the" OR text = "on")', 'SELECT w WHERE (PREVIOUS w WHERE text = "the")', 'SELECT pos WHERE class = "n" FOR w WHERE text != "house"', 'SELECT s WHERE (w HAS text = "hill")'):
+            q = fql.prepare(query)
+            for i in range(0,2):
+                doc = self.makedocument("posset")
+                self.assertEqual([ e.id for e in q(doc) ], [ e.id for e in fql.Query(query)(doc) ])
+
+    def test4_defaultset(self):
+        """Prepare - Default sets are resolved for each document"""
+        q = fql.prepare('ADD pos WITH class "y" FOR w WHERE text = "hill"')
+        for posset in ("posset1", "posset2"):
+            results = q(self.makedocument(posset))
+            self.assertEqual(len(results), 1)
+            self.assertEqual(results[0].set, posset)
+
+    def test5_reexecute(self):
+        """Prepare - Executing a prepared query on the same document again"""
+        doc = self.makedocument("posset")
+        q = fql.prepare('EDIT pos WITH class "y" FOR w')
+        self.assertEqual(len(q(doc)), 4)
+        self.assertEqual(len(q(doc)), 4)
+
+    def test6_unaltered(self):
+        """Prepare - Executing a prepared query does not alter it, also not from multiple threads"""
+        q = fql.prepare('ADD pos WITH class "y" FOR ID "prepare.text.1.s.1.w.5"')
+        self.assertEqual(len(q(self.makedocument("posset1"))), 1)
+        self.assertIsNone(q.action.focus.set)
+        self.assertEqual(q.action.assignments, {'class': 'y'})
+        self.assertIsNone(q.targets.targets[0].Class)
+        self.assertFalse(hasattr(q, 'doc'))
+        q = fql.prepare('SELECT w WHERE (PREVIOUS w WHERE text = "the")')
+        docs = [ self.makedocument("posset") for _ in range(0,8) ]
+        results = {}
+        threads = [ threading.Thread(target=lambda i=i: results.__setitem__(i, [ e.id for e in q(docs[i]) ])) for i in range(0,8) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(list(results.values()), [ [ e.id for e in fql.Query('SELECT w WHERE (PREVIOUS w WHERE text = "the")')(docs[0]) ] ] * 8)
+
+
+class Test6Corpus(unittest.TestCase):
+    """Executing queries on a corpus"""
+    def setUp(self):
+        self.corpusdir = tempfile.mkdtemp()
+        self.files = []
+        for i, text in enumerate(("house", "hill", "house")):
+            doc = folia.Document(id='corpus' + str(i))
+            sentence = doc.append(folia.Text).append(folia.Sentence)
+            sentence.append(folia.Word, text="the")
+            sentence.append(folia.Word, text=text)
+            filename = os.path.join(self.corpusdir, 'doc' + str(i) + '.folia.xml')
+            doc.save(filename)
+            self.files.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.corpusdir)
+
+    def test1_read(self):
+        """Corpus - Selecting"""
+        for workers in (None, 2):
+            results = dict(fql.run_corpus('SELECT w WHERE text = "house"', self.files, workers))
+            self.assertEqual(sorted(results), self.files)
+            self.assertEqual(len(results[self.files[0]]), 1)
+            self.assertTrue(results[self.files[0]][0].startswith("<w"))
+            self.assertEqual(results[self.files[1]], [])
+
+    def test2_directory(self):
+        """Corpus - Selecting in a directory, in corpus order"""
+        results = list(fql.run_corpus('SELECT w WHERE text = "house" FORMAT json', self.corpusdir, 2, ordered=True))
+        self.assertEqual([ filename for filename, _ in results ], list(folia.CorpusFiles(self.corpusdir)))
+        self.assertEqual(len(results), 3)
+
+    def test3_edit(self):
+        """Corpus - Editing"""
+        results = list(fql.run_corpus('EDIT w WHERE text = "the" WITH text "a"', self.files, 2, mode='edit'))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sorted(os.listdir(self.corpusdir)), ['doc0.folia.xml', 'doc1.folia.xml', 'doc2.folia.xml'])
+        self.assertEqual(folia.Document(file=self.files[0]).text(), "a house")
+        self.assertEqual(folia.Document(file=self.files[1]).text(), "a hill")
+
+    def test4_error(self):
+        """Corpus - Errors"""
+        files = self.files + [os.path.join(self.corpusdir, 'missing.folia.xml')]
+        self.assertRaises(IOError, list, fql.run_corpus('SELECT w', files, 2))
+        self.assertEqual(len(list(fql.run_corpus('SELECT w', files, 2, ignoreerrors=True))), 3)
+        self.assertRaises(ValueError, list, fql.run_corpus('SELECT w', files, mode='write'))
+
+
 if os.path.exists('../../FoLiA'):
     FOLIAPATH = '../../FoLiA/'
 elif os.path.exists('../FoLiA'):
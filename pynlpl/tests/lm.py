@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#---------------------------------------------------------------
+# PyNLPl - Test Units for Language Models
+#   by Maarten van Gompel, ILK, Universiteit van Tilburg
+#   http://ilk.uvt.nl/~mvgompel
+#   proycon AT anaproy DOT nl
+#
+#   Licensed under GPLv3
+#
+#----------------------------------------------------------------
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+
+import sys
+import os
+import io
+import unittest
+import tempfile
+import shutil
+import threading
+import socket
+import math
+import time
+
+from pynlpl.lm.lm import SimpleLanguageModel, ARPALanguageModel, CountStore, countcorpus, mergecounts
+from pynlpl.lm.client import LMClient
+
+
+sentences = ["the cat sat on the mat", "the dog sat on the cat", "a cat ran"]
+
+ARPA = """
+\\data\\
+ngram 1=6
+ngram 2=4
+
+\\1-grams:
+-1.0\t<unk>
+-0.5\tthe\t-0.3
+-0.8\tcat\t-0.2
+-0.9\tsat
+-1.1\ton
+-1.2\tmat
+
+\\2-grams:
+-0.2\tthe cat
+-0.4\tcat sat
+-0.3\tsat on
+-0.1\ton the
+
+\\end\\
+"""
+
+def simplelanguagemodel():
+    lm = SimpleLanguageModel(2)
+    for sentence in sentences:
+        lm.append(sentence)
+    return lm
+
+
+class SimpleLanguageModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def load(self, filename):
+        lm = SimpleLanguageModel()
+        lm.load(filename)
+        return lm
+
+    def assertSameModel(self, lm, reference):
+        self.assertEqual(lm.n, reference.n)
+        self.assertEqual(lm.sentences, reference.sentences)
+        self.assertEqual(dict(lm.freqlistN.items()), dict(reference.freqlistN.items()))
+        self.assertEqual(dict(lm.freqlistNm1.items()), dict(reference.freqlistNm1.items()))
+        self.assertEqual(lm.freqlistN.total, reference.freqlistN.total)
+        self.assertEqual(lm.freqlistNm1.total, reference.freqlistNm1.total)
+        for ngram, _ in reference.freqlistN.items():
+            if reference.freqlistNm1[ngram[:-1]]:
+                self.assertEqual(lm[ngram], reference[ngram])
+
+    def test1_binary(self):
+        """Simple language model - Saving and loading binary counts"""
+        lm = simplelanguagemodel()
+        lm.save(os.path.join(self.tmpdir, 'lm.counts'), binary=True)
+        lm.save(os.path.join(self.tmpdir, 'lm.txt'))
+        self.assertSameModel(self.load(os.path.join(self.tmpdir, 'lm.counts')), lm)
+        self.assertSameModel(self.load(os.path.join(self.tmpdir, 'lm.txt')), lm)
+
+    def test2_spill(self):
+        """Simple language model - Counting within a memory budget"""
+        store = CountStore(2, maxentries=5, tmpdir=self.tmpdir)
+        for sentence in sentences * 3:
+            store.append(sentence)
+        self.assertTrue(len(store.runs) > 1)
+        store.save(os.path.join(self.tmpdir, 'lm.counts'))
+        self.assertEqual(os.listdir(self.tmpdir), ['lm.counts']) #the runs have been removed
+        reference = SimpleLanguageModel(2)
+        for sentence in sentences * 3:
+            reference.append(sentence)
+        self.assertSameModel(self.load(os.path.join(self.tmpdir, 'lm.counts')), reference)
+        for beginmarker, endmarker in (("<S>", None), (None, "</S>")):
+            store = CountStore(3, False, beginmarker, endmarker)
+            reference = SimpleLanguageModel(3, False, beginmarker, endmarker)
+            for sentence in sentences + ["The Cat"]:
+                store.append(sentence)
+                reference.append(sentence)
+            store.save(os.path.join(self.tmpdir, 'lm.counts'))
+            self.assertSameModel(self.load(os.path.join(self.tmpdir, 'lm.counts')), reference)
+
+    def test3_merge(self):
+        """Simple language model - Merging counts"""
+        first, second = SimpleLanguageModel(2), SimpleLanguageModel(2)
+        first.append(sentences[0])
+        for sentence in sentences[1:]:
+            second.append(sentence)
+        first.save(os.path.join(self.tmpdir, 'first.counts'), binary=True)
+        second.save(os.path.join(self.tmpdir, 'second.counts'), binary=True)
+        mergecounts([os.path.join(self.tmpdir, 'first.counts'), os.path.join(self.tmpdir, 'second.counts')], os.path.join(self.tmpdir, 'lm.counts'))
+        self.assertSameModel(self.load(os.path.join(self.tmpdir, 'lm.counts')), simplelanguagemodel())
+        self.assertSameModel(first + second, simplelanguagemodel())
+        SimpleLanguageModel(3).save(os.path.join(self.tmpdir, 'trigram.counts'), binary=True)
+        self.assertRaises(ValueError, mergecounts, [os.path.join(self.tmpdir, 'first.counts'), os.path.join(self.tmpdir, 'trigram.counts')], os.path.join(self.tmpdir, 'invalid.counts'))
+
+    def test4_countcorpus(self):
+        """Simple language model - Counting a corpus in parallel"""
+        corpus = [ sentence + " " + str(i) for i in range(0,200) for sentence in sentences ] + ["Ĳssel café"]
+        filename = os.path.join(self.tmpdir, 'corpus.txt')
+        with io.open(filename,'w',encoding='utf-8') as f:
+            for sentence in corpus:
+                f.write(sentence + "\n")
+        for casesensitive in (True, False):
+            reference = SimpleLanguageModel(3, casesensitive)
+            for sentence in corpus:
+                reference.append(sentence)
+            for workers in (None, 2):
+                countcorpus(filename, os.path.join(self.tmpdir, 'lm.counts'), 3, workers, casesensitive, maxentries=500, tmpdir=self.tmpdir, chunksize=1000)
+                self.assertSameModel(self.load(os.path.join(self.tmpdir, 'lm.counts')), reference)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['corpus.txt','lm.counts'])
+
+
+class ARPALanguageModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'lm.arpa')
+        with io.open(self.filename,'w',encoding='utf-8') as f:
+            f.write(ARPA)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertSameScores(self, lm, reference):
+        for word, history in (('cat',('the',)), ('the',('cat',)), ('the',('sat','on')), ('zzz',None), ('sat',None), ('mat',('on','the')), ('on',('sat',))):
+            self.assertAlmostEqual(lm.scoreword(word, history), reference.scoreword(word, history), places=5)
+
+    def test1_numpy(self):
+        """ARPA language model - Numpy storage"""
+        lm = ARPALanguageModel(self.filename, mode='numpy')
+        reference = ARPALanguageModel(self.filename)
+        self.assertEqual(len(lm), len(reference))
+        self.assertEqual(lm.order, 2)
+        self.assertSameScores(lm, reference)
+        self.assertRaises(KeyError, lm.ngrams.prob, ('cat','the'))
+        self.assertRaises(KeyError, lm.ngrams.prob, ('zzz',))
+        self.assertRaises(KeyError, lm.ngrams.prob, ('the','cat','sat'))
+
+    def test2_numpy_missingprefix(self):
+        """ARPA language model - Numpy storage with n-grams whose prefix is missing"""
+        data = {('a',): (-1.0, -0.5), ('b','c'): (-0.2, 0.0), ('a','b','c'): (-0.1, 0.0)}
+        ngrams = ARPALanguageModel.NgramsProbs(data, 'numpy')
+        self.assertEqual(len(ngrams), 3)
+        self.assertAlmostEqual(ngrams.prob(('a','b','c')), -0.1)
+        self.assertAlmostEqual(ngrams.prob(('b','c')), -0.2)
+        self.assertAlmostEqual(ngrams.backoff(('a',)), -0.5)
+        self.assertRaises(KeyError, ngrams.prob, ('a','b'))
+        self.assertRaises(KeyError, ngrams.backoff, ('b',))
+        self.assertRaises(KeyError, ngrams.prob, ('c',))
+
+    def test3_save(self):
+        """ARPA language model - Saving and loading (memory-mapped) as .npz"""
+        lm = ARPALanguageModel(self.filename, mode='numpy')
+        lm.save(os.path.join(self.tmpdir, 'lm.npz'))
+        for mmap in (False, True):
+            loaded = ARPALanguageModel(os.path.join(self.tmpdir, 'lm.npz'), mmap=mmap)
+            self.assertEqual(loaded.mode, 'numpy')
+            self.assertEqual(loaded.order, 2)
+            self.assertEqual(loaded.total, {1: 6, 2: 4})
+            self.assertEqual(len(loaded), len(lm))
+            self.assertSameScores(loaded, lm)
+        self.assertRaises(ValueError, ARPALanguageModel(self.filename).save, os.path.join(self.tmpdir, 'simple.npz'))
+
+    def test4_batch(self):
+        """ARPA language model - Batch scoring"""
+        batch = [ sentence.split(' ') for sentence in sentences ] + [[], ['the','cat','sat','on','zzz'], ['the','cat','ran']]
+        words = ['cat','the','mat','zzz','sat','on','cat']
+        histories = [('the',), ('cat',), ('sat','on','the'), None, (), ('zzz','sat'), ('the',)]
+        for mode in ('simple','numpy'):
+            lm = ARPALanguageModel(self.filename, mode=mode)
+            scores = lm.score_batch(batch)
+            self.assertEqual(len(scores), len(batch))
+            for score, sentence in zip(scores, batch):
+                self.assertAlmostEqual(score, lm.score(sentence))
+            for score, sentence in zip(lm.score_batch(batch, [('on',)] * len(batch)), batch):
+                self.assertAlmostEqual(score, lm.score(sentence, ('on',)))
+            for score, word, history in zip(lm.scoreword_batch(words, histories), words, histories):
+                self.assertAlmostEqual(score, lm.scoreword(word, history))
+            lm.dounknown = False
+            self.assertRaises(KeyError, lm.scoreword_batch, ['the','zzz'])
+            self.assertRaises(KeyError, lm.score_batch, [['the','zzz']])
+
+    def test5_compressed(self):
+        """ARPA language model - Loading compressed files"""
+        import gzip, bz2
+        reference = ARPALanguageModel(self.filename)
+        for extension, module in (('gz', gzip), ('bz2', bz2)):
+            filename = os.path.join(self.tmpdir, 'lm.arpa.' + extension)
+            with module.open(filename, 'wb') as f:
+                f.write(ARPA.encode('utf-8'))
+            lm = ARPALanguageModel(filename)
+            self.assertEqual(lm.ngrams._data, reference.ngrams._data)
+            self.assertEqual(lm.total, reference.total)
+
+    def test6_filters(self):
+        """ARPA language model - Filtering while loading"""
+        for mode in ('simple','numpy'):
+            lm = ARPALanguageModel(self.filename, mode=mode, maxorder=1)
+            self.assertEqual(lm.order, 1)
+            self.assertEqual(len(lm), 6)
+            self.assertAlmostEqual(lm.scoreword('cat', ('the',)), ARPALanguageModel(self.filename).scoreword('cat'), places=5)
+            lm = ARPALanguageModel(self.filename, mode=mode, vocabulary=['the','cat','sat'])
+            self.assertEqual(len(lm), 6) #<unk>, the, cat, sat, the cat, cat sat
+            self.assertAlmostEqual(lm.score(['the','cat','sat']), ARPALanguageModel(self.filename).score(['the','cat','sat']), places=5)
+            lm = ARPALanguageModel(self.filename, mode=mode, threshold=-0.25)
+            self.assertEqual(len(lm), 8) #cat sat and sat on are pruned
+            self.assertRaises(KeyError, lm.ngrams.prob, ('cat','sat'))
+            self.assertAlmostEqual(lm.ngrams.prob(('the','cat')), -0.2 * math.log(10), places=5)
+
+
+@unittest.skipIf(sys.version < '3', "The language model server requires Python 3")
+class LMServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.servers = []
+
+    def tearDown(self):
+        for server, thread in self.servers:
+            server.stop()
+            thread.join()
+        shutil.rmtree(self.tmpdir)
+
+    def serve(self, lm, n=0, host='localhost'):
+        from pynlpl.lm.server import LMServer
+        server = LMServer(lm, port=0, n=n, host=host, run=False)
+        thread = threading.Thread(target=server.run)
+        thread.start()
+        server.ready.wait()
+        self.servers.append( (server, thread) )
+        return server
+
+    def test1_sentences(self):
+        """Language model server - Scoring sentences"""
+        lm = simplelanguagemodel()
+        server = self.serve(lm)
+        client = LMClient('localhost', server.port, batchsize=2)
+        self.assertEqual(client.scoresentence("the cat sat"), lm.scoresentence("the cat sat"))
+        self.assertEqual(client.score_many(sentences + ["the cat"]), [ lm.scoresentence(sentence) for sentence in sentences + ["the cat"] ])
+        self.assertEqual(client.score_many(["unknown words"]), [0.0])
+        client.close()
+
+    def test2_ngrams(self):
+        """Language model server - Scoring n-grams"""
+        lm = simplelanguagemodel()
+        server = self.serve(lm, 2)
+        client = LMClient('localhost', server.port, n=2)
+        self.assertEqual(client[('the','cat')], 0.5)
+        self.assertEqual(client.score_many(["the cat", ("cat","sat"), "the dog"]), [ lm[ngram] for ngram in (("the","cat"),("cat","sat"),("the","dog")) ])
+        self.assertRaises(Exception, client.score_many, ["the cat sat"])
+        client.close()
+
+    def test3_arpa(self):
+        """Language model server - Serving an ARPA language model"""
+        filename = os.path.join(self.tmpdir, 'lm.arpa')
+        with io.open(filename,'w',encoding='utf-8') as f:
+            f.write(ARPA)
+        lm = ARPALanguageModel(filename)
+        server = self.serve(lm, 2)
+        client = LMClient('localhost', server.port, n=2)
+        self.assertAlmostEqual(client['the cat'], lm.scoreword('cat', ('the',)))
+        self.assertAlmostEqual(client['cat the'], lm.scoreword('the', ('cat',)))
+        client.close()
+
+    def test4_concurrent(self):
+        """Language model server - Concurrent clients and metrics"""
+        lm = simplelanguagemodel()
+        server = self.serve(lm)
+        clients = [ LMClient('localhost', server.port, batchsize=10) for _ in range(0,4) ]
+        results = {}
+        def score(i):
+            results[i] = clients[i].score_many(sentences * 100)
+        threads = [ threading.Thread(target=score, args=(i,)) for i in range(0,4) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        for i in range(0,4):
+            self.assertEqual(results[i], [ lm.scoresentence(sentence) for sentence in sentences ] * 100)
+        stats = clients[0].stats()
+        self.assertEqual(stats['clients'], 4)
+        self.assertEqual(stats['requests'], 4 * 30)
+        self.assertEqual(stats['items'], 4 * 300)
+        self.assertTrue(stats['latency_max'] >= stats['latency_median'])
+        for client in clients:
+            client.close()
+
+    def test5_fairness(self):
+        """Language model server - A large request does not hold up other clients"""
+        import pynlpl.lm.server
+        class SlowLanguageModel(object):
+            def scoresentence(self, sentence):
+                time.sleep(0.001)
+                return 1.0
+        chunksize = pynlpl.lm.server.SCORECHUNKSIZE
+        pynlpl.lm.server.SCORECHUNKSIZE = 10
+        try:
+            server = self.serve(SlowLanguageModel())
+            client = LMClient('localhost', server.port, batchsize=2000)
+            other = LMClient('localhost', server.port)
+            thread = threading.Thread(target=client.score_many, args=(["the cat"] * 2000,))
+            thread.start()
+            time.sleep(0.2) #the large request is being scored (for about two seconds)
+            begin = time.time()
+            self.assertEqual(other.stats()['requests'], 0)
+            self.assertTrue(time.time() - begin < 1.0)
+            thread.join()
+            self.assertEqual(other.stats()['items'], 2000)
+            client.close()
+            other.close()
+        finally:
+            pynlpl.lm.server.SCORECHUNKSIZE = chunksize
+
+    def test6_allinterfaces(self):
+        """Language model server - Port 0 without host gives one port for all interfaces"""
+        lm = simplelanguagemodel()
+        server = self.serve(lm, host=None)
+        hosts = ['127.0.0.1']
+        if socket.has_ipv6:
+            try:
+                socket.create_connection(('::1', server.port), 5).close()
+                hosts.append('::1')
+            except socket.error:
+                pass #no IPv6 loopback here
+        for host in hosts:
+            client = LMClient(host, server.port)
+            self.assertEqual(client.scoresentence("the cat sat"), lm.scoresentence("the cat sat"))
+            client.close()
+
+    def test7_stopbeforerun(self):
+        """Language model server - Stopping a server that is not running yet"""
+        from pynlpl.lm.server import LMServer
+        server = LMServer(simplelanguagemodel(), port=0, host='localhost', run=False)
+        server.stop()
+        thread = threading.Thread(target=server.run)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(server.ready.is_set())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+from pynlpl.lm.lm import ARPALanguageModel, SimpleLanguageModel, countcorpus
+import time
+import sys
+import os
+import io
+import random
+import resource
+import tempfile
+import multiprocessing
+import gzip
+import shutil
+
+
+def syntheticarpa(filename, ngrams, order=5):
+    """Writes an ARPA language model with roughly the specified number of random n-grams per order (all prefixes of an n-gram are included, as in real models)"""
+    random.seed(1)
+    words = [ "w" + str(i) for i in range(0,20000) ]
+    orders = [ set( (word,) for word in words + ["<unk>"] ) ]
+    for n in range(2, order+1):
+        lower = list(orders[-1])
+        ngrams_n = set()
+        while len(ngrams_n) < ngrams:
+            ngrams_n.add( random.choice(lower) + (random.choice(words),) )
+        orders.append(ngrams_n)
+    with io.open(filename,'w',encoding='utf-8') as f:
+        f.write("\\data\\\n")
+        for n, ngrams_n in enumerate(orders, 1):
+            f.write("ngram " + str(n) + "=" + str(len(ngrams_n)) + "\n")
+        for n, ngrams_n in enumerate(orders, 1):
+            f.write("\n\\" + str(n) + "-grams:\n")
+            for ngram in sorted(ngrams_n):
+                if n < order:
+                    f.write(str(round(-random.random() * 5,6)) + "\t" + " ".join(ngram) + "\t" + str(round(-random.random(),6)) + "\n")
+                else:
+                    f.write(str(round(-random.random() * 5,6)) + "\t" + " ".join(ngram) + "\n")
+        f.write("\n\\end\\\n")
+
+def queries(filename, count=100000):
+    """Returns (word, history) queries: n-grams of the model and random word sequences (that back off)"""
+    random.seed(2)
+    ngrams = []
+    with io.open(filename,'r',encoding='utf-8') as f:
+        for line in f:
+            fields = line.split("\t")
+            if len(fields) > 1 and random.random() < 0.1:
+                ngrams.append(tuple(fields[1].split()))
+    result = []
+    for _ in range(0, count):
+        if random.random() < 0.5:
+            ngram = random.choice(ngrams)
+        else:
+            ngram = tuple( "w" + str(random.randint(0,20999)) for _ in range(0, random.randint(1,5)) )
+        result.append( (ngram[-1], ngram[:-1] or None) )
+    return result
+
+def measure(label, f, args, kwargs, queue):
+    start = time.time()
+    lm = f(*args, **kwargs)
+    duration = time.time() - start
+    queue.put( (label, len(lm), duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024) )
+
+def loadtime(filename):
+    """Compares the time and memory it takes to load a language model in the various modes, each in a fresh process"""
+    npzfilename = filename + '.npz'
+    if not os.path.exists(npzfilename):
+        ARPALanguageModel(filename, mode='numpy').save(npzfilename)
+    gzfilename = filename + '.gz'
+    if not os.path.exists(gzfilename):
+        with open(filename,'rb') as f_in, gzip.open(gzfilename,'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+    random.seed(4)
+    vocabulary = [ "w" + str(random.randint(0,19999)) for _ in range(0,2000) ]
+    scenarios = [
+        ('simple', ARPALanguageModel, (filename,), {}),
+        ('numpy', ARPALanguageModel, (filename,), {'mode': 'numpy'}),
+        ('numpy, from .npz', ARPALanguageModel, (npzfilename,), {}),
+        ('numpy, from .npz, memory-mapped', ARPALanguageModel, (npzfilename,), {'mmap': True}),
+        ('simple, gzipped', ARPALanguageModel, (gzfilename,), {}),
+        ('simple, maxorder 3', ARPALanguageModel, (filename,), {'maxorder': 3}),
+        ('simple, vocabulary of 2000 words', ARPALanguageModel, (filename,), {'vocabulary': vocabulary}),
+        ('numpy, vocabulary of 2000 words', ARPALanguageModel, (filename,), {'mode': 'numpy', 'vocabulary': vocabulary}),
+        ('simple, threshold -3', ARPALanguageModel, (filename,), {'threshold': -3}),
+    ]
+    queue = multiprocessing.Queue()
+    for label, f, args, kwargs in scenarios:
+        process = multiprocessing.Process(target=measure, args=(label, f, args, kwargs, queue))
+        process.start()
+        label, size, duration, maxrss = queue.get()
+        process.join()
+        print("loadtime -- " + label + " -- on file " + filename + " -- " + str(size) + " n-grams, took " + str(round(duration,2)) + "s, peak memory " + str(round(maxrss,1)) + " MB")
+
+def scorerate(filename):
+    """Measures how many words per second are scored, in the various modes"""
+    qs = queries(filename)
+    for mode in ('simple', 'numpy'):
+        lm = ARPALanguageModel(filename, mode=mode)
+        start = time.time()
+        for word, history in qs:
+            lm.scoreword(word, history)
+        duration = time.time() - start
+        print("scorerate -- " + mode + " -- " + str(len(qs)) + " words, took " + str(round(duration,2)) + "s, " + str(int(len(qs) / duration)) + " words/s")
+        del lm
+
+def nbestlists(filename, lists=200, n=50):
+    """Returns n-best lists of sentences built from n-grams of the model, where the hypotheses of a list share a prefix of varying length"""
+    qs = [ history + (word,) for word, history in queries(filename) if history ]
+    random.seed(3)
+    sentences = []
+    for _ in range(0, lists):
+        base = random.choice(qs) + random.choice(qs) + random.choice(qs)
+        for _ in range(0, n):
+            sentences.append( base[:random.randint(0,len(base))] + random.choice(qs) )
+    return sentences
+
+def batchrate(filename):
+    """Compares scoring n-best lists sentence by sentence with score_batch, and words one by one with scoreword_batch, in the various modes"""
+    import numpy as np
+    sentences = nbestlists(filename)
+    qs = queries(filename)
+    words = sum( len(sentence) for sentence in sentences )
+    for mode in ('simple', 'numpy'):
+        lm = ARPALanguageModel(filename, mode=mode)
+        start = time.time()
+        reference = np.array([ lm.score(sentence) for sentence in sentences ])
+        duration = time.time() - start
+        print("batchrate -- " + mode + " -- score -- " + str(len(sentences)) + " sentences, took " + str(round(duration,2)) + "s, " + str(int(words / duration)) + " words/s")
+        start = time.time()
+        scores = lm.score_batch(sentences)
+        duration = time.time() - start
+        print("batchrate -- " + mode + " -- score_batch -- " + str(len(sentences)) + " sentences, took " + str(round(duration,2)) + "s, " + str(int(words / duration)) + " words/s, max difference " + str(np.abs(scores - reference).max()))
+        reference = np.array([ lm.scoreword(word, history) for word, history in qs ])
+        start = time.time()
+        scores = lm.scoreword_batch([ word for word, _ in qs ], [ history for _, history in qs ])
+        duration = time.time() - start
+        print("batchrate -- " + mode + " -- scoreword_batch -- " + str(len(qs)) + " words, took " + str(round(duration,2)) + "s, " + str(int(len(qs) / duration)) + " words/s, max difference " + str(np.abs(scores - reference).max()))
+        del lm
+
+def countload(label, f, args, queue):
+    start = time.time()
+    lm = f(*args)
+    duration = time.time() - start
+    queue.put( (label, len(lm.freqlistN), duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024) )
+
+def trainlm(corpusfilename, tmpdir):
+    lm = SimpleLanguageModel(3)
+    with io.open(corpusfilename,'r',encoding='utf-8') as f:
+        for line in f:
+            lm.append(line)
+    lm.save(os.path.join(tmpdir, 'lm.txt'))
+    lm.save(os.path.join(tmpdir, 'lm.counts'), binary=True)
+    return lm
+
+def countlm(corpusfilename, tmpdir, workers, maxentries):
+    countcorpus(corpusfilename, os.path.join(tmpdir, 'lm.counts'), 3, workers, maxentries=maxentries, tmpdir=tmpdir, chunksize=4*1024*1024)
+    return loadlm(os.path.join(tmpdir, 'lm.counts'))
+
+def loadlm(filename):
+    lm = SimpleLanguageModel(3)
+    lm.load(filename)
+    return lm
+
+def counttime(filename, sentences=200000):
+    """Compares training a trigram SimpleLanguageModel on a corpus (of sentences generated from the vocabulary of the model) in memory with counting it with countcorpus, and loading the saved model as text or as binary counts, each in a fresh process"""
+    corpusfilename = filename + '.corpus.txt'
+    if not os.path.exists(corpusfilename):
+        random.seed(5)
+        with io.open(corpusfilename,'w',encoding='utf-8') as f:
+            for _ in range(0, sentences):
+                f.write(" ".join( "w" + str(int(random.paretovariate(0.5)) % 20000) for _ in range(0, random.randint(5,30)) ) + "\n")
+    tmpdir = tempfile.mkdtemp()
+    workers = multiprocessing.cpu_count()
+    scenarios = [
+        ('append, in memory', trainlm, (corpusfilename, tmpdir)),
+        ('load, text', loadlm, (os.path.join(tmpdir, 'lm.txt'),)),
+        ('load, binary counts', loadlm, (os.path.join(tmpdir, 'lm.counts'),)),
+        ('countcorpus, in memory, then load', countlm, (corpusfilename, tmpdir, None, 100000000)),
+        ('countcorpus, spilling every 200000 entries, then load', countlm, (corpusfilename, tmpdir, None, 200000)),
+        ('countcorpus, ' + str(workers) + ' workers, then load', countlm, (corpusfilename, tmpdir, workers, 100000000)),
+    ]
+    try:
+        queue = multiprocessing.Queue()
+        for label, f, args in scenarios:
+            process = multiprocessing.Process(target=countload, args=(label, f, args, queue))
+            process.start()
+            label, size, duration, maxrss = queue.get()
+            process.join()
+            print("counttime -- " + label + " -- on corpus " + corpusfilename + " -- " + str(size) + " trigrams, took " + str(round(duration,2)) + "s, peak memory " + str(round(maxrss,1)) + " MB")
+    finally:
+        shutil.rmtree(tmpdir)
+
+BENCHMARKS = ('loadtime','scorerate','batchrate','counttime')
+
+def main():
+    try:
+        args = sys.argv[1:]
+        if args[0] in ('all',) + BENCHMARKS or ',' in args[0]:
+            selectedtests = args.pop(0).split(',')
+        else:
+            selectedtests = ['all']
+        arg = args[0]
+    except:
+        print("Syntax: lm_benchmark [testfunctions] arpafile",file=sys.stderr)
+        print(" testfunctions is a comma separated list of: " + ", ".join(BENCHMARKS) + ", or the special keyword 'all'", file=sys.stderr)
+        print(" synthetic:NGRAMS generates (once) and uses a synthetic 5-gram model with NGRAMS n-grams per order, e.g. synthetic:200000", file=sys.stderr)
+        sys.exit(2)
+
+    if arg.startswith('synthetic:'):
+        ngrams = int(arg[10:])
+        filename = os.path.join(tempfile.gettempdir(), 'lm_benchmark.synthetic.' + str(ngrams) + '.arpa')
+        if not os.path.exists(filename):
+            syntheticarpa(filename, ngrams)
+    else:
+        filename = arg
+
+    for f in BENCHMARKS:
+        if f in selectedtests or 'all' in selectedtests:
+            globals()[f](filename)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+from pynlpl.formats import moses
+import time
+import sys
+import os
+import io
+import random
+import resource
+import tempfile
+import multiprocessing
+import threading
+import socket
+import subprocess
+
+
+def readlineloader(filename):
+    """Loads a phrase table line by line, as PhraseTable did before the chunked loader (and still does for compressed files)"""
+    phrasetable = {}
+    prevsource = None
+    targets = []
+    for source, target, scores in moses.readphrasetable(filename, quiet=True):
+        if prevsource and source != prevsource and targets:
+            phrasetable[prevsource] = tuple(targets)
+            targets = []
+        targets.append( (target,scores) )
+        prevsource = source
+    if prevsource and targets:
+        phrasetable[prevsource] = tuple(targets)
+    return phrasetable
+
+def measure(label, filename, f, kwargs, queue):
+    start = time.time()
+    phrasetable = f(filename, **kwargs)
+    duration = time.time() - start
+    queue.put( (label, len(phrasetable), duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024) )
+
+def loadtime(filename, workers):
+    """Compares the time and memory it takes to load a phrase table with the various loaders, each in a fresh process"""
+    scenarios = [
+        ('readline', readlineloader, {}),
+        ('chunked', moses.PhraseTable, {'quiet': True}),
+        ('parallel (' + str(workers) + ' workers)', moses.PhraseTable, {'quiet': True, 'workers': workers}),
+        ('chunked, two scores, compact', moses.PhraseTable, {'quiet': True, 'keepscores': [0,2], 'compactscores': True}),
+    ]
+    queue = multiprocessing.Queue()
+    for label, f, kwargs in scenarios:
+        process = multiprocessing.Process(target=measure, args=(label, filename, f, kwargs, queue))
+        process.start()
+        label, size, duration, maxrss = queue.get()
+        process.join()
+        print("loadtime -- " + label + " -- on file " + filename + " -- " + str(size) + " source phrases, took " + str(round(duration,2)) + "s, peak memory " + str(round(maxrss,1)) + " MB")
+
+def lookuprate(filename, workers, queries=100000):
+    """Measures how many phrases per second a PhraseTableClient looks up on a phrase table server on the loopback interface, one per round trip versus batched, and with a cache on a skewed query stream"""
+    if not moses.twistedimported:
+        print("lookuprate -- skipped, requires Twisted",file=sys.stderr)
+        return
+    random.seed(2)
+    sources = []
+    with io.open(filename,'r',encoding='utf-8') as f:
+        for line in f:
+            source = line.split("|||")[0].strip()
+            if not sources or sources[-1] != source:
+                sources.append(source)
+    phrases = [ random.choice(sources) if random.random() < 0.9 else "unknown phrase " + str(i) for i in range(0, queries) ]
+    skewed = [ sources[int(random.paretovariate(1.0)) % len(sources)] for i in range(0, queries) ]
+
+    s = socket.socket()
+    s.bind(('localhost',0))
+    port = s.getsockname()[1]
+    s.close()
+    server = subprocess.Popen([sys.executable, '-c', 'import sys; from pynlpl.formats.moses import PhraseTable, PhraseTableServer; PhraseTableServer(PhraseTable(sys.argv[1], quiet=True), int(sys.argv[2]))', filename, str(port)])
+    try:
+        while True:
+            try:
+                moses.PhraseTableClient('localhost', port).close()
+                break
+            except socket.error:
+                time.sleep(0.5)
+
+        def onebyone(client, phrases):
+            for phrase in phrases:
+                client.lookup_many([phrase])
+
+        def threaded(client, phrases):
+            threads = [ threading.Thread(target=client.lookup_many, args=(phrases[i::workers],)) for i in range(0, workers) ]
+            for thread in threads: thread.start()
+            for thread in threads: thread.join()
+
+        scenarios = [
+            ('one per round trip', onebyone, phrases, 0),
+            ('lookup_many', lambda client, phrases: client.lookup_many(phrases), phrases, 0),
+            ('lookup_many, ' + str(workers) + ' threads', threaded, phrases, 0),
+            ('one per round trip, cached, skewed queries', onebyone, skewed, 10000),
+            ('lookup_many, cached, skewed queries', lambda client, phrases: client.lookup_many(phrases), skewed, 10000),
+        ]
+        for label, f, queries, cachesize in scenarios:
+            client = moses.PhraseTableClient('localhost', port, poolsize=workers, cachesize=cachesize)
+            start = time.time()
+            f(client, queries)
+            duration = time.time() - start
+            client.close()
+            print("lookuprate -- " + label + " -- " + str(len(queries)) + " lookups, took " + str(round(duration,2)) + "s, " + str(int(len(queries) / duration)) + " lookups/s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def syntheticphrasetable(filename, lines):
+    """Writes a sorted phrase table with the specified number of lines of random phrases"""
+    random.seed(1)
+    words = [ "w" + str(i) for i in range(0,10000) ]
+    with io.open(filename,'w',encoding='utf-8') as f:
+        sources = sorted( " ".join(random.choice(words) for _ in range(random.randint(1,3))) for _ in range(0, lines // 4) )
+        for source in sources:
+            for _ in range(0,4):
+                f.write(source + " ||| " + " ".join(random.choice(words) for _ in range(random.randint(1,3))) + " ||| " + " ".join(str(round(random.random(),6)) for _ in range(0,4)) + " ||| 0-0 ||| \n")
+
+BENCHMARKS = ('loadtime','lookuprate')
+
+def main():
+    try:
+        args = sys.argv[1:]
+        if args[0] in ('all',) + BENCHMARKS or ',' in args[0]:
+            selectedtests = args.pop(0).split(',')
+        else:
+            selectedtests = ['all']
+        if len(args) == 2:
+            workers = int(args.pop(0))
+        else:
+            workers = multiprocessing.cpu_count()
+        arg = args[0]
+    except:
+        print("Syntax: moses_benchmark [testfunctions] [workers] phrasetable",file=sys.stderr)
+        print(" testfunctions is a comma separated list of: " + ", ".join(BENCHMARKS) + ", or the special keyword 'all'", file=sys.stderr)
+        print(" synthetic:LINES generates (once) and uses a synthetic phrase table of LINES lines, e.g. synthetic:1000000", file=sys.stderr)
+        sys.exit(2)
+
+    if arg.startswith('synthetic:'):
+        lines = int(arg[10:])
+        filename = os.path.join(tempfile.gettempdir(), 'moses_benchmark.synthetic.' + str(lines) + '.phrasetable')
+        if not os.path.exists(filename):
+            syntheticphrasetable(filename, lines)
+    else:
+        filename = arg
+
+    for f in BENCHMARKS:
+        if f in selectedtests or 'all' in selectedtests:
+            globals()[f](filename, workers)
+
+if __name__ == '__main__':
+    main()
@@ -15,11 +15,13 @@
 import sys
 import os
 import unittest
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 sys.path.append(sys.path[0] + '/../../')
 os.environ['PYTHONPATH'] = sys.path[0] + '/../../'
 
-from pynlpl.search import AbstractSearchState, DepthFirstSearch, BreadthFirstSearch, IterativeDeepening, HillClimbingSearch, BeamSearch
+from pynlpl.search import AbstractSearchState, DepthFirstSearch, BreadthFirstSearch, BestFirstSearch, IterativeDeepening, HillClimbingSearch, BeamSearch, topk
 
 
 class ReorderSearchState(AbstractSearchState):
@@ -100,6 +102,58 @@ class BreadthFirstSearchTest(unittest.TestCase):
         self.assertEqual(solution, goalstate)
 
 
+class VisitedTest(unittest.TestCase):
+    def test_visited(self):
+        """Breadth First Search with the various visited-state memories"""
+        global inputstate, goalstate
+        reference = BreadthFirstSearch(inputstate ,graph=True, goal=goalstate)
+        self.assertEqual(reference.searchfirst(), goalstate)
+        for visited in ('compact', 'bloom', 'lru', lambda: set()):
+            search = BreadthFirstSearch(inputstate ,graph=True, goal=goalstate, visited=visited, visitedsize=100000)
+            self.assertEqual(search.searchfirst(), goalstate)
+            self.assertEqual(search.traversalsize(), reference.traversalsize())
+            self.assertTrue(search.visited(inputstate))
+        search = BreadthFirstSearch(inputstate ,graph=True, goal=goalstate, visited='lru', visitedsize=10) #revisits states
+        self.assertEqual(search.searchfirst(), goalstate)
+        self.assertTrue(search.traversalsize() > reference.traversalsize())
+
+    def test_stats(self):
+        """Breadth First Search stats"""
+        global inputstate, goalstate
+        search = BreadthFirstSearch(inputstate ,graph=True, goal=goalstate, stats=True)
+        search.searchfirst()
+        stats = search.stats
+        self.assertEqual(stats.expanded, search.traversalsize() - 1) #the goal state is found before it is expanded
+        self.assertEqual(stats.generated, stats.offers)
+        self.assertEqual(stats.rounds, stats.expanded + stats.duplicates)
+        self.assertTrue(stats.peakfringe > 1 and stats.duplicates > 0 and stats.rejections == 0)
+
+    def test_traversallog(self):
+        """Traversal streamed to a file"""
+        global inputstate, goalstate
+        reference = BreadthFirstSearch(inputstate ,graph=True, goal=goalstate, keeptraversal=True)
+        reference.searchfirst()
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            search = BreadthFirstSearch(inputstate ,graph=True, goal=goalstate, keeptraversal=filename)
+            search.searchfirst()
+            self.assertEqual(len(search.traversal()), len(reference.traversal()))
+            self.assertEqual(list(search.traversal()), [ str(state) for state in reference.traversal() ])
+            self.assertIsNone(search.traversal().file) #closed after iterating
+            search.traversal().append(goalstate) #reopened to append
+            self.assertEqual(list(search.traversal())[-1], str(goalstate))
+            search.reset()
+            self.assertIsNone(search.traversal().file) #not opened until the first append
+            self.assertEqual(list(search.traversal()), [])
+            with search.traversal() as traversal:
+                traversal.append(inputstate)
+            self.assertIsNone(traversal.file)
+            self.assertEqual(list(traversal), [ str(inputstate) ])
+        finally:
+            os.unlink(filename)
+
+
 class IterativeDeepeningTest(unittest.TestCase):
     def test_solution(self):
         """Iterative Deepening DFS"""
@@ -170,7 +224,86 @@ class BeamSearchTest(unittest.TestCase):
         solution = search.searchbest()
         self.assertEqual(str(solution),str(goalstate))
         
-        
+
+    def test_batch(self):
+        """Beam Search in batch mode"""
+        goalstate = InformedReorderSearchState("This is supposed to be a very long sentence .".split(' '))
+        informedinputstate = InformedReorderSearchState("a long very . sentence supposed to be This is".split(' '), goalstate)
+        for beamsize in (3, 5):
+            search = BeamSearch(informedinputstate, beamsize=beamsize, graph=True, minimize=True, batch=True)
+            solution = search.searchbest()
+            self.assertEqual(str(solution),str(goalstate))
+            reference = BeamSearch(informedinputstate, beamsize=beamsize, graph=True, minimize=True)
+            self.assertEqual(reference.searchbest().score(), solution.score())
+        search = BeamSearch(informedinputstate, beamsize=3, graph=True, minimize=True, batch=True, maxdepth=3)
+        self.assertTrue(all( state.depth() <= 3 for state in search ))
+
+    def test_executor(self):
+        """Beam Search in parallel mode"""
+        goalstate = InformedReorderSearchState("This is supposed to be a very long sentence .".split(' '))
+        informedinputstate = InformedReorderSearchState("a long very . sentence supposed to be This is".split(' '), goalstate)
+        reference = [ str(state) for state in BeamSearch(informedinputstate, beamsize=5, graph=True, minimize=True, maxdepth=8) ]
+        for executor in (ThreadPoolExecutor(2), ProcessPoolExecutor(2)):
+            with executor:
+                for chunksize in (None, 1, 3):
+                    search = BeamSearch(informedinputstate, beamsize=5, graph=True, minimize=True, maxdepth=8, executor=executor, chunksize=chunksize)
+                    solutions = list(search)
+                    self.assertEqual([ str(state) for state in solutions ], reference)
+                    self.assertTrue(all( state.path()[0] is informedinputstate and len(state.path()) == state.depth() + 1 for state in solutions ))
+                search = BeamSearch(informedinputstate, beamsize=3, graph=True, minimize=True, batch=True, executor=executor)
+                self.assertEqual(str(search.searchbest()),str(goalstate))
+
+    def test_stats(self):
+        """Beam Search stats"""
+        goalstate = InformedReorderSearchState("This is supposed to be a very long sentence .".split(' '))
+        informedinputstate = InformedReorderSearchState("a long very . sentence supposed to be This is".split(' '), goalstate)
+        results = []
+        with ThreadPoolExecutor(2) as executor:
+            for kwargs in ({}, {'executor': executor}, {'batch': True}):
+                callbacks = []
+                search = BeamSearch(informedinputstate, beamsize=5, graph=True, minimize=True, maxdepth=6, callback=callbacks.append, **kwargs)
+                solution = search.searchbest()
+                stats = search.stats
+                self.assertEqual(stats.expanded, search.traversalsize())
+                self.assertEqual(stats.generated, stats.offers + stats.beyondmaxdepth)
+                self.assertTrue(stats.beyondmaxdepth > 0 and stats.rejections > 0)
+                self.assertEqual(stats.offers - stats.rejections, sum( fill * 5 for fill in stats.fill ))
+                self.assertEqual(len(stats.fill), stats.rounds)
+                self.assertEqual(len(callbacks), stats.rounds + 1)
+                self.assertEqual(stats.peakfringe, 5)
+                self.assertTrue(stats.expandtime > 0 and stats.scoretime > 0 and stats.queuetime > 0)
+                results.append( (str(solution), stats.expanded, stats.generated, stats.offers, stats.rejections, stats.beyondmaxdepth, stats.duplicates, stats.rounds, stats.fill) )
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(BeamSearch(informedinputstate, beamsize=5, graph=True, minimize=True).stats, None)
+
+    def test_stats_reset(self):
+        """Search stats after a reset"""
+        search = BestFirstSearch(informedinputstate, graph=True, goal=goalstate, minimize=True, stats=True)
+        stats = search.stats
+        scoretime = stats.scoretime
+        search.reset()
+        search.searchfirst()
+        self.assertIsNot(search.stats, stats)
+        self.assertEqual(stats.scoretime, scoretime) #nothing is added to the discarded stats
+        self.assertTrue(search.stats.expanded > 0 and search.stats.scoretime > 0)
+
+    def test_topk(self):
+        """Beam Search top-k selection"""
+        import numpy as np
+        scores = np.array([3.0, 1.0, 2.0, 1.0, 5.0, 2.0])
+        self.assertEqual(list(topk(scores, 3, True)), [1, 3, 2])
+        self.assertEqual(list(topk(scores, 3, False)), [4, 0, 2])
+        self.assertEqual(list(topk(scores, 10, True)), [1, 3, 2, 5, 0, 4])
+
+    def test_depth(self):
+        """Search state depth"""
+        state = informedinputstate
+        for i in range(0,5):
+            state = next(state.expand())
+        self.assertEqual(state.depth(), 5)
+        self.assertEqual(len(state.path()), 6)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+from pynlpl.search import AbstractSearchState, BeamSearch
+import time
+import sys
+import random
+import math
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+class DecoderState(AbstractSearchState):
+    """A partial sentence in a synthetic decoding problem: each state is extended by one of the candidate words of its last word, and scored by a small neural model of the last two words (embeddings, a hidden layer, and the log of the sigmoid of the output)"""
+
+    model = None #word embeddings (vocabulary x dimensions), hidden layer weights (2*dimensions x hidden), output weights (hidden)
+    candidates = None #candidate next words, for each word
+
+    def __init__(self, words, logprob=0.0, parent=None):
+        super(DecoderState, self).__init__(parent)
+        self.words = words
+        self.logprob = logprob
+
+    def expand(self):
+        for word in self.candidates[self.words[-1]]:
+            yield DecoderState(self.words + (word,), None, self)
+
+    def score(self):
+        if self.logprob is None:
+            embeddings, hidden, output = self.model
+            x = np.tanh(np.concatenate((embeddings[self.words[-2]], embeddings[self.words[-1]])).dot(hidden)).dot(output)
+            self.logprob = self.parent.score() - math.log1p(math.exp(-float(x)))
+        return self.logprob
+
+    @classmethod
+    def score_batch(cls, states):
+        previous = np.fromiter( (state.words[-2] for state in states), dtype=np.int64, count=len(states) )
+        last = np.fromiter( (state.words[-1] for state in states), dtype=np.int64, count=len(states) )
+        history = np.fromiter( (state.parent.score() for state in states), dtype=float, count=len(states) )
+        embeddings, hidden, output = cls.model
+        x = np.tanh(np.concatenate((embeddings[previous], embeddings[last]), axis=1).dot(hidden)).dot(output)
+        scores = history - np.log1p(np.exp(-x))
+        for state, score in zip(states, scores.tolist()):
+            state.logprob = score
+        return scores
+
+    def test(self, goalstates=None):
+        return len(self.words) > self.maxlength
+
+    def __hash__(self):
+        return hash(self.words)
+
+    def __eq__(self, other):
+        return self.words == other.words
+
+class ExpensiveDecoderState(DecoderState):
+    """A DecoderState that is expensive to expand: a feature is computed for each candidate (in pure Python, on purpose), as a stand-in for the candidate generation and feature computation of a real decoder"""
+
+    work = 200 #iterations per feature
+
+    def expand(self):
+        for word in self.candidates[self.words[-1]]:
+            feature = 0
+            for j in range(0, self.work):
+                feature = (feature * 31 + word + j) % 1000003
+            state = ExpensiveDecoderState(self.words + (word,), None, self)
+            state.cost = feature / 1000003
+            yield state
+
+
+def decodingproblem(vocabulary=5000, dimensions=32, hidden=64, candidates=100, maxlength=10):
+    random.seed(1)
+    np.random.seed(1)
+    DecoderState.model = (np.random.normal(0, 0.3, (vocabulary, dimensions)), np.random.normal(0, 0.3, (2 * dimensions, hidden)), np.random.normal(0, 0.3, hidden))
+    DecoderState.candidates = [ random.sample(range(0, vocabulary), candidates) for _ in range(0, vocabulary) ]
+    DecoderState.maxlength = maxlength
+    return DecoderState((0,))
+
+def batchrate(beamsize):
+    """Compares a beam search on a synthetic decoding problem that scores successors one by one with one that scores (and selects) them per round, in batch mode"""
+    state = decodingproblem()
+    for label, kwargs in (('one by one', {}), ('batch', {'batch': True})):
+        start = time.time()
+        search = BeamSearch(state, beamsize=beamsize, graph=True, maxdepth=DecoderState.maxlength + 1, **kwargs)
+        best = search.searchbest()
+        duration = time.time() - start
+        print("batchrate -- " + label + " -- beam " + str(beamsize) + ", " + str(search.traversalsize()) + " states expanded, took " + str(round(duration,2)) + "s, best score " + str(round(best.score(),4)))
+
+def parallelrate(beamsize):
+    """Compares a beam search on a synthetic decoding problem with expensive state expansion sequentially with one that expands the states of each round in parallel, with a growing number of worker processes"""
+    decodingproblem()
+    state = ExpensiveDecoderState((0,))
+    cpus = multiprocessing.cpu_count()
+    scenarios = [ ('sequential', None) ] + [ (str(workers) + ' workers', workers) for workers in sorted(set([1, 2, 4, 8, cpus])) if workers <= max(cpus, 2) ]
+    reference = None
+    for label, workers in scenarios:
+        executor = ProcessPoolExecutor(workers) if workers else None #started after decodingproblem(), so the workers have the model
+        start = time.time()
+        search = BeamSearch(state, beamsize=beamsize, graph=True, maxdepth=DecoderState.maxlength + 1, executor=executor)
+        best = search.searchbest()
+        duration = time.time() - start
+        if executor: executor.shutdown()
+        if reference is None:
+            reference = duration
+        print("parallelrate -- " + label + " -- beam " + str(beamsize) + ", " + str(search.traversalsize()) + " states expanded, took " + str(round(duration,2)) + "s, speed-up " + str(round(reference / duration,2)) + ", best " + " ".join(str(word) for word in best.words))
+
+def statsrate(beamsize):
+    """Measures the overhead of collecting stats in a beam search on a synthetic decoding problem, sequentially and in batch mode, and shows the stats"""
+    state = decodingproblem()
+    for label, kwargs in (('one by one', {}), ('batch', {'batch': True})):
+        for stats in (False, True):
+            start = time.time()
+            search = BeamSearch(state, beamsize=beamsize, graph=True, maxdepth=DecoderState.maxlength + 1, stats=stats, **kwargs)
+            search.searchbest()
+            duration = time.time() - start
+            print("statsrate -- " + label + (", with stats" if stats else "") + " -- beam " + str(beamsize) + ", took " + str(round(duration,2)) + "s" + (" -- " + str(search.stats) if stats else ""))
+
+BENCHMARKS = ('batchrate','parallelrate','statsrate')
+
+def main():
+    try:
+        args = sys.argv[1:]
+        if args and (args[0] in ('all',) + BENCHMARKS or ',' in args[0]):
+            selectedtests = args.pop(0).split(',')
+        else:
+            selectedtests = ['all']
+        beamsize = int(args[0]) if args else 100
+    except:
+        print("Syntax: search_benchmark [testfunctions] [beamsize]",file=sys.stderr)
+        print(" testfunctions is a comma separated list of: " + ", ".join(BENCHMARKS) + ", or the special keyword 'all'", file=sys.stderr)
+        sys.exit(2)
+
+    for f in BENCHMARKS:
+        if f in selectedtests or 'all' in selectedtests:
+            globals()[f](beamsize)
+
+if __name__ == '__main__':
+    main()
@@ -68,6 +68,13 @@ if [ $? -ne 0 ]; then
     GOOD=0
 fi
 
+echo "Testing language models">&2
+$PYTHON lm.py
+if [ $? -ne 0 ]; then
+    echo "Test failed!!!" >&2
+    GOOD=0
+fi
+
 echo "Testing folia">&2
 $PYTHON folia.py
 if [ $? -ne 0 ]; then
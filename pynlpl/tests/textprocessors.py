@@ -19,9 +19,11 @@ from __future__ import absolute_import
 
 import sys
 import os
+import re
 import unittest
 
-from pynlpl.textprocessors import Windower, tokenise, strip_accents, calculate_overlap
+from pynlpl.textprocessors import Windower, Tokenizer, tokenise, strip_accents, calculate_overlap
+from pynlpl.tests.textprocessors_benchmark import legacytokenize
 
 text = "This is a test .".split(" ")
 
@@ -87,6 +89,38 @@ class TokenizerTest(unittest.TestCase):
         global text
         self.assertEqual(tokenise("Hij zegt: \"Wat een lief baby'tje is dat!\""),"Hij zegt : \" Wat een lief baby'tje is dat ! \"".split(" "))     
 
+    def test_tokenize_rules(self):
+        """Tokeniser - custom rules"""
+        self.assertEqual(tokenise("Versie 1.2.3 (bèta) van ABC-tools", [r"^\d+(?:\.\d+)+", "^[A-Z]+-"]),"Versie 1.2.3 ( bèta ) van ABC- tools".split(" "))
+        self.assertEqual(tokenise("Versie 1.2.3 (bèta) van ABC-tools", []),"Versie 1.2.3 ( bèta ) van ABC - tools".split(" "))
+
+    def test_tokenize_complexrules(self):
+        """Tokeniser - custom rules with inline flags, groups, backreferences and anchors"""
+        text = "ABC abcd 12-12 3-4 HEY! HEY!! a b ab ba. www.example.com x"
+        for rules in (["(?i)^abc"], [r"^(\d+)-\1"], [r"^(?P<cluster>[A-Z]+)!"], ["^a|^b"], [r"^(?<!x)b\w*"], ["^a$"], [r"^\d+(?:-\d+)?", "(?i)^hey"]):
+            self.assertEqual(tokenise(text, rules), legacytokenize(text, [ re.compile(rule) for rule in rules ]), rules)
+            self.assertEqual(tokenise(text, rules), tokenise(text, [ re.compile(rule) for rule in rules ]))
+        self.assertEqual(tokenise("ABC abcd", ["(?i)^abc"]), ["ABC", "abc", "d"])
+
+    def test_tokenizer(self):
+        """Tokeniser - streams"""
+        lines = ["This is the first paragraph. It has two sentences.\n", "  \n", "The second one\n", "spans two lines!\n", "\n", "\n"] * 50 + ["Mail me at proycon@anaproy.nl"]
+        self.assertEqual(list(Tokenizer(lines[:5])), [["This","is","the","first","paragraph","."],["It","has","two","sentences","."],["The","second","one","spans","two","lines","!"]])
+        for splitsentences, onesentenceperline in ((True, False), (False, False), (True, True)):
+            serial = list(Tokenizer(lines, splitsentences, onesentenceperline))
+            self.assertEqual(list(Tokenizer(lines, splitsentences, onesentenceperline, workers=2, blocksize=100)), serial)
+            self.assertEqual(list(Tokenizer(iter(lines), splitsentences, onesentenceperline, workers=1)), serial)
+
+    def test_tokenize_longurl(self):
+        """Tokeniser - URL longer than the rules see"""
+        url = "http://www.example.com/" + "x" * 400
+        self.assertEqual(tokenise("See " + url + "."), ["See", url[:300], url[300:], "."])
+
+    def test_tokenize_longtokens(self):
+        """Tokeniser - Tokens that are longer than the rules see, without any rule matching in those 300 characters"""
+        for text in ("a"*300 + "@b.nl", "x " + "a"*310 + "@example.com y", "http://ex.org/" + "a"*583 + "x.a@b.nl", "b"*299 + "@example.com " + "c"*700):
+            self.assertEqual(tokenise(text), legacytokenize(text))
+
 
 class StripAccentTest(unittest.TestCase):
     def test_strip_accents(self):
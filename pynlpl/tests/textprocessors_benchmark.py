@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+from pynlpl.textprocessors import Tokenizer, tokenize, TOKENIZERRULES, WHITESPACE
+import time
+import sys
+import os
+import io
+import re
+import string
+import random
+import tempfile
+import multiprocessing
+
+
+def legacytokenize(text, regexps=TOKENIZERRULES):
+    """The tokeniser as it was before it was compiled into a single regular expression: it walks the text character by character and tries the rules at each token start"""
+    tokens = []
+    begin = 0
+    for i, c in enumerate(text):
+        if begin > i:
+            continue
+        elif i == begin:
+            m = False
+            for regexp in regexps:
+                m = regexp.findall(text[i:i+300])
+                if m:
+                    tokens.append(m[0])
+                    begin = i + len(m[0])
+                    break
+            if m: continue
+
+        if c in string.punctuation or c in WHITESPACE:
+            prev = text[i-1] if i > 0 else ""
+            next = text[i+1] if i < len(text)-1 else ""
+
+            if (c == '.' or c == ',') and prev.isdigit() and next.isdigit():
+                pass
+            elif (c == "'" or c == "`") and prev.isalpha() and next.isalpha():
+                pass
+            elif c not in WHITESPACE and next == c:
+                continue
+            elif c == '\r' and prev == '\n':
+                begin = i+1
+                continue
+            else:
+                token = text[begin:i]
+                if token: tokens.append(token)
+                if c not in WHITESPACE:
+                    tokens.append(c)
+                begin = i + 1
+
+    if begin <= len(text) - 1:
+        token = text[begin:]
+        tokens.append(token)
+
+    return tokens
+
+def synthetictext(filename, sentences):
+    """Writes running text with the specified number of sentences, with numbers, quotes, URLs, e-mail addresses and clusters of punctuation"""
+    random.seed(1)
+    words = [ "".join( random.choice(string.ascii_lowercase) for _ in range(random.randint(1,10)) ) for _ in range(0,5000) ]
+    special = ["300,000.00", "3.5", "baby'tje", "don't", "http://www.example.com/some/page?x=1", "www.example.org", "someone@example.com", "\"", "(", ")", ",", ":", "...", "--", "€", "café"]
+    with io.open(filename,'w',encoding='utf-8') as f:
+        for i in range(0, sentences):
+            sentence = [ random.choice(special) if random.random() < 0.1 else random.choice(words) for _ in range(random.randint(3,30)) ]
+            f.write(" ".join(sentence).capitalize() + random.choice(".!?") + ("\n\n" if i % 5 == 4 else " "))
+
+def fuzztext(length):
+    """Returns random text from an alphabet that exercises all cases of the tokeniser"""
+    alphabet = list("ab1.,'`-!\"( \t\n\r@") + ["é", "²", "٣", "Ⅻ", "_", "http://", "www.", "x@y.nl", ".nl"]
+    return "".join( random.choice(alphabet) for _ in range(0, length) )
+
+def equivalence(filename):
+    """Checks that the tokeniser produces the same output as the legacy one, on the text and on random text"""
+    with io.open(filename,'r',encoding='utf-8') as f:
+        text = f.read()
+    assert tokenize(text) == legacytokenize(text)
+    random.seed(2)
+    for i in range(0, 100000):
+        text = fuzztext(random.randint(0,40))
+        assert tokenize(text) == legacytokenize(text), text
+    text = "see... http://www.example.com/" + "x" * 400 + " ... http://" + "y" * 700 + "!!"
+    assert tokenize(text) == legacytokenize(text)
+    for i in range(0, 10000):
+        text = fuzztext(random.randint(0,40))
+        assert tokenize(text, ()) == legacytokenize(text, ()), text
+    rules = (re.compile(r"^[A-Z]{2,}"), re.compile(r"^\d+(?:\.\d+)+", re.UNICODE))
+    for i in range(0, 10000):
+        text = fuzztext(random.randint(0,40)) + " AB 1.2.3 " + fuzztext(random.randint(0,40))
+        assert tokenize(text, rules) == legacytokenize(text, rules), text
+    rules = (re.compile(r"(?i)^ab"), re.compile(r"^(\d+)-\1"), re.compile(r"^x|^y\w*")) #not part of the scanner, tried one by one
+    for i in range(0, 10000):
+        text = fuzztext(random.randint(0,40)) + " Ab 12-12 yes " + fuzztext(random.randint(0,40))
+        assert tokenize(text, rules) == legacytokenize(text, rules), text
+    print("equivalence -- same output as the legacy tokeniser on " + filename + " and on random text")
+
+def tokenrate(filename):
+    """Measures how many tokens per second are produced, per paragraph, by the tokeniser and the legacy one"""
+    with io.open(filename,'r',encoding='utf-8') as f:
+        paragraphs = f.read().split("\n")
+    for label, f in (('tokenize', tokenize), ('legacy', legacytokenize)):
+        tokens = 0
+        start = time.time()
+        for paragraph in paragraphs:
+            tokens += len(f(paragraph))
+        duration = time.time() - start
+        print("tokenrate -- " + label + " -- " + str(len(paragraphs)) + " paragraphs, " + str(tokens) + " tokens, took " + str(round(duration,2)) + "s, " + str(int(tokens / duration)) + " tokens/s")
+
+def streamrate(filename):
+    """Measures how many tokens per second a Tokenizer produces on the file, in the calling process and in parallel"""
+    workers = multiprocessing.cpu_count()
+    for label, kwargs in (('serial', {}), (str(workers) + ' workers', {'workers': workers}), (str(workers * 2) + ' workers', {'workers': workers * 2})):
+        tokens = 0
+        start = time.time()
+        with io.open(filename,'r',encoding='utf-8') as f:
+            for sentence in Tokenizer(f, **kwargs):
+                tokens += len(sentence)
+        duration = time.time() - start
+        print("streamrate -- " + label + " -- " + str(tokens) + " tokens, took " + str(round(duration,2)) + "s, " + str(int(tokens / duration)) + " tokens/s")
+
+BENCHMARKS = ('equivalence','tokenrate','streamrate')
+
+def main():
+    try:
+        args = sys.argv[1:]
+        if args[0] in ('all',) + BENCHMARKS or ',' in args[0]:
+            selectedtests = args.pop(0).split(',')
+        else:
+            selectedtests = ['all']
+        arg = args[0]
+    except:
+        print("Syntax: textprocessors_benchmark [testfunctions] textfile",file=sys.stderr)
+        print(" testfunctions is a comma separated list of: " + ", ".join(BENCHMARKS) + ", or the special keyword 'all'", file=sys.stderr)
+        print(" synthetic:SENTENCES generates (once) and uses synthetic text of SENTENCES sentences, e.g. synthetic:100000", file=sys.stderr)
+        sys.exit(2)
+
+    if arg.startswith('synthetic:'):
+        sentences = int(arg[10:])
+        filename = os.path.join(tempfile.gettempdir(), 'textprocessors_benchmark.synthetic.' + str(sentences) + '.txt')
+        if not os.path.exists(filename):
+            synthetictext(filename, sentences)
+    else:
+        filename = arg
+
+    for f in BENCHMARKS:
+        if f in selectedtests or 'all' in selectedtests:
+            globals()[f](filename)
+
+if __name__ == '__main__':
+    main()
@@ -19,7 +19,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
 from __future__ import absolute_import
-from pynlpl.common import isstring
+from pynlpl.common import isstring, parallelmap
 import sys
 if sys.version < '3':
     from codecs import getwriter
@@ -44,6 +44,7 @@ EOSMARKERS = ('.','?','!','。',';','؟','｡','？','！','।','։','՞','።
 REGEXP_URL = re.compile(r"^(?:(?:https?):(?:(?://)|(?:\\\\))|www\.)(?:[\w\d:#@%/;$()~_?\+-=\\\.&](?:#!)?)*")
 REGEXP_MAIL = re.compile(r"^[A-Za-z0-9\.\+_-]+@[A-Za-z0-9\._-]+(?:\.[a-zA-Z]+)+") #email
 TOKENIZERRULES = (REGEXP_URL, REGEXP_MAIL)
+MAXRULELENGTH = 300 #tokeniser rules see at most this many characters
 
 
 class Windower(object):
@@ -269,7 +270,7 @@ class Tokenizer(object):
     a lists of tokens (in case the sentence splitter is active (default)), or a token (if the sentence splitter is deactivated).
     """
 
-    def __init__(self, stream, splitsentences=True, onesentenceperline=False, regexps=TOKENIZERRULES):
+    def __init__(self, stream, splitsentences=True, onesentenceperline=False, regexps=TOKENIZERRULES, workers=None, blocksize=1024*1024):
         """
         Constructor for Tokenizer
 
@@ -281,37 +282,78 @@ class Tokenizer(object):
         :type onesentenceperline: bool
         :param regexps: Regular expressions to use as tokeniser rules in tokenisation (default=_pynlpl.textprocessors.TOKENIZERRULES_)
         :type regexps:  Tuple/list of regular expressions to use in tokenisation
+        :param workers: Number of processes to tokenise in. The input is read in blocks of about ``blocksize`` characters, ending at a paragraph boundary (or a line boundary, with ``onesentenceperline``), which are tokenised in parallel; the results are yielded in input order, with at most two blocks per worker in flight (default=_None_, tokenise in the calling process)
+        :type workers: int or None
+        :param blocksize: Size of the blocks, in characters, when tokenising in parallel (default=1MB)
+        :type blocksize: int
         """
 
         self.stream = stream
         self.regexps = regexps
         self.splitsentences=splitsentences
         self.onesentenceperline = onesentenceperline
+        self.workers = workers
+        self.blocksize = blocksize
 
     def __iter__(self):
-        buffer = ""
+        if not self.workers:
+            for result in tokenizelines(self.stream, self.splitsentences, self.onesentenceperline, self.regexps):
+                yield result
+            return
+
+        for results in parallelmap(tokenizerworker, self.blocks(), self.workers, inittokenizerworker, ((self.splitsentences, self.onesentenceperline, self.regexps),), maxpending=2 * self.workers):
+            for result in results:
+                yield result
+
+    def blocks(self):
+        """Reads the input in blocks (lists of lines) of about ``blocksize`` characters, that end with an empty line (or at any line with ``onesentenceperline``), so they can be tokenised independently"""
+        block = []
+        size = 0
         for line in self.stream:
-            line = line.strip()
-            if line:
-                if buffer: buffer += "\n"
-                buffer += line
-
-            if (self.onesentenceperline or not line) and buffer:
-                if self.splitsentences:
-                    yield split_sentences(tokenize(buffer))
-                else:
-                    for token in tokenize(buffer, self.regexps):
-                        yield token
-                buffer = ""
-
-        if buffer:
-            if self.splitsentences:
-                yield split_sentences(tokenize(buffer))
+            block.append(line)
+            size += len(line)
+            if size >= self.blocksize and (self.onesentenceperline or not line.strip()):
+                yield block
+                block = []
+                size = 0
+        if block:
+            yield block
+
+
+def tokenizelines(lines, splitsentences=True, onesentenceperline=False, regexps=TOKENIZERRULES):
+    """Tokenises lines of text paragraph by paragraph (or line by line), yields sentences (lists of tokens) or tokens, see :class:`Tokenizer`"""
+    buffer = ""
+    for line in lines:
+        line = line.strip()
+        if line:
+            if buffer: buffer += "\n"
+            buffer += line
+
+        if (onesentenceperline or not line) and buffer:
+            if splitsentences:
+                for sentence in split_sentences(tokenize(buffer, regexps)):
+                    yield sentence
             else:
-                for token in tokenize(buffer, self.regexps):
+                for token in tokenize(buffer, regexps):
                     yield token
+            buffer = ""
+
+    if buffer:
+        if splitsentences:
+            for sentence in split_sentences(tokenize(buffer, regexps)):
+                yield sentence
+        else:
+            for token in tokenize(buffer, regexps):
+                yield token
 
+TOKENIZERWORKER = {}
 
+def inittokenizerworker(options):
+    TOKENIZERWORKER['options'] = options
+
+def tokenizerworker(block):
+    """Tokenises a block of lines, returns a list of the results"""
+    return list(tokenizelines(block, *TOKENIZERWORKER['options']))
 
 
 def tokenize(text, regexps=TOKENIZERRULES):
@@ -333,58 +375,147 @@ def tokenize(text, regexps=TOKENIZERRULES):
     test
     .
 
+    The rules are tried at the start of each token, in order, and a match (of at most 300 characters) is taken as a token as a whole. Otherwise, tokens are split at whitespace and punctuation, except for a period or comma between digits, a quote between letters, and clusters of identical punctuation. All of this is compiled into a single regular expression (see :func:`tokenizerscanner`), which scans the text in one pass.
 
+    Rules that can not be part of a larger expression (see :func:`scannablerule`) are instead tried one by one, on the next 300 characters of the text, as before; for a rule with one group, the token is what that group matches.
     """
 
-    for i,regexp in list(enumerate(regexps)):
-        if isstring(regexp):
-            regexps[i] = re.compile(regexp)
-
+    scanner = tokenizerscanner(regexps)
+    rule, token, separator = [ scanner.groupindex[group] - 1 if group in scanner.groupindex else None for group in ('rule', 'token', 'separator') ]
+    if rule is None and regexps:
+        return tokenizeperrule(text, regexps)
     tokens = []
     begin = 0
-    for i, c in enumerate(text):
-        if begin > i:
-            continue
-        elif i == begin:
-            m = False
-            for regexp in regexps:
-                m = regexp.findall(text[i:i+300])
-                if m:
-                    tokens.append(m[0])
-                    begin = i + len(m[0])
+    while True:
+        for match in scanner.finditer(text, begin):
+            groups = match.groups()
+            if rule is not None and groups[rule]:
+                if len(groups[rule]) > MAXRULELENGTH:
+                    #rules only see the next 300 characters, find out what they match there and continue after that
+                    begin = match.start()
+                    ruletoken = rulematch(text, begin, regexps)
+                    if ruletoken:
+                        tokens.append(ruletoken)
+                        begin += len(ruletoken)
+                    else:
+                        #no rule matches within those 300 characters, take the next token and separator as usual
+                        begin = scanplain(text, begin, tokens)
                     break
-            if m: continue
-
-        if c in string.punctuation or c in WHITESPACE:
-            prev = text[i-1] if i > 0 else ""
-            next = text[i+1] if i < len(text)-1 else ""
-
-            if (c == '.' or c == ',') and prev.isdigit() and next.isdigit():
-                #punctuation in between numbers, keep as one token
-                pass
-            elif (c == "'" or c == "`") and prev.isalpha() and next.isalpha():
-                #quote in between chars, keep...
-                pass
-            elif c not in WHITESPACE and next == c: #group clusters of identical punctuation together
-                continue
-            elif c == '\r' and prev == '\n':
-                #ignore
-                begin = i+1
-                continue
+                tokens.append(groups[rule])
             else:
-                token = text[begin:i]
-                if token: tokens.append(token)
-
-                if c not in WHITESPACE:
-                    tokens.append(c) #anything but spaces and newlines (i.e. punctuation) counts as a token too
-                begin = i + 1 #set the begin cursor
-
-    if begin <= len(text) - 1:
-        token = text[begin:]
-        tokens.append(token)
-
+                if groups[token]:
+                    tokens.append(groups[token])
+                if groups[separator] and groups[separator] not in WHITESPACE:
+                    tokens.append(groups[separator]) #anything but spaces and newlines (i.e. punctuation) counts as a token too
+        else:
+            return tokens
+
+def scanplain(text, begin, tokens):
+    """Takes the token and separator at the begin position (without trying the tokeniser rules), appends them to tokens and returns the position after them"""
+    match = tokenizerscanner(()).match(text, begin)
+    if match.group('token'):
+        tokens.append(match.group('token'))
+    if match.group('separator') and match.group('separator') not in WHITESPACE:
+        tokens.append(match.group('separator'))
+    return match.end()
+
+def tokenizeperrule(text, regexps):
+    """Tokenises a string with rules that are not part of the scanner: the rules are tried at the start of each token, otherwise the next token and separator are taken as usual (see :func:`scanplain`)"""
+    rules = [ re.compile(regexp) if isstring(regexp) else regexp for regexp in regexps ]
+    tokens = []
+    begin = 0
+    while begin < len(text):
+        window = text[begin:begin+MAXRULELENGTH]
+        for regexp in rules:
+            match = regexp.match(window)
+            if match:
+                ruletoken = match.group(1) if regexp.groups == 1 else match.group(0) #as findall() sees it
+                if ruletoken:
+                    tokens.append(ruletoken)
+                    begin += len(ruletoken)
+                    break
+        else:
+            begin = scanplain(text, begin, tokens)
     return tokens
 
+def scannablerule(regexp):
+    """Checks whether a (compiled) tokeniser rule can be part of the scanner: it has no groups (so no backreferences or group names that could clash), no inline flags or lookbehinds, and no anchors other than a leading ^, which would all mean something else in a larger expression than at the start of a slice of the text"""
+    pattern = regexp.pattern
+    if not isstring(pattern) or regexp.groups > 0:
+        return False
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    if re.search(r"\\[AZbBG]", pattern):
+        return False
+    pattern = re.sub(r"\\.", "", pattern) #escapes
+    pattern = re.sub(r"\[\^?\]?[^\]]*\]", "", pattern) #character classes
+    return not re.search(r"\(\?[aiLmsux-]|\(\?<[=!]|[\^$]", pattern)
+
+def rulematch(text, begin, regexps):
+    """Returns the match of the first tokeniser rule that matches (a non-empty string) at the begin position, seeing only the next 300 characters, or None if there is none"""
+    for regexp in compiledrules(regexps):
+        match = regexp.match(text, begin, begin + MAXRULELENGTH)
+        if match and match.group(0):
+            return match.group(0)
+
+def compiledrules(regexps):
+    """Compiles the tokeniser rules (strings or compiled regular expressions) so that they match at a given position, without a leading ^"""
+    rules = []
+    for regexp in regexps:
+        if isstring(regexp):
+            regexp = re.compile(regexp)
+        if regexp.pattern.startswith('^'):
+            regexp = re.compile(regexp.pattern[1:], regexp.flags)
+        rules.append(regexp)
+    return rules
+
+def charclass(predicate):
+    """Returns a regular expression character class with all characters for which the predicate holds"""
+    ranges = []
+    begin = None
+    for c in range(0, sys.maxunicode + 2):
+        if c <= sys.maxunicode and predicate(chr(c) if sys.version >= '3' else unichr(c)):
+            if begin is None: begin = c
+        elif begin is not None:
+            ranges.append( (begin, c - 1) )
+            begin = None
+    if sys.maxunicode > 0xffff:
+        return "[" + "".join( "\\U%08x-\\U%08x" % r for r in ranges ) + "]"
+    else: #narrow build
+        return "[" + "".join( "\\u%04x-\\u%04x" % r for r in ranges ) + "]"
+
+TOKENIZERSCANNERS = {} #rules => compiled scanner
+CHARCLASSES = {} #digits and letters, as str.isdigit() and str.isalpha() see them
+
+def tokenizerscanner(regexps=TOKENIZERRULES):
+    """Compiles the tokeniser rules and the splitting at whitespace and punctuation (see :func:`tokenize`) into a single regular expression, that matches a rule (group ``rule``), or a token (group ``token``, possibly empty) up to and including the whitespace or punctuation character that ends it (group ``separator``, or none at the end of the text). The scanner is compiled once for each set of rules."""
+    key = tuple( regexp if isstring(regexp) else (regexp.pattern, regexp.flags) for regexp in regexps )
+    if key in TOKENIZERSCANNERS:
+        return TOKENIZERSCANNERS[key]
+    if not CHARCLASSES:
+        CHARCLASSES['digit'] = charclass(lambda c: c.isdigit())
+        CHARCLASSES['alpha'] = charclass(lambda c: c.isalpha())
+    rules = []
+    compiled = compiledrules(regexps)
+    if not all( scannablerule(regexp) for regexp in compiled ):
+        compiled = [] #the rules are tried one by one, see tokenizeperrule()
+    for regexp in compiled:
+        flags = "".join( flag for flag, value in (('i', re.IGNORECASE), ('m', re.MULTILINE), ('s', re.DOTALL), ('x', re.VERBOSE)) if regexp.flags & value )
+        rules.append( "(?" + flags + ":" + regexp.pattern + ")" if flags else "(?:" + regexp.pattern + ")" )
+    separators = "".join( re.escape(c) for c in WHITESPACE + list(string.punctuation) )
+    punctuation = "".join( re.escape(c) for c in string.punctuation )
+    nonseparators = "[^" + separators + "]*"
+    exceptions = "|".join([
+        "[.,](?<=" + CHARCLASSES['digit'] + "[.,])(?=" + CHARCLASSES['digit'] + ")", #punctuation in between numbers, keep as one token
+        "['`](?<=" + CHARCLASSES['alpha'] + "['`])(?=" + CHARCLASSES['alpha'] + ")", #quote in between chars, keep...
+        "(?P<cluster>[" + punctuation + "])(?=(?P=cluster))", #group clusters of identical punctuation together
+    ])
+    scanner = "(?P<token>" + nonseparators + "(?:(?:" + exceptions + ")" + nonseparators + ")*)(?:(?P<separator>[" + separators + "])|\\Z)"
+    if rules:
+        scanner = "(?P<rule>" + "|".join(rules) + ")|" + scanner
+    TOKENIZERSCANNERS[key] = re.compile(scanner)
+    return TOKENIZERSCANNERS[key]
+
 
 def crude_tokenizer(text):
     """Replaced by tokenize(). Alias"""
@@ -392,7 +523,7 @@ def crude_tokenizer(text):
 
 def tokenise(text, regexps=TOKENIZERRULES): #for the British
     """Alias for the British"""
-    return tokenize(text)
+    return tokenize(text, regexps)
 
 def is_end_of_sentence(tokens,i ):
     # is this an end-of-sentence marker? ... and is this either